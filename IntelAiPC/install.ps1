@@ -6,7 +6,7 @@ python.exe -m pip install --upgrade pip
 Write-Output "Installing required packages..."
 pip install openvino-genai
 pip install --extra-index-url https://download.pytorch.org/whl/cpu `
-    "git+https://github.com/huggingface/optimum-intel.git" `
+    "optimum-intel[openvino]>=1.20,<1.23" `
     "git+https://github.com/openvinotoolkit/nncf.git" `
     "onnx<=1.16.1"
 
@@ -32,54 +32,121 @@
 #
 #   $ python run.py INPUT 
 #   $ python run.py SERVER 
+#   $ python run.py INPUT --profile-imports
+#   $ python run.py BENCH --tiny
+#   $ python run.py BENCH --suite streamer
+#   $ python run.py BENCH --suite workers
+#   $ python run.py BENCH --suite history
+#   $ python run.py BENCH --tiny --suite concurrency
+#   $ python run.py TUNE
+#   $ python run.py EXPORT
+#   $ python run.py BATCH prompts.jsonl responses.jsonl
+#   $ python run.py HISTORY
+#   $ python run.py INPUT --conversation last
 #
 ############################################################################################
  
+import os
 import sys
+import json
+import time
+import argparse
+import subprocess
 
 from uuid import uuid4
+from datetime import datetime
 
-from threading import Event, Thread
-
-import torch
-import openvino_genai
-
-from transformers import (
-    StoppingCriteriaList,
-    StoppingCriteria,
-    TextIteratorStreamer,
-)
+from threading import Event, Lock, Thread
 
+from tools.batch import BatchRunner
+from tools.benchmark import Benchmark
+from tools.compaction import Compactor
+from tools.context import ContextBuilder
+from tools.exporter import Exporter
+from tools.generation import CancelToken, GenerationWorker
 from tools.helpers import Helpers
-from tools.model import Model
 from tools.history import History
-
-class StopOnTokens(StoppingCriteria):
-    def __init__(self, token_ids):
-        self.token_ids = token_ids
-
-    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> bool:
-        for stop_id in self.token_ids:
-            if input_ids[0][-1] == stop_id:
-                return True
-        return False
+from tools.logsink import get_sink
+from tools.metrics import Metrics
+from tools.registry import ModelRegistry
+from tools.reload import (
+    MODEL_KEYS, RESTART_KEYS, ConfigWatcher, RuntimeState, changed_keys, matches, render_definition,
+    validate_confs, validate_definition
+)
+from tools.responsecache import ResponseCache
+from tools.server import Server
+from tools.store import open_store
+from tools.streamer import TokenStreamer
+from tools.tuner import Tuner
+from tools.workers import WorkerPool
 
 class LLMCore:
     """
     LLMCore Class:
     Responsible for managing model loading, tokenizer setup, and logging for the GeniSysAI LLM system.
     """
-    def __init__(self):
+    def __init__(self, confs=None, derive=None):
         """
         Initializes the LLMCore by setting up configurations, logging, and preparing the model components.
+
+        Args:
+            confs (dict, optional): Configuration to use instead of configuration/confs.json.
+            derive (callable, optional): Turns the configuration re-read on reload into the
+                one this core runs with, for a core given a configuration derived from
+                configuration/confs.json. Defaults to running with it as read.
         """
         self.Helpers = Helpers()
-        self._confs = self.Helpers.load_configs()
+        self._confs = confs or self.Helpers.load_configs()
+        self._derive = derive
         self.user = {}
+        self.generation_lock = Lock()  # The model runs one generation at a time
+        self.state = None  # The RuntimeState queries run with, replaced whole on reload
+        self._reload_lock = Lock()
+        self.last_activity = time.monotonic()  # When a query last started or finished
+        self.ready = Event()  # Set once the model has loaded, or failed to load
+        self.load_error = None
         
         self.prepare_history()
         self.prepare_logs()
-        self.prepare_model()
+        self.prepare_metrics()
+        self.prepare_response_cache()
+        self.prepare_registry()
+        self.prepare_generation()
+        self.Compactor = Compactor(self, self._confs) if self._confs["compaction"]["enabled"] else None
+        if self.Compactor is not None:
+            self.Metrics.gauge("compaction_queue_depth", lambda: len(self.Compactor.pending))
+
+        # Load the model in the background so prompts can be accepted while it compiles
+        Thread(target=self.load, daemon=True).start()
+
+    def load(self):
+        """
+        Loads the model and signals readiness, recording any error for wait_until_ready.
+        """
+        try:
+            self.prepare_model()
+        except Exception as e:
+            self.load_error = e
+            self.Helpers.log_message(
+                self.LogFile, "Model", "ERROR", f"Could not prepare the model: {str(e)}"
+            )
+        finally:
+            self.ready.set()
+
+    def wait_until_ready(self, timeout=None):
+        """
+        Blocks until the model has finished loading.
+
+        Args:
+            timeout (float, optional): The maximum number of seconds to wait. Defaults to no limit.
+
+        Raises:
+            RuntimeError: If the model failed to load or did not load within the timeout.
+        """
+        if not self.ready.wait(timeout):
+            raise RuntimeError("Timed out waiting for the model to load")
+        if self.load_error is not None:
+            raise RuntimeError(f"The model failed to load: {self.load_error}") from self.load_error
 
     def prepare_history(self):
         """
@@ -87,7 +154,12 @@ class LLMCore:
         
         Creates log files in the paths specified in the configuration.
         """
-        self.History = History()
+        self.History = History(
+            self._confs["history"]["max_messages"],
+            self._confs["history"]["max_bytes"],
+            f"{self._confs['llm']['logs_path']}chat/",
+            open_store(self._confs)
+        )
         self.conversation_id = self.History.generate_conversation_id()
 
     def prepare_logs(self):
@@ -96,201 +168,763 @@ class LLMCore:
         
         Creates log files in the paths specified in the configuration.
         """
-        self.LogFile = self.Helpers.set_log_file(f"{self._confs['llm']['logs_path']}llm/")
-        self.ChatLogFile = self.Helpers.set_log_file(f"{self._confs['llm']['logs_path']}chat/")
+        self.LogSink = get_sink(**self._confs["logging"])
+        self.LogFile = self.Helpers.set_log_dir(f"{self._confs['llm']['logs_path']}llm/")
+        self.ChatLogFile = self.Helpers.set_log_dir(f"{self._confs['llm']['logs_path']}chat/")
+
+    def prepare_metrics(self):
+        """
+        Sets up request tracing and metrics, and registers the core's gauges.
+        """
+        metrics_confs = self._confs["metrics"]
+        self.Metrics = Metrics(
+            metrics_confs["enabled"],
+            metrics_confs["buckets"],
+            f"{self._confs['llm']['logs_path']}traces/" if metrics_confs["trace_log"] else None
+        )
+        self.Metrics.gauge("generation_active", lambda: int(self.generation_lock.locked()))
+        self.Metrics.gauge("log_queue_depth", lambda: self.LogSink.queued)
+
+    def prepare_registry(self):
+        """
+        Discovers the other models that requests can be routed to.
+
+        The model configured in "llm" is the default model, loaded at startup. Every other
+        model definition is loaded on first use.
+        """
+        self.default_model = os.path.splitext(os.path.basename(self._confs["llm"]["model_definition_json"]))[0]
+        self.Registry = ModelRegistry(
+            self._confs, self.default_model,
+            lambda level, message: self.Helpers.log_message(self.LogFile, "Registry", level, message)
+        )
+        self.Metrics.gauge(
+            "models_loaded", lambda: 1 + sum(slot.loaded for slot in self.Registry.slots.values())
+        )
+
+    def prepare_generation(self):
+        """
+        Starts the generation worker that runs every query's generation.
+
+        Each model gets its own queue and thread, so models do not wait for each other.
+        Models on the continuous engine get a thread per sequence the scheduler can run
+        at once.
+        """
+        self.GenerationWorker = GenerationWorker(self.Metrics, self._confs["continuous"]["max_num_seqs"])
+        self.Metrics.gauge("generation_queue_depth", lambda: self.GenerationWorker.queue_depth)
+
+    def has_model(self, name):
+        """
+        Returns whether requests can be routed to a model.
+
+        Args:
+            name (str): The model name, the file name of its definition without ".json".
+
+        Returns:
+            bool: True for the default model and every registered model.
+        """
+        return name == self.default_model or name in self.Registry
+
+    def prepare_response_cache(self):
+        """
+        Sets up the response cache, if enabled, loading the responses cached by earlier runs.
+        """
+        self.ResponseCache = None
+        cache_confs = self._confs["response_cache"]
+        if cache_confs["enabled"]:
+            self.ResponseCache = ResponseCache(
+                cache_confs["path"],
+                cache_confs["ttl"],
+                cache_confs["max_entries"],
+                cache_confs["max_bytes"],
+                cache_confs["allow_sampled"]
+            )
+
+    @property
+    def Model(self):
+        """
+        Model: The default model of the current runtime state.
+        """
+        return self.state.Model
+
+    @property
+    def ContextBuilder(self):
+        """
+        ContextBuilder: The context builder of the current runtime state.
+        """
+        return self.state.ContextBuilder
+
+    @property
+    def stop_token_ids(self):
+        """
+        list: The stop token IDs of the current runtime state.
+        """
+        return self.state.stop_token_ids
+
+    @property
+    def stop_matcher(self):
+        """
+        StopMatcher: The compiled stop conditions of the current runtime state.
+        """
+        return self.state.stop_matcher
+
+    @property
+    def system_prompt(self):
+        """
+        list: The system prompt of the current runtime state.
+        """
+        return self.state.system_prompt
+
+    @property
+    def system_ids(self):
+        """
+        torch.Tensor: The system prompt token IDs of the current runtime state.
+        """
+        return self.state.system_ids
 
     def prepare_model(self):
+        """
+        Loads the default model and builds the runtime state queries run with.
+
+        Once ready, the configuration and definition files are watched for changes.
+        """
+        _, startup = self.Helpers.timer_start()
+        self.startup_timings = {}
+
+        model = self.build_model(self._confs)
+        self.state = self.build_state(self._confs, model, model.model_definition)
+
+        _, elapsed, _ = self.Helpers.timer_end(startup)
+        self.Helpers.log_message(
+            self.LogFile, "Startup", "INFO",
+            f"Ready after {elapsed:.3f}s "
+            f"({', '.join(f'{name} {took:.3f}s' for name, took in self.startup_timings.items())})"
+        )
+
+        self.prepare_reload()
+
+    def build_model(self, confs):
         """
         Prepares and initializes the model, tokenizer, and related configurations.
 
         This function performs the following:
-        1. Configures OpenVINO generation settings.
-        2. Initializes the model object and loads the model definition.
-        3. Loads the model configuration, tokenizer, and the model itself.
-        4. Logs the success or failure of each step.
+        1. Initializes the model object and loads the model definition.
+        2. Loads the model configuration, tokenizer, and the model itself on the configured engine.
+        3. Logs the success or failure of each step.
 
-        Raises:
-            Logs any issues encountered during the initialization process.
+        Args:
+            confs (dict): The configuration to build the model from.
+
+        Returns:
+            Model: The loaded model.
         """
-        # Configure OpenVINO generation settings
-        self.ovconfig = openvino_genai.GenerationConfig()
-        self.ovconfig.max_new_tokens = self._confs['llm']['max_tokens']
+        # Heavy dependencies are imported here rather than at startup
+        _, start = self.Helpers.timer_start()
+        from tools.model import Model
+        self.log_startup_phase("imports", start)
 
         # Initialize and load the model and tokenizer
-        self.Model = Model(self._confs)
+        model = Model(confs)
 
-        self.Model.load_model_definition()
+        model.load_model_definition()
         self.Helpers.log_message(
             self.LogFile, "Model", "INFO", "Updated agent definition XML loaded for runtime"
         )
         
-        self.Model.load_config()
-        self.Model.load_tokenizer()
+        _, start = self.Helpers.timer_start()
+        model.load_config()
+        self.log_startup_phase("config", start)
+
+        # Load the tokenizer while the model is read and compiled
+        def load_tokenizer():
+            _, start = self.Helpers.timer_start()
+            model.load_tokenizer()
+            self.log_startup_phase("tokenizer", start)
+
+        tokenizer_thread = Thread(target=load_tokenizer, daemon=True)
+        tokenizer_thread.start()
+
+        _, start = self.Helpers.timer_start()
+        model.load_model()
+        self.log_startup_phase("model read", start)
+
+        _, start = self.Helpers.timer_start()
+        model.compile_model()
+        self.log_startup_phase("compile", start)
+
+        tokenizer_thread.join()
+
+        for warning in model.warnings:
+            self.Helpers.log_message(self.LogFile, "Model", "WARNING", warning)
+
+        if model.profile:
+            self.Helpers.log_message(
+                self.LogFile, "Model", "INFO", f"Applied the OpenVINO settings tuned for this host: {model.profile}"
+            )
         
-        if self.Model.llm_tokenizer is not None:
+        if model.llm_tokenizer is not None:
             self.Helpers.log_message(
-                self.LogFile, "Model", "INFO", f"{self._confs['llm']['model']} tokenizer loaded successfully."
+                self.LogFile, "Model", "INFO", f"{confs['llm']['model']} tokenizer loaded successfully."
             )
         else:
             self.Helpers.log_message(
-                self.LogFile, "Model", "ERROR", f"Could not load {self._confs['llm']['model']} tokenizer"
+                self.LogFile, "Model", "ERROR", f"Could not load {confs['llm']['model']} tokenizer"
             )
 
-        self.Model.load_model()
-        if self.Model.llm is not None:
+        if model.llm is not None:
             self.Helpers.log_message(
-                self.LogFile, "Model", "INFO", f"{self._confs['llm']['model']} loaded successfully."
+                self.LogFile, "Model", "INFO",
+                f"{confs['llm']['model']} loaded successfully on the {model.engine.name} engine."
             )
         else:
             self.Helpers.log_message(
-                self.LogFile, "Model", "ERROR", f"Could not load {self._confs['llm']['model']}"
+                self.LogFile, "Model", "ERROR", f"Could not load {confs['llm']['model']}"
             )
-            
-    def query(self, prompt):
+
+        warmup = confs["warmup"]
+        if warmup["enabled"] and model.llm is not None and model.llm_tokenizer is not None:
+            _, start = self.Helpers.timer_start()
+            model.warm_up(warmup["prompt"], warmup["max_new_tokens"])
+            self.log_startup_phase("warm-up", start)
+
+        scheduler = getattr(model.engine, "scheduler", None)
+        if scheduler is not None:
+            self.Metrics.gauge("generation_active", lambda: len(scheduler.active))
+            self.Metrics.gauge("generation_pending", lambda: scheduler.pending.qsize())
+
+        return model
+
+    def log_startup_phase(self, phase, start_time):
         """
-        Generate chatbot responses using the current conversation context.
+        Records and logs how long a startup phase took.
+
+        Args:
+            phase (str): The name of the startup phase.
+            start_time (float): The phase start time in seconds.
         """
-        # Add messages to history
-        self.History.add_message(self.conversation_id, "system", self._confs["llm"]["system"])
-        self.History.add_message(self.conversation_id, "user", prompt)
+        _, elapsed, _ = self.Helpers.timer_end(start_time)
+        self.startup_timings[phase] = elapsed
+        self.Helpers.log_message(
+            self.LogFile, "Startup", "INFO", f"{phase} took {elapsed:.3f}s", True
+        )
 
-        # Get history and convert to tokens
-        history = self.History.get_history(self.conversation_id)
+    def build_state(self, confs, model, definition):
+        """
+        Builds the runtime state for a configuration and a loaded model.
 
-        # Define maximum token limit for the input
-        MAX_TOKENS = self._confs["llm"]["max_tokens"]  # Adjust based on model
+        Renders the assistant definition, compiles the stop conditions of the model
+        definition, and renders and tokenizes the system prompt and computes its shared
+        attention prefix. The system prompt is only prepared again when its text or the
+        model changes.
 
-        # Keep the system prompt separate
-        system_prompt = [{"role": "system", "content": self._confs["llm"]["system"]}]
+        Args:
+            confs (dict): The configuration.
+            model (Model): The loaded default model.
+            definition (dict): The model definition.
 
-        # Ensure the latest user/assistant message is always included
-        sliding_window = [history[-1]]  # Always include the latest message
+        Returns:
+            RuntimeState: The new state.
 
-        # Add older messages while respecting the token limit
-        for message in reversed(history[:-1]):
-            temp_window = [message] + sliding_window
-            temp_input_ids = self.Model.convert_history_to_token(system_prompt + temp_window)
-            
-            if temp_input_ids.shape[1] > MAX_TOKENS:
-                break  # Stop when token limit is reached
-            
-            sliding_window = [message] + sliding_window
+        Raises:
+            ValueError: If a stop token is not in the model's vocabulary.
+        """
+        previous = self.state
+        definition_xml = render_definition(confs)
+        stop_token_ids = model.get_stop_token_ids(definition)
+        if any(token_id is None for token_id in stop_token_ids):
+            raise ValueError("A stop token is not in the tokenizer's vocabulary")
+        stop_matcher = model.get_stop_matcher(stop_token_ids, definition)
+
+        system_prompt = [{"role": "system", "content": confs["llm"]["system"]}]
+        if previous is not None and previous.Model is model and previous.system_prompt == system_prompt:
+            context_builder, system_ids = previous.ContextBuilder, previous.system_ids
+        else:
+            _, start = self.Helpers.timer_start()
+            context_builder = (
+                previous.ContextBuilder if previous is not None and previous.Model is model else ContextBuilder(model)
+            )
+            system_ids = model.convert_history_to_token(system_prompt, add_generation_prompt=False)
+            context_builder.count_base_tokens(system_prompt)
+            if model.engine is not None:
+                with self.generation_lock:
+                    model.engine.set_prefix((model.model_path, model.llm_device, confs["llm"]["system"]), system_ids)
 
-        # Combine the system prompt with the sliding window
-        full_context = system_prompt + sliding_window
+            _, elapsed, _ = self.Helpers.timer_end(start)
+            self.Helpers.log_message(
+                self.LogFile, "Model", "INFO",
+                f"System prompt prepared ({system_ids.shape[1]} tokens) in {elapsed:.3f}s"
+            )
 
-        # Convert to tokens
-        input_ids = self.Model.convert_history_to_token(full_context)
-        attention_mask = torch.ones_like(input_ids)
-
-        # Setup custom text processor
-        def process_streamed_text(text):
-            """Clean and process streamed text tokens."""
-            # Remove any special tokens that might have leaked through
-            text = text.replace("<|endoftext|>", "").replace("<|pad|>", "")
-            
-            # Remove any incomplete UTF-8 characters at the end
-            try:
-                text.encode('utf-8').decode('utf-8')
-            except UnicodeError:
-                # If there's an error, remove the last character and try again
-                text = text[:-1]
-            
-            return text
-
-        # Setup streamer and skip special tokens
-        streamer = TextIteratorStreamer(
-            self.Model.llm_tokenizer,
-            timeout=60.0,  
-            skip_prompt=True,
-            skip_special_tokens=True
+        return RuntimeState(
+            previous.version + 1 if previous is not None else 1, confs, model, context_builder, definition,
+            stop_token_ids, stop_matcher, system_prompt, system_ids, definition_xml, self.generation_lock
         )
 
-        # Generation arguments
-        generate_kwargs = {
-            "input_ids": input_ids,
-            "attention_mask": attention_mask,  
-            "pad_token_id": 0,  
-            "max_new_tokens": self._confs['llm']['max_tokens'],
-            "streamer": streamer,
-            "do_sample": True,
-            "temperature": 0.1,
-            "top_p": 1.0,
-        }
-
-        # Handle stop tokens
-        stop_tokens = self.Model.model_definition.get("stop_tokens", None)
-        if stop_tokens:
-            if isinstance(stop_tokens[0], str):
-                stop_tokens = self.Model.llm_tokenizer.convert_tokens_to_ids(stop_tokens)
-            stop_tokens = [StopOnTokens(stop_tokens)]
-            generate_kwargs["stopping_criteria"] = StoppingCriteriaList(stop_tokens)
-
-        # Generate in separate thread
-        stream_complete = Event()
-        def generate_and_signal_complete():
+    def prepare_reload(self):
+        """
+        Watches the configuration and definition files, reloading them when they change.
+        """
+        reload_confs = self._confs["reload"]
+        self.Metrics.gauge("config_version", lambda: self.state.version)
+        if reload_confs["enabled"]:
+            self.ConfigWatcher = ConfigWatcher(self.watched_files, self.reload, reload_confs["interval"])
+
+    def watched_files(self):
+        """
+        Returns the files a reload reads.
+
+        Returns:
+            list: The configuration, the default model definition and the assistant definition files.
+        """
+        llm = self._confs["llm"]
+        return [
+            "configuration/confs.json", llm["model_definition_json"], llm["definition_xml"], llm["definition_json"]
+        ]
+
+    def reload(self, changed_files=None):
+        """
+        Re-reads the configuration and definitions and swaps in the state derived from them.
+
+        Everything is read and validated before anything changes, so a bad edit leaves the
+        running state untouched. A core given a derive callable applies it to the
+        configuration read, so its overrides survive the reload. The model is only reloaded
+        when settings it was built from change; it is then loaded alongside the current
+        one, which keeps serving until the swap. The model definition is kept in the new
+        state and never set on a running model. Queries already running finish with the
+        state they started with.
+
+        Args:
+            changed_files (list, optional): The files that changed, for the log.
+
+        Returns:
+            bool: True if the new state was swapped in.
+        """
+        with self._reload_lock:
+            current = self.state.Model
             try:
-                self.Model.llm.generate(**generate_kwargs)
+                confs = self.Helpers.load_configs()
+                if self._derive is not None:
+                    confs = self._derive(confs)
+                validate_confs(self._confs, confs)
+                with open(confs["llm"]["model_definition_json"], "r") as def_file:
+                    definition = json.load(def_file)
+                validate_definition(definition)
+
+                changed = changed_keys(self._confs, confs)
+                model_changes = matches(changed, MODEL_KEYS)
+                model = current
+                if model_changes:
+                    self.Helpers.log_message(
+                        self.LogFile, "Reload", "INFO", f"Reloading the model for {', '.join(model_changes)}"
+                    )
+                    model = self.build_model(confs)
+                    if model.llm is None or model.llm_tokenizer is None:
+                        raise RuntimeError(f"Could not load {confs['llm']['model']}")
+
+                state = self.build_state(confs, model, definition)
             except Exception as e:
+                self.Metrics.inc("reload_errors")
                 self.Helpers.log_message(
-                    self.LogFile, "QUERY", "ERROR", f"Generation error: {str(e)}"
+                    self.LogFile, "Reload", "ERROR",
+                    f"Kept the current configuration, could not reload {', '.join(changed_files or [])}: {str(e)}"
                 )
-            finally:
-                stream_complete.set()
+                return False
 
-        Thread(target=generate_and_signal_complete).start()
+            # Queries that start from here on use the new state
+            self.state = state
+            self._confs = confs
+            self.Registry.reconfigure(confs)
+            if model_changes:
+                self.History.reset_token_counts()
+                self.GenerationWorker.ensure_threads(confs["continuous"]["max_num_seqs"])
 
-        full_response = ""
-        buffer = ""
-        
-        try:
-            # Stream text with buffering
-            for new_text in streamer:
-                # Add new text to buffer
-                buffer += new_text
-                
-                # Process buffer when we have enough text or hit certain characters
-                if len(buffer) >= 10 or any(c in buffer for c in '.!?,\n'):
-                    processed_text = process_streamed_text(buffer)
-                    if processed_text:
-                        full_response += processed_text
-                        yield processed_text
-                    buffer = ""
+        self.Metrics.inc("reloads")
+        self.Helpers.log_message(
+            self.LogFile, "Reload", "INFO",
+            f"Reloaded the configuration (version {state.version}), changed: {', '.join(changed) or 'definitions only'}"
+        )
+        restart = matches(changed, RESTART_KEYS)
+        if restart:
+            self.Helpers.log_message(
+                self.LogFile, "Reload", "WARNING", f"{', '.join(restart)} will take effect after a restart"
+            )
+        return True
             
-            # Process any remaining text in buffer
-            if buffer:
-                processed_text = process_streamed_text(buffer)
-                if processed_text:
-                    full_response += processed_text
-                    yield processed_text
-                    
+    def query(self, prompt, conversation_id=None, model=None, deadline=None, first_token_deadline=None):
+        """
+        Generate chatbot responses using the current conversation context.
+
+        Each call is traced, with a span for every stage of the request. Generation stops
+        within a decode step of the caller closing the generator, and when a deadline
+        passes. Deadlines count from when the model is ready to answer.
+
+        Args:
+            prompt (str): The user prompt.
+            conversation_id (str, optional): The conversation to continue. Defaults to the
+                conversation created at startup.
+            model (str, optional): The model to answer with. Defaults to the default model.
+            deadline (float, optional): The seconds the response may take. Defaults to the
+                "deadlines" configuration.
+            first_token_deadline (float, optional): The seconds the response may wait for its
+                first token. Defaults to the "deadlines" configuration.
+
+        Raises:
+            ValueError: If there is no such model.
+        """
+        model = model or self.default_model
+        if not self.has_model(model):
+            raise ValueError(f"Unknown model '{model}'")
+
+        trace = self.Metrics.trace("query")
+        self.Metrics.inc("queries")
+        try:
+            conversation_id = conversation_id or self.conversation_id
+            deadlines = self._confs["deadlines"]
+            deadlines = (
+                deadline if deadline is not None else deadlines["total"],
+                first_token_deadline if first_token_deadline is not None else deadlines["first_token"],
+            )
+            if model == self.default_model:
+                yield from self.stream_response(prompt, conversation_id, trace, self, deadlines)
+            else:
+                with trace.span("model_load"):
+                    slot = self.Registry.acquire(model)
+                try:
+                    yield from self.stream_response(prompt, conversation_id, trace, slot, deadlines)
+                finally:
+                    self.Registry.release(slot)
+        finally:
+            trace.finish()
+
+    def stream_response(self, prompt, conversation_id, trace, slot, deadlines=(None, None)):
+        """
+        Runs the stages of a query, streaming the response text.
+
+        Args:
+            prompt (str): The user prompt.
+            conversation_id (str): The conversation to continue.
+            trace (Trace): The request trace.
+            slot (ModelSlot): The model to answer with. The core itself serves the default model,
+                with its current RuntimeState.
+            deadlines (tuple, optional): The total and first token deadlines in seconds, or None.
+        """
+        self.last_activity = time.monotonic()
+
+        # Wait for the model if it is still loading
+        self.wait_until_ready()
+        cancel = CancelToken(*deadlines)
+
+        # The default model runs with the state current now, even if a reload swaps it mid-query
+        if slot is self:
+            slot = self.state
+        else:
+            # A reload reconfigures registry models in place, so pick up any change to the system prompt
+            slot.prepare_system_prompt()
+        confs = slot.confs
+
+        # Add messages to history
+        with trace.span("history_append"):
+            self.History.add_message(conversation_id, "user", prompt)
+
+        with trace.span("window_build"):
+            # Get history and convert to tokens
+            history = self.History.get_history(conversation_id)
+
+            # Select the newest messages that fit within the token limit
+            window = slot.ContextBuilder.build(
+                slot.system_prompt, history, confs["llm"]["max_input_tokens"]
+            )
+        if window.dropped_tokens:
+            self.Helpers.log_message(
+                self.LogFile, "Context", "INFO",
+                f"Dropped {window.dropped_messages} messages ({window.dropped_tokens} tokens) from the context window",
+                True
+            )
+
+        # Summarize older turns in the background once the conversation grows long
+        if self.Compactor is not None and self.Compactor.needs_compaction(window.tokens + window.dropped_tokens):
+            self.Compactor.schedule(conversation_id)
+
+        # Convert to tokens
+        with trace.span("tokenize"):
+            input_ids = slot.Model.convert_history_to_token(window.messages)
+        self.Metrics.inc("tokens_in", input_ids.shape[1])
+
+        # Replay the response if this exact context has been answered before
+        cache_key = None
+        if self.ResponseCache is not None:
+            with trace.span("cache_lookup"):
+                settings = slot.Model.engine.settings(**slot.generation)
+                settings.pop("speculative")  # Speculation never changes the output
+                chunks = None
+                if self.ResponseCache.cacheable(settings):
+                    cache_key = self.ResponseCache.key(
+                        f"{slot.Model.fingerprint}:{slot.Model.engine.name}",
+                        settings, slot.stop_token_ids, input_ids[0].tolist()
+                    )
+                    chunks = self.ResponseCache.get(cache_key)
+            if chunks is not None:
+                self.Metrics.inc("cache_hits")
+                self.Helpers.log_message(
+                    self.LogFile, "Response Cache", "INFO", "Replaying a cached response", True
+                )
+                yield from chunks
+                with trace.span("finalize"):
+                    self.add_response(conversation_id, "".join(chunks))
+                return
+
+        # Decode each generated token once and flush text by the configured policy
+        streaming = confs["streaming"]
+        streamer = TokenStreamer(
+            slot.Model.llm_tokenizer,
+            streaming["flush_policy"],
+            streaming["flush_interval_ms"],
+            streaming["timeout"]
+        )
+
+        with trace.span("generation_start"):
+            generation_start = time.perf_counter()
+            job = self.GenerationWorker.submit(
+                slot, input_ids, streamer, conversation_id, cancel,
+                lambda job: self.log_generation(job, input_ids.shape[1], slot), slot.generation
+            )
+
+        try:
+            last_chunk = time.perf_counter()
+            for chunk in streamer:
+                trace.record("decode_chunk", last_chunk, time.perf_counter() - last_chunk)
+                yield chunk
+                last_chunk = time.perf_counter()
+        except GeneratorExit:
+            # The caller stopped reading, so stop generating for it
+            cancel.cancel("abandoned")
+            raise
         except Exception as e:
+            cancel.cancel("stream_error")
+            self.Metrics.inc("errors")
             self.Helpers.log_message(
                 self.LogFile, "QUERY", "ERROR", f"Streaming error: {str(e)}"
             )
-            
+
+        # Prefill, including waiting for the model, ends when the first token arrives
+        if streamer.first_token_time is not None:
+            trace.record("first_token", generation_start, streamer.first_token_time - generation_start)
+
+        with trace.span("finalize"):
+            full_response = streamer.text
+            failed = job.done.wait(1) and job.error is not None
+            # A generation that failed part way is not kept as the answer
+            if not failed:
+                self.add_response(conversation_id, full_response)
+
+            # Only cache responses that were generated to completion
+            if cache_key is not None and full_response and job.done.is_set() and not failed and not cancel.cancelled:
+                self.ResponseCache.put(cache_key, streamer.parts)
+
+    def log_generation(self, job, prompt_tokens, slot):
+        """
+        Records the outcome of a query's generation. Runs on the generation worker.
+
+        Args:
+            job (GenerationJob): The finished job.
+            prompt_tokens (int): The number of prompt tokens.
+            slot (ModelSlot): The model that generated.
+        """
+        if job.error is not None:
+            self.Metrics.inc("errors")
+            self.Helpers.log_message(
+                self.LogFile, "QUERY", "ERROR", f"Generation error: {str(job.error)}"
+            )
+            return
+
+        if job.cancel.cancelled:
+            self.Helpers.log_message(
+                self.LogFile, "QUERY", "INFO",
+                f"Generation stopped ({job.cancel.reason}) after "
+                f"{len(job.result.token_ids) if job.result is not None else 0} tokens", True
+            )
+        result = job.result
+        if result is None:
+            return
+        self.Metrics.inc("tokens_out", len(result.token_ids))
+        if result.reused_tokens:
+            self.Helpers.log_message(
+                self.LogFile, "KV Cache", "INFO",
+                f"Reused {result.reused_tokens} of {prompt_tokens} prompt tokens", True
+            )
+        if slot.Model.speculative is not None and result.accepted_tokens is not None:
+            self.Helpers.log_message(
+                self.LogFile, "Speculative", "INFO",
+                f"Accepted {result.accepted_tokens} of {len(result.token_ids)} tokens "
+                f"({result.acceptance_rate or 0:.0%}), {result.tokens_per_pass or 0:.2f} tokens per pass",
+                True
+            )
+
+    def forget(self, conversation_id):
+        """
+        Releases the in-memory history and retained attention state of a conversation.
+
+        Nothing is cleared: the conversation is rebuilt from the store or its log if it is
+        addressed again.
+
+        Args:
+            conversation_id (str): The conversation to release.
+        """
+        self.History.evict(conversation_id)
+        state = self.state
+        models = [slot.Model for slot in self.Registry.slots.values()]
+        if state is not None:
+            models.append(state.Model)
+        for model in models:
+            if model is not None and model.engine is not None:
+                model.engine.forget(conversation_id)
+
+    def add_response(self, conversation_id, response):
+        """
+        Adds a response to the conversation history and chat log.
+
+        Args:
+            conversation_id (str): The conversation the response belongs to.
+            response (str): The response text.
+        """
+        self.last_activity = time.monotonic()
+
         # Add final response to history only if we got something
-        if full_response:
+        if response:
             self.History.add_message(
-                self.conversation_id, "genisys", full_response
+                conversation_id, "genisys", response
             )
             self.Helpers.log_message(
-                self.ChatLogFile, "GeniSysAI", "RESPONSE", full_response, True
+                self.ChatLogFile, "GeniSysAI", "RESPONSE", response, True
             )
 
+def profile_imports(logs_path):
+    """
+    Reruns this command under python -X importtime, writing the import timings to the LLM logs.
+
+    Args:
+        logs_path (str): The configured logs directory.
+    """
+    path = os.path.join(logs_path, "llm", f"importtime-{datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}.txt")
+    print(f"Writing import profile to {path}")
+    with open(path, "w") as profile_file:
+        sys.exit(subprocess.call([sys.executable, "-X", "importtime"] + sys.argv, stderr=profile_file))
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python run.py [INPUT|SERVER]")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="GeniSysAI LLMCore")
+    parser.add_argument(
+        "command", type=str.upper, choices=["INPUT", "SERVER", "BENCH", "TUNE", "BATCH", "HISTORY", "EXPORT"], help="The mode to run LLMCore in"
+    )
+    parser.add_argument(
+        "paths", nargs="*", help="BATCH: the JSON lines file of prompts and the JSON lines file to write responses to"
+    )
+    parser.add_argument(
+        "--profile-imports", action="store_true",
+        help="Record python -X importtime output for this run in the LLM logs"
+    )
+    parser.add_argument(
+        "--model", help="INPUT: the model to chat with, named after its definition file"
+    )
+    parser.add_argument(
+        "--conversation", help="INPUT: the ID of a stored conversation to resume, or \"last\" for the most recent"
+    )
+    parser.add_argument(
+        "--tiny", action="store_true",
+        help="BENCH: benchmark a tiny randomly initialized model instead of the configured model"
+    )
+    parser.add_argument(
+        "--suite", choices=["generation", "streamer", "workers", "concurrency", "history"], default="generation",
+        help="BENCH: the benchmark suite to run"
+    )
+    parser.add_argument(
+        "--output", help="BENCH, TUNE, EXPORT: the JSON report to write"
+    )
+    args = parser.parse_args()
+    if args.command == "BATCH" and len(args.paths) != 2:
+        parser.error("BATCH needs an input and an output file")
+
+    confs = Helpers().load_configs()
+
+    if args.profile_imports and "importtime" not in sys._xoptions:
+        profile_imports(confs["llm"]["logs_path"])
+
+    if args.command == "BENCH" and args.suite == "streamer":
+        # The streamer suite only needs the tokenizer, so the model is never loaded
+        get_sink(**confs["logging"])
+        Benchmark(None, confs).run_streamer(args.output)
+        sys.exit(0)
+
+    if args.command == "BENCH" and args.suite == "history":
+        # The history suite only exercises conversation storage
+        get_sink(**confs["logging"])
+        Benchmark(None, confs).run_history(args.output)
+        sys.exit(0)
+
+    if args.command == "HISTORY":
+        # Listing conversations only needs the store
+        store = open_store(confs)
+        if store is None:
+            sys.exit("The conversation store is disabled")
+        for conversation in store.conversations():
+            print(
+                f"{conversation['id']}  {datetime.fromtimestamp(conversation['updated']).strftime('%Y-%m-%d %H:%M:%S')}"
+                f"  {conversation['messages']} messages"
+            )
+        sys.exit(0)
+
+    if args.command == "TUNE":
+        # Each candidate compiles its own model
+        get_sink(**confs["logging"])
+        Tuner(confs).run(args.output)
+        sys.exit(0)
+
+    if args.command == "EXPORT":
+        # Each variant is exported and measured in its own process
+        get_sink(**confs["logging"])
+        Exporter(confs).run(args.output)
+        sys.exit(0)
+
+    if args.command == "BENCH":
+        confs = Benchmark.prepare_confs(confs, args.tiny)
+
+    if args.command == "BENCH" and args.suite == "workers":
+        # Each worker process loads its own LLMCore
+        get_sink(**confs["logging"])
+        Benchmark(None, confs).run_workers(args.output)
+        sys.exit(0)
+
+    if args.command == "SERVER" and confs["workers"]["enabled"]:
+        pool = WorkerPool(confs)
+        pool.Helpers.log_message(
+            pool.LogFile, "Server Mode", "INFO", f"Running in server mode with {len(pool.workers)} workers"
+        )
+        try:
+            Server(pool, confs).run()
+        finally:
+            pool.close()
+        sys.exit(0)
 
-    LLMCore = LLMCore()
+    LLMCore = LLMCore(confs)
 
-    command = sys.argv[1].upper()
+    command = args.command
     if command == "INPUT":
         LLMCore.Helpers.log_message(
             LLMCore.LogFile, "Input Mode", "INFO", "Running in input mode"
         )
 
+        if args.conversation:
+            conversation_id = args.conversation
+            if conversation_id == "last":
+                recent = LLMCore.History.list_conversations(1)
+                conversation_id = recent[0]["id"] if recent else None
+            if conversation_id is None or not LLMCore.History.has_conversation(conversation_id):
+                sys.exit(f"There is no stored conversation {args.conversation}")
+            LLMCore.conversation_id = conversation_id
+            history = LLMCore.History.get_history(conversation_id)
+            print(f"Resumed conversation {conversation_id} ({len(history)} messages)")
+            for message in LLMCore.History.get_recent(conversation_id, 2):
+                speaker = {"user": "User", "genisys": "GeniSysAI"}.get(message.role, "Summary")
+                print(f"\n{speaker}> {message.content}")
+
         try:
             while True:
                 prompt = input("\nUser> ")
@@ -301,12 +935,17 @@ if __name__ == "__main__":
                 print("\nGeniSysAI> ", end='', flush=True)
                 response_text = ""
 
+                generator = LLMCore.query(prompt, model=args.model)
                 try:
-                    for text_chunk in LLMCore.query(prompt):
+                    for text_chunk in generator:
                         if text_chunk:  # Only print non-empty chunks
                             print(text_chunk, end='', flush=True)
                             response_text += text_chunk
 
+                except KeyboardInterrupt:
+                    # Ctrl-C stops the response; pressed at the prompt it exits
+                    generator.close()
+                    print("\n[Response cancelled]")
                 except Exception as e:
                     print(f"\nError generating response: {str(e)}")
                     LLMCore.Helpers.log_message(
@@ -314,6 +953,11 @@ if __name__ == "__main__":
 
         except KeyboardInterrupt:
             print("\nExiting...")
+            if LLMCore.Metrics.enabled:
+                LLMCore.Metrics.write_snapshot(os.path.join(
+                    LLMCore._confs["llm"]["logs_path"], "llm",
+                    f"metrics-{datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}.json"
+                ))
         except Exception as e:
             print(f"\nError: {str(e)}")
             LLMCore.Helpers.log_message(
@@ -322,10 +966,22 @@ if __name__ == "__main__":
 
     elif command == "SERVER":
         LLMCore.Helpers.log_message(
-            LLMCore.LogFile, "Server Mode", "INFO", "SERVER mode not implemented"
+            LLMCore.LogFile, "Server Mode", "INFO", "Running in server mode"
         )
+        Server(LLMCore, LLMCore._confs).run()
 
-    else:
+    elif command == "BENCH":
         LLMCore.Helpers.log_message(
-            LLMCore.LogFile, "Server Mode", "ERROR", "Invalid command provided. Usage: python run.py [INPUT|SERVER]")
-        sys.exit(1)
+            LLMCore.LogFile, "Benchmark", "INFO", "Running in benchmark mode"
+        )
+        if args.suite == "concurrency":
+            Benchmark(LLMCore, LLMCore._confs).run_concurrency(args.output)
+        else:
+            Benchmark(LLMCore, LLMCore._confs).run(args.output)
+
+    elif command == "BATCH":
+        LLMCore.Helpers.log_message(
+            LLMCore.LogFile, "Batch", "INFO", f"Running in batch mode on {args.paths[0]}"
+        )
+        BatchRunner(LLMCore, LLMCore._confs).run(*args.paths)
+
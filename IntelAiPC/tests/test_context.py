@@ -0,0 +1,84 @@
+import random
+
+from tools.context import ContextBuilder
+from tools.history import Message
+
+class Tokens:
+    def __init__(self, length):
+        self.shape = (1, length)
+
+class TemplateModel:
+    """
+    Templates a conversation to a fixed cost for the system and generation prompts plus
+    a cost per message, like a chat template that wraps every message in its own markers.
+    """
+    model_path = "fake"
+
+    def __init__(self):
+        self.calls = 0
+
+    def convert_history_to_token(self, history, add_generation_prompt=True):
+        self.calls += 1
+        tokens = 3 if add_generation_prompt else 0
+        for message in history:
+            tokens += 4 + len(message["content"].split())
+        return Tokens(tokens)
+
+def baseline_window(model, system_prompt, history, max_tokens):
+    """
+    The window the query loop built before ContextBuilder: the latest message, then
+    older messages while the templated window stays within max_tokens.
+    """
+    window = [history[-1].to_dict()]
+    for message in reversed(history[:-1]):
+        candidate = [message.to_dict()] + window
+        if model.convert_history_to_token(system_prompt + candidate).shape[1] > max_tokens:
+            break
+        window = candidate
+    return system_prompt + window
+
+def random_history(rng, length):
+    return [
+        Message(rng.choice(["user", "genisys"]), " ".join("word" for _ in range(rng.randint(0, 40))))
+        for _ in range(length)
+    ]
+
+def test_window_matches_baseline_on_random_histories():
+    rng = random.Random(1234)
+    model = TemplateModel()
+    system_prompt = [{"role": "system", "content": "You are a helpful assistant"}]
+    for _ in range(300):
+        history = random_history(rng, rng.randint(1, 25))
+        max_tokens = rng.randint(1, 400)
+        window = ContextBuilder(model).build(system_prompt, history, max_tokens)
+
+        expected = baseline_window(model, system_prompt, history, max_tokens)
+        assert window.messages == expected
+        assert window.tokens == model.convert_history_to_token(expected).shape[1]
+        assert window.dropped_messages == len(history) - (len(expected) - 1)
+
+def test_single_message_over_budget_is_kept():
+    model = TemplateModel()
+    system_prompt = [{"role": "system", "content": "System"}]
+    history = [Message("user", "short"), Message("user", " ".join(["long"] * 100))]
+    window = ContextBuilder(model).build(system_prompt, history, 20)
+
+    assert window.messages == baseline_window(model, system_prompt, history, 20)
+    assert window.messages[1:] == [history[-1].to_dict()]
+    assert window.tokens > 20
+    assert window.dropped_messages == 1
+
+def test_counts_are_cached_per_model():
+    model, other = TemplateModel(), TemplateModel()
+    other.model_path = "other"
+    system_prompt = [{"role": "system", "content": "System"}]
+    history = random_history(random.Random(7), 10)
+
+    ContextBuilder(model).build(system_prompt, history, 1000)
+    calls = model.calls
+    ContextBuilder(model).build(system_prompt, history, 1000)
+    ContextBuilder(other).build(system_prompt, history, 1000)
+
+    # Only the system prompt is templated again for the first model
+    assert model.calls == calls + 1
+    assert all(set(message.token_counts) == {"fake", "other"} for message in history)
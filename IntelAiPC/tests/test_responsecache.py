@@ -0,0 +1,82 @@
+import json
+import os
+import time
+
+from tools.logsink import get_sink
+from tools.responsecache import ResponseCache
+
+def make_key(token_ids):
+    return ResponseCache.key("model", {"do_sample": False}, [2], token_ids)
+
+def test_get_returns_what_was_put(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.jsonl"))
+    key = make_key([1, 2, 3])
+
+    assert cache.get(key) is None
+    cache.put(key, ["Hello", " world"])
+
+    assert cache.get(key) == ["Hello", " world"]
+    assert cache.get(make_key([1, 2, 4])) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+def test_keys_differ_by_settings_and_stop_tokens():
+    assert ResponseCache.key("model", {"do_sample": False}, [2], [1]) != \
+        ResponseCache.key("model", {"do_sample": True}, [2], [1])
+    assert ResponseCache.key("model", {"do_sample": False}, [2], [1]) != \
+        ResponseCache.key("model", {"do_sample": False}, [3], [1])
+
+def test_only_greedy_settings_are_cacheable_by_default(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.jsonl"))
+    assert cache.cacheable({"do_sample": False})
+    assert not cache.cacheable({"do_sample": True})
+    assert ResponseCache(str(tmp_path / "sampled.jsonl"), allow_sampled=True).cacheable({"do_sample": True})
+
+def test_entries_expire_after_the_ttl(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.jsonl"), ttl=0.05)
+    key = make_key([1])
+    cache.put(key, ["a"])
+    assert cache.get(key) == ["a"]
+
+    time.sleep(0.1)
+    assert cache.get(key) is None
+    assert cache.stats()["entries"] == 0
+
+def test_least_recently_used_is_evicted_past_the_caps(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.jsonl"), max_entries=2)
+    first, second, third = make_key([1]), make_key([2]), make_key([3])
+    cache.put(first, ["1"])
+    cache.put(second, ["2"])
+    cache.get(first)  # Now the second entry is the least recently used
+    cache.put(third, ["3"])
+
+    assert cache.get(second) is None
+    assert cache.get(first) == ["1"]
+    assert cache.get(third) == ["3"]
+    assert cache.stats()["evictions"] == 1
+
+    sized = ResponseCache(str(tmp_path / "sized.jsonl"), max_bytes=1000)
+    sized.put(first, ["x" * 500])
+    sized.put(second, ["y" * 500])
+    assert sized.get(first) is None
+    assert sized.get(second) == ["y" * 500]
+
+def test_entries_are_reloaded_from_the_file(tmp_path):
+    path = str(tmp_path / "cache" / "responses.jsonl")
+    cache = ResponseCache(path)
+    key = make_key([1, 2])
+    cache.put(key, ["kept"])
+    assert get_sink().flush(5)
+
+    with open(path, "a") as cache_file:
+        cache_file.write(json.dumps({"key": "expired", "created": time.time() - 10, "chunks": ["old"]}) + "\n")
+        cache_file.write('{"key": "cut short", "crea')
+
+    reloaded = ResponseCache(path, ttl=5)
+    assert reloaded.get(key) == ["kept"]
+    assert reloaded.get("expired") is None
+
+    # The file is compacted to the live entries, without leaving a temporary file behind
+    with open(path, "r") as cache_file:
+        assert [json.loads(line)["key"] for line in cache_file] == [key]
+    assert os.listdir(os.path.dirname(path)) == ["responses.jsonl"]
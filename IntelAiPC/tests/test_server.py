@@ -0,0 +1,191 @@
+import json
+import time
+import asyncio
+import threading
+
+from tools.history import History
+from tools.metrics import Metrics
+from tools.server import Server
+
+CONFS = {
+    "server": {
+        "host": "127.0.0.1",
+        "port": 0,
+        "max_active": 1,
+        "max_queue": 1,
+        "stream_buffer": 2,
+        "read_timeout": 5,
+        "write_timeout": 1,
+        "max_body_bytes": 65536,
+        "max_conversations": 100,
+    }
+}
+
+class StubHelpers:
+    def __init__(self):
+        self.messages = []
+
+    def log_message(self, logfile, process, message_type, message, hide=False):
+        self.messages.append((process, message_type, message))
+
+class StubCore:
+    """
+    Stands in for LLMCore, streaming fixed chunks once its gate is open.
+    """
+
+    def __init__(self, tmp_path, chunks=("Hel", "lo"), delay=0.0):
+        self.chunks = chunks
+        self.delay = delay
+        self.gate = threading.Event()
+        self.gate.set()
+        self.closed = threading.Event()
+        self.sent = 0
+        self.History = History(logs_path=str(tmp_path))
+        self.Metrics = Metrics()
+        self.Helpers = StubHelpers()
+        self.LogFile = str(tmp_path)
+
+    def has_model(self, name):
+        return name == "default"
+
+    def query(self, prompt, conversation_id=None, model=None, deadline=None, first_token_deadline=None):
+        try:
+            self.gate.wait()
+            for chunk in self.chunks:
+                time.sleep(self.delay)
+                self.sent += 1
+                yield chunk
+        finally:
+            self.closed.set()
+
+async def start(core):
+    server = Server(core, CONFS)
+    server._slots = asyncio.Semaphore(CONFS["server"]["max_active"])
+    listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    return server, listener, listener.sockets[0].getsockname()[1]
+
+async def post(port, payload, path="/chat"):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(payload).encode("utf-8")
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    return reader, writer
+
+def parse(response):
+    head, _, body = response.partition(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    headers = dict(line.split(": ", 1) for line in lines[1:])
+    return int(lines[0].split(" ")[1]), headers, body
+
+def events(body):
+    assert body.endswith(b"\n\n")
+    parsed = []
+    for block in body.decode("utf-8").split("\n\n")[:-1]:
+        event, data = block.split("\n")
+        assert event.startswith("event: ") and data.startswith("data: ")
+        parsed.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return parsed
+
+def test_chat_streams_server_sent_events(tmp_path):
+    async def run():
+        core = StubCore(tmp_path)
+        _, listener, port = await start(core)
+        async with listener:
+            reader, writer = await post(port, {"prompt": "Hi", "conversation_id": "abc-1"})
+            response = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+        return response
+
+    status, headers, body = parse(asyncio.run(run()))
+    assert status == 200
+    assert headers["Content-Type"] == "text/event-stream"
+    assert headers["X-Conversation-Id"] == "abc-1"
+    assert events(body) == [
+        ("start", {"conversation_id": "abc-1"}),
+        ("message", {"text": "Hel"}),
+        ("message", {"text": "lo"}),
+        ("done", {"conversation_id": "abc-1"}),
+    ]
+
+def test_bad_requests_are_rejected(tmp_path):
+    async def run():
+        core = StubCore(tmp_path)
+        _, listener, port = await start(core)
+        responses = []
+        async with listener:
+            for payload in (
+                {"prompt": "Hi", "conversation_id": "../../etc/passwd"},
+                {"prompt": "Hi", "conversation_id": "x" * 65},
+                {"prompt": "Hi", "conversation_id": 5},
+                {"prompt": 5},
+                {"prompt": None},
+                {"prompt": "Hi", "model": "missing"},
+                {"prompt": "Hi", "deadline": -1},
+                {},
+            ):
+                reader, writer = await post(port, payload)
+                responses.append(parse(await asyncio.wait_for(reader.read(), 5)))
+                writer.close()
+        return core, responses
+
+    core, responses = asyncio.run(run())
+    assert [status for status, _, _ in responses] == [400] * 8
+    assert all("X-Conversation-Id" not in headers for _, headers, _ in responses)
+    assert core.sent == 0
+
+def test_full_queue_is_rejected_with_503(tmp_path):
+    async def run():
+        core = StubCore(tmp_path)
+        core.gate.clear()
+        server, listener, port = await start(core)
+        async with listener:
+            # The first request holds the only slot and the second waits in the queue
+            active = await post(port, {"prompt": "one"})
+            await asyncio.wait_for(active[0].readuntil(b"event: start"), 5)
+            queued = await post(port, {"prompt": "two"})
+            await asyncio.wait_for(queued[0].readuntil(b"event: start"), 5)
+            while server.queued < 1:
+                await asyncio.sleep(0.01)
+
+            rejected = await post(port, {"prompt": "three"})
+            busy = parse(await asyncio.wait_for(rejected[0].read(), 5))
+            rejected[1].close()
+
+            core.gate.set()
+            finished = [await asyncio.wait_for(reader.read(), 5) for reader, _ in (active, queued)]
+            for _, writer in (active, queued):
+                writer.close()
+        return server, busy, finished
+
+    server, busy, finished = asyncio.run(run())
+    assert busy[0] == 503
+    assert all(b"event: done" in body for body in finished)
+    assert server.active == 0 and server.queued == 0
+
+def test_dropped_client_releases_its_slot(tmp_path):
+    async def run():
+        core = StubCore(tmp_path, chunks=["token"] * 10000, delay=0.001)
+        server, listener, port = await start(core)
+        async with listener:
+            reader, writer = await post(port, {"prompt": "Hi"})
+            await asyncio.wait_for(reader.readuntil(b"event: message"), 5)
+            writer.transport.abort()
+
+            deadline = time.monotonic() + 10
+            while (server.active or not core.closed.is_set()) and time.monotonic() < deadline:
+                await asyncio.sleep(0.02)
+
+            # The slot is free again, so a new request is answered
+            core.chunks, core.delay = ["again"], 0.0
+            reader, writer = await post(port, {"prompt": "Hi"})
+            response = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+        return server, core, response
+
+    server, core, response = asyncio.run(run())
+    assert core.closed.is_set()
+    assert core.sent < 10000
+    assert server.active == 0 and server._slots._value == CONFS["server"]["max_active"]
+    assert b"event: done" in response
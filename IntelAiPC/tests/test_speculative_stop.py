@@ -0,0 +1,70 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from tools.stopping import StopMatcher
+
+PROMPT = [11, 12, 13]
+# Tokens greedy decoding produces; 2 is the stop token
+GREEDY = [5, 6, 2, 7, 8]
+
+class RecordingStreamer:
+    def __init__(self):
+        self.values = []
+        self.ended = False
+
+    def put(self, value):
+        self.values.append(value.reshape(-1).tolist())
+
+    def end(self):
+        self.ended = True
+
+def run(chunks, matcher, streamer=None):
+    """
+    Feeds generated tokens to a StopCriteria in chunks, like Hugging Face generate does,
+    and returns the criteria and the tokens generated up to the step that stopped.
+    """
+    counter = None
+    if streamer is not None:
+        model = pytest.importorskip("tools.model")
+        counter = model._PassCounter(streamer)
+        counter.put(torch.tensor(PROMPT))
+    criteria = matcher.criteria(prompt_length=len(PROMPT), on_step=counter.release if counter else None)
+    tokens = list(PROMPT)
+    for chunk in chunks:
+        tokens.extend(chunk)
+        if counter is not None:
+            counter.put(torch.tensor(chunk))
+        if criteria(torch.tensor([tokens]), None).all():
+            break
+    if counter is not None:
+        counter.end()
+    return criteria, tokens[len(PROMPT):]
+
+@pytest.mark.parametrize("matcher", [
+    StopMatcher(None, stop_token_ids=[2]),
+    StopMatcher(None, stop_sequences=[[6, 2]]),
+], ids=["token", "sequence"])
+def test_speculative_stops_on_greedy_token(matcher):
+    greedy, greedy_tokens = run([[token] for token in GREEDY], matcher)
+    speculative, speculative_tokens = run([GREEDY[:1], GREEDY[1:4], GREEDY[4:]], matcher)
+
+    assert greedy.stop_lengths == [3]
+    assert speculative.stop_lengths == greedy.stop_lengths
+    # The accepted tokens ran past the stop, and are cut where greedy decoding stopped
+    assert speculative_tokens[:speculative.stop_lengths[0]] == greedy_tokens[:greedy.stop_lengths[0]]
+
+def test_stop_sequence_ignores_prompt():
+    matcher = StopMatcher(None, stop_sequences=[[13, 5]])
+    criteria, _ = run([GREEDY[:2], GREEDY[2:]], matcher)
+
+    assert criteria.stop_lengths == [None]
+
+def test_speculative_stream_stops_on_greedy_token():
+    matcher = StopMatcher(None, stop_token_ids=[2])
+    streamer = RecordingStreamer()
+    run([GREEDY[:1], GREEDY[1:4], GREEDY[4:]], matcher, streamer)
+
+    assert streamer.values == [PROMPT, [5], [6, 2]]
+    assert streamer.ended
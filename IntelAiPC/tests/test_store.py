@@ -0,0 +1,56 @@
+import sqlite3
+import threading
+import time
+
+from tools.store import ConversationStore
+
+def test_concurrent_writers_keep_every_message(tmp_path):
+    path = str(tmp_path / "history.db")
+    logs = str(tmp_path / "llm")
+    # A short busy timeout, so the writers hit SQLITE_BUSY and retry
+    stores = [ConversationStore(path, batch_size=8, busy_timeout=0.01, logs_path=logs) for _ in range(2)]
+
+    # Another process holding the write lock while the stores write
+    blocker = sqlite3.connect(path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+
+    def write(store, name):
+        for index in range(50):
+            store.append("shared", "user", f"{name}-{index}")
+            store.append(name, "user", str(index))
+
+    threads = [threading.Thread(target=write, args=(store, f"s{number}")) for number, store in enumerate(stores)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.3)
+    blocker.execute("COMMIT")
+    blocker.close()
+    for thread in threads:
+        thread.join()
+    for store in stores:
+        assert store.flush(30)
+
+    reader = stores[0]
+    shared = [content for _, content in reader.messages("shared")]
+    assert sorted(shared) == sorted(f"s{number}-{index}" for number in range(2) for index in range(50))
+    for number in range(2):
+        assert [content for _, content in reader.messages(f"s{number}")] == [str(index) for index in range(50)]
+        # Each writer's own messages keep their order
+        assert [content for content in shared if content.startswith(f"s{number}-")] == [
+            f"s{number}-{index}" for index in range(50)
+        ]
+    assert all(store.stats()["errors"] == 0 for store in stores)
+    for store in stores:
+        store.close()
+
+def test_bad_write_does_not_drop_its_batch(tmp_path):
+    (tmp_path / "llm").mkdir()
+    store = ConversationStore(str(tmp_path / "history.db"), logs_path=str(tmp_path / "llm"))
+    store.append("c", "user", "first")
+    store.append("c", "user", object())  # Cannot be stored
+    store.append("c", "user", "second")
+    assert store.flush(10)
+
+    assert [content for _, content in store.messages("c")] == ["first", "second"]
+    assert store.stats()["errors"] == 1
+    store.close()
@@ -0,0 +1,311 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Batch
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Batch
+# Description:   Offline batch inference for GeniSysAI LLMCore.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+import os
+import json
+import time
+
+from itertools import islice
+
+class BatchRunner:
+    """
+    BatchRunner Class:
+    Answers a file of prompts in padded batches, for regression and evaluation runs.
+
+    The input is a JSON lines file with a "prompt" and an optional "id" per line. It is
+    read as a stream, window prompts at a time. Each window is templated with the system
+    prompt, sorted by length and cut into batches of up to batch_size prompts and
+    max_batch_tokens padded tokens, so prompts of similar length are batched together and
+    little padding is generated. Every sequence in a batch stops on its own stop
+    conditions.
+
+    Results are written to a JSON lines file in input order, as soon as every earlier
+    prompt has been answered. The output is only ever appended to, so a run that is
+    interrupted can be resumed: the complete lines already written are kept and the
+    prompts they answer are skipped.
+
+    Generation settings come from the "generation" configuration, with the overrides in
+    the "batch" configuration. After the run, sample_sequential prompts are also
+    generated one at a time to report the speedup of batching.
+    """
+
+    def __init__(self, core, confs):
+        """
+        Initializes the BatchRunner.
+
+        Args:
+            core (LLMCore): The core whose model generates the responses.
+            confs (dict): Configuration dictionary containing the "batch" settings.
+        """
+        self.core = core
+        self._confs = confs
+        self._batch = confs["batch"]
+
+    def overrides(self) -> dict:
+        """
+        Returns the generation settings that replace the configured values for batch runs.
+
+        Returns:
+            dict: The generation overrides.
+        """
+        overrides = dict(self._batch["generation"])
+        if self._batch["max_new_tokens"]:
+            overrides["max_new_tokens"] = self._batch["max_new_tokens"]
+        return overrides
+
+    def resume(self, output_path) -> int:
+        """
+        Returns the number of prompts already answered in an output file.
+
+        A line cut short by a crash is removed, so the file ends after its last complete line.
+
+        Args:
+            output_path (str): The JSON lines output file.
+
+        Returns:
+            int: The number of complete lines.
+        """
+        if not os.path.exists(output_path):
+            return 0
+
+        done, end = 0, 0
+        with open(output_path, "rb") as output_file:
+            for line in output_file:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    json.loads(line)
+                except ValueError:
+                    break
+                done += 1
+                end += len(line)
+        with open(output_path, "r+b") as output_file:
+            output_file.truncate(end)
+        return done
+
+    def read(self, input_path, skip=0):
+        """
+        Streams the prompts of an input file.
+
+        Args:
+            input_path (str): The JSON lines input file.
+            skip (int, optional): The number of prompts to skip. Defaults to 0.
+
+        Yields:
+            tuple: The prompt's index, ID and text. The text is None for a line that is
+                not a JSON object with a string prompt.
+        """
+        with open(input_path, "r") as input_file:
+            lines = (line for line in input_file if line.strip())
+            for index, line in enumerate(islice(lines, skip, None), skip):
+                try:
+                    record = json.loads(line)
+                    prompt = record["prompt"]
+                except (ValueError, KeyError, TypeError):
+                    yield index, None, None
+                    continue
+                yield index, record.get("id", index), prompt if isinstance(prompt, str) else None
+
+    def plan(self, items) -> list:
+        """
+        Sorts templated prompts by length and cuts them into batches.
+
+        Args:
+            items (list): (index, token IDs) pairs.
+
+        Returns:
+            list: Batches of (index, token IDs) pairs, shortest prompts first.
+        """
+        batches, batch = [], []
+        for item in sorted(items, key=lambda item: len(item[1])):
+            # Prompts are sorted, so the newest prompt is the longest in the batch
+            if batch and (len(batch) == self._batch["batch_size"]
+                          or len(item[1]) * (len(batch) + 1) > self._batch["max_batch_tokens"]):
+                batches.append(batch)
+                batch = []
+            batch.append(item)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def run(self, input_path, output_path) -> dict:
+        """
+        Answers every prompt in the input file not yet answered in the output file.
+
+        Args:
+            input_path (str): The JSON lines input file.
+            output_path (str): The JSON lines output file.
+
+        Returns:
+            dict: The run report, also written next to the output file.
+        """
+        core = self.core
+        core.wait_until_ready()
+        # The whole run uses the runtime state it started with, even across a reload
+        state = core.state
+        model = state.Model
+        overrides = self.overrides()
+
+        skip = self.resume(output_path)
+        if skip:
+            core.Helpers.log_message(
+                core.LogFile, "Batch", "INFO", f"Resuming after {skip} answered prompts"
+            )
+
+        totals = {"prompts": 0, "errors": 0, "batches": 0, "prompt_tokens": 0, "padded_tokens": 0, "new_tokens": 0}
+        generate_time = 0.0
+        prompts = self.read(input_path, skip)
+        with open(output_path, "a") as output_file:
+            def write(record):
+                totals["errors"] += "error" in record
+                output_file.write(json.dumps(record) + "\n")
+
+            while True:
+                window = list(islice(prompts, self._batch["window"]))
+                if not window:
+                    break
+
+                results, items = {}, []
+                for index, prompt_id, prompt in window:
+                    if prompt is None:
+                        results[index] = {
+                            "index": index, "id": prompt_id, "error": "Expected a JSON object with a string prompt"
+                        }
+                        continue
+                    input_ids = model.convert_history_to_token(
+                        state.system_prompt + [{"role": "user", "content": prompt}]
+                    )[0].tolist()
+                    items.append((index, input_ids))
+                    results[index] = {"index": index, "id": prompt_id}
+
+                next_index = window[0][0]
+                for batch in self.plan(items):
+                    start = time.perf_counter()
+                    try:
+                        with core.generation_lock:
+                            generated = model.engine.generate_batch(
+                                [input_ids for _, input_ids in batch], state.stop_token_ids,
+                                stop_matcher=state.stop_matcher, **overrides
+                            )
+                    except Exception as e:
+                        for index, _ in batch:
+                            results[index]["error"] = str(e)
+                        core.Helpers.log_message(core.LogFile, "Batch", "ERROR", f"Batch failed: {str(e)}")
+                    else:
+                        for (index, input_ids), result in zip(batch, generated):
+                            results[index].update({
+                                "response": model.llm_tokenizer.decode(result.token_ids, skip_special_tokens=True),
+                                "prompt_tokens": len(input_ids),
+                                "new_tokens": len(result.token_ids),
+                            })
+                            totals["new_tokens"] += len(result.token_ids)
+                    generate_time += time.perf_counter() - start
+                    totals["batches"] += 1
+                    totals["prompt_tokens"] += sum(len(input_ids) for _, input_ids in batch)
+                    totals["padded_tokens"] += len(batch) * max(len(input_ids) for _, input_ids in batch)
+
+                    # Write every answer whose earlier prompts have all been answered
+                    while next_index in results and ("response" in results[next_index]
+                                                     or "error" in results[next_index]):
+                        write(results.pop(next_index))
+                        next_index += 1
+                    output_file.flush()
+
+                for index in sorted(results):
+                    # Lines that were not valid prompts, when no batch followed them
+                    write(results.pop(index))
+                output_file.flush()
+
+                totals["prompts"] += len(window)
+                core.Helpers.log_message(
+                    core.LogFile, "Batch", "INFO",
+                    f"Answered {skip + totals['prompts']} prompts, "
+                    f"{totals['new_tokens'] / generate_time if generate_time else 0:.1f} tokens/s", True
+                )
+
+        report = dict(totals)
+        report.update({
+            "resumed_after": skip,
+            "generate_s": generate_time,
+            "tokens_per_s": totals["new_tokens"] / generate_time if generate_time else None,
+            "padding_ratio": 1 - totals["prompt_tokens"] / totals["padded_tokens"] if totals["padded_tokens"] else None,
+        })
+        report["sequential"] = self.compare_sequential(input_path, report["tokens_per_s"])
+
+        with open(f"{output_path}.report.json", "w") as report_file:
+            json.dump(report, report_file, indent=4)
+        core.Helpers.log_message(
+            core.LogFile, "Batch", "INFO",
+            f"Batch run finished: {report['prompts']} prompts, {_fmt(report['tokens_per_s'])} tokens/s, "
+            f"{_fmt(report['sequential'].get('speedup'))}x sequential"
+        )
+        return report
+
+    def compare_sequential(self, input_path, batched_tokens_per_s) -> dict:
+        """
+        Generates the first sample_sequential prompts one at a time, for comparison.
+
+        Args:
+            input_path (str): The JSON lines input file.
+            batched_tokens_per_s (float): The batched generation rate.
+
+        Returns:
+            dict: The sequential generation rate and the speedup of batching.
+        """
+        core = self.core
+        samples = [prompt for _, _, prompt in islice(self.read(input_path), self._batch["sample_sequential"])
+                   if prompt is not None]
+        if not samples:
+            return {}
+
+        tokens, elapsed = 0, 0.0
+        for prompt in samples:
+            input_ids = core.Model.convert_history_to_token(core.system_prompt + [{"role": "user", "content": prompt}])
+            start = time.perf_counter()
+            with core.generation_lock:
+                result = core.Model.engine.generate(
+                    input_ids, None, core.stop_token_ids, stop_matcher=core.stop_matcher, speculative=False,
+                    **self.overrides()
+                )
+            elapsed += time.perf_counter() - start
+            tokens += len(result.token_ids)
+
+        tokens_per_s = tokens / elapsed if elapsed else None
+        return {
+            "prompts": len(samples),
+            "tokens_per_s": tokens_per_s,
+            "speedup": batched_tokens_per_s / tokens_per_s if batched_tokens_per_s and tokens_per_s else None,
+        }
+
+def _fmt(value):
+    """Formats an optional number for logging."""
+    return "n/a" if value is None else f"{value:.1f}"
@@ -0,0 +1,822 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Benchmark
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Benchmark
+# Description:   Inference benchmark suite for GeniSysAI LLMCore.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+
+from datetime import datetime
+
+from tools.helpers import Helpers
+from tools.history import History, Message
+from tools.logsink import get_sink
+from tools.streamer import TokenStreamer
+
+def percentile(values, q):
+    """
+    Returns the q-th percentile of values using the nearest-rank method.
+
+    Args:
+        values (list): The sample values.
+        q (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile value, or None for an empty sample.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of this process in megabytes.
+
+    Returns:
+        float: The peak RSS, or None where the resource module is unavailable.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+class TimingStreamer:
+    """
+    A streamer that records when each generated token arrives.
+
+    Follows the Hugging Face streamer protocol used by the engines: the first put()
+    carries the prompt and is ignored.
+    """
+
+    def __init__(self):
+        self.token_times = []
+        self._prompt_seen = False
+
+    def put(self, value):
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        now = time.perf_counter()
+        self.token_times.extend([now] * value.numel())
+
+    def end(self):
+        pass
+
+def time_generation(model, system, prompts, repeats, max_new_tokens):
+    """
+    Times greedy generation of each prompt on a loaded model.
+
+    Args:
+        model (Model): The loaded model.
+        system (str): The system prompt.
+        prompts (list): The user prompts.
+        repeats (int): The number of times each prompt is generated.
+        max_new_tokens (int): The maximum number of tokens generated per prompt.
+
+    Returns:
+        tuple: The times to first token in seconds, and the decode tokens per second of
+            each generation that produced more than one token.
+    """
+    stop_token_ids = model.get_stop_token_ids()
+    ttfts, rates = [], []
+    for _ in range(repeats):
+        for prompt in prompts:
+            input_ids = model.convert_history_to_token([
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt},
+            ])
+            streamer = TimingStreamer()
+            start = time.perf_counter()
+            model.engine.generate(
+                input_ids, streamer, stop_token_ids, max_new_tokens=max_new_tokens, do_sample=False
+            )
+            times = streamer.token_times
+            if times:
+                ttfts.append(times[0] - start)
+            if len(times) > 1 and times[-1] > times[0]:
+                rates.append((len(times) - 1) / (times[-1] - times[0]))
+    return ttfts, rates
+
+def legacy_stream(tokenizer, token_ids):
+    """
+    Streams token IDs through the TextIteratorStreamer loop LLMCore.query used before
+    TokenStreamer, for comparison in the streamer benchmark.
+
+    Args:
+        tokenizer (PreTrainedTokenizer): The model's Hugging Face tokenizer.
+        token_ids (list): The generated token IDs.
+
+    Returns:
+        list: The chunks handed to the consumer.
+    """
+    import torch
+    from transformers import TextIteratorStreamer
+
+    def process_streamed_text(text):
+        text = text.replace("<|endoftext|>", "").replace("<|pad|>", "")
+        try:
+            text.encode('utf-8').decode('utf-8')
+        except UnicodeError:
+            text = text[:-1]
+        return text
+
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    streamer.put(torch.tensor([[tokenizer.bos_token_id or 0]]))
+
+    chunks = []
+    buffer = ""
+    for token_id in token_ids:
+        streamer.put(torch.tensor([token_id]))
+        while not streamer.text_queue.empty():
+            buffer += streamer.text_queue.get_nowait()
+            if len(buffer) >= 10 or any(c in buffer for c in '.!?,\n'):
+                processed_text = process_streamed_text(buffer)
+                if processed_text:
+                    chunks.append(processed_text)
+                buffer = ""
+    streamer.end()
+    while True:
+        text = streamer.text_queue.get_nowait()
+        if text is streamer.stop_signal:
+            break
+        buffer += text
+    if buffer:
+        processed_text = process_streamed_text(buffer)
+        if processed_text:
+            chunks.append(processed_text)
+    return chunks
+
+def token_stream(tokenizer, token_ids, flush_policy):
+    """
+    Streams token IDs through a TokenStreamer with the given flush policy.
+
+    Args:
+        tokenizer (PreTrainedTokenizer): The model's Hugging Face tokenizer.
+        token_ids (list): The generated token IDs.
+        flush_policy (str): The TokenStreamer flush policy.
+
+    Returns:
+        list: The chunks handed to the consumer.
+    """
+    import torch
+
+    streamer = TokenStreamer(tokenizer, flush_policy)
+    streamer.put(torch.tensor([[tokenizer.bos_token_id or 0]]))
+
+    chunks = []
+    for token_id in token_ids:
+        streamer.put(torch.tensor([token_id]))
+        while not streamer.chunks.empty():
+            chunks.append(streamer.chunks.get_nowait())
+    streamer.end()
+    chunks.extend(iter(streamer))
+    return chunks
+
+class Benchmark:
+    """
+    Benchmark Class:
+    Replays a configurable set of prompts at several conversation lengths through the same
+    stages LLMCore.query runs, and records where the time goes.
+
+    For each case it records the context window build time, templating/tokenization time,
+    time to first token, inter-token latency percentiles, decode tokens per second and,
+    where the engine measures it, the time spent checking stop conditions and the
+    speculative decoding acceptance. With speculation configured every case is also run
+    with plain greedy decoding to record the speedup and check the output is identical.
+    The process peak RSS and the run metadata are written with the results as JSON so runs
+    can be diffed across commits.
+
+    The benchmark can run against the configured model or against a tiny randomly
+    initialized Llama model, which exercises the Python hot path without the production
+    weights.
+    """
+
+    def __init__(self, core, confs):
+        """
+        Initializes the Benchmark.
+
+        Args:
+            core (LLMCore): The core to benchmark, or None for suites that do not run the model.
+            confs (dict): Configuration dictionary containing the "bench" settings.
+        """
+        self.core = core
+        self._confs = confs
+        self._bench = confs["bench"]
+        self.Helpers = Helpers()
+        self.LogFile = self.Helpers.set_log_dir(f"{confs['llm']['logs_path']}llm/")
+
+    @staticmethod
+    def prepare_confs(confs, tiny=False):
+        """
+        Returns a copy of the configuration set up for benchmarking.
+
+        Args:
+            confs (dict): The loaded configuration.
+            tiny (bool, optional): Whether to benchmark the tiny random model. Defaults to False.
+
+        Returns:
+            dict: The benchmark configuration.
+        """
+        confs = json.loads(json.dumps(confs))
+        confs["llm"]["device"] = confs["bench"]["device"]
+        # Every run measures the configuration it started with
+        confs["reload"]["enabled"] = False
+        if confs["speculative"]["mode"] is not None:
+            # Speculation only applies to greedy generation
+            confs["generation"]["do_sample"] = False
+        if tiny:
+            Benchmark.export_tiny_model(confs)
+            confs["llm"]["model_out"] = confs["bench"]["tiny_model_out"]
+        return confs
+
+    @staticmethod
+    def export_tiny_model(confs):
+        """
+        Exports a tiny randomly initialized Llama model to OpenVINO IR, if not already exported.
+
+        The model reuses a real tokenizer, so prompts template and tokenize exactly as
+        they do in production, but has only a few small layers.
+
+        Args:
+            confs (dict): The loaded configuration.
+        """
+        out = os.path.join(confs["llm"]["model_path"], confs["bench"]["tiny_model_out"])
+        if os.path.isdir(out):
+            return
+
+        import torch
+        from optimum.intel.openvino import OVModelForCausalLM
+        from transformers import AutoTokenizer, LlamaConfig, LlamaForCausalLM
+
+        tokenizer = AutoTokenizer.from_pretrained(confs["bench"]["tiny_tokenizer"], trust_remote_code=True)
+        config = LlamaConfig(
+            vocab_size=len(tokenizer),
+            hidden_size=64,
+            intermediate_size=128,
+            num_hidden_layers=2,
+            num_attention_heads=4,
+            num_key_value_heads=2,
+            max_position_embeddings=8192,
+            bos_token_id=tokenizer.bos_token_id,
+            eos_token_id=tokenizer.eos_token_id,
+        )
+        torch.manual_seed(0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            LlamaForCausalLM(config).save_pretrained(tmp)
+            tokenizer.save_pretrained(tmp)
+            OVModelForCausalLM.from_pretrained(tmp, export=True, compile=False).save_pretrained(out)
+        tokenizer.save_pretrained(out)
+
+        try:
+            import openvino as ov
+            from openvino_tokenizers import convert_tokenizer
+        except ImportError:
+            return  # The genai engine needs the OpenVINO tokenizer models, optimum does not
+        ov_tokenizer, ov_detokenizer = convert_tokenizer(tokenizer, with_detokenizer=True)
+        ov.save_model(ov_tokenizer, os.path.join(out, "openvino_tokenizer.xml"))
+        ov.save_model(ov_detokenizer, os.path.join(out, "openvino_detokenizer.xml"))
+
+    def build_history(self, length):
+        """
+        Builds a synthetic conversation of alternating user and assistant turns.
+
+        Args:
+            length (int): The number of earlier messages.
+
+        Returns:
+            list: The history as Message records, oldest first.
+        """
+        turns = self._bench["history_turns"]
+        history = []
+        for i in range(length):
+            user, genisys = turns[(i // 2) % len(turns)]
+            if i % 2 == 0:
+                history.append(Message("user", user))
+            else:
+                history.append(Message("genisys", genisys))
+        return history
+
+    def run_case(self, prompt, history_length, **overrides):
+        """
+        Runs one prompt at one conversation length.
+
+        Args:
+            prompt (str): The user prompt.
+            history_length (int): The number of earlier messages in the conversation.
+            **overrides: Generation settings that replace the configured values for this case.
+
+        Returns:
+            dict: The timings for the case.
+        """
+        core = self.core
+        history = self.build_history(history_length)
+        history.append(Message("user", prompt))
+
+        start = time.perf_counter()
+        window = core.ContextBuilder.build(core.system_prompt, history, self._confs["llm"]["max_input_tokens"])
+        window_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        input_ids = core.Model.convert_history_to_token(window.messages)
+        tokenize_time = time.perf_counter() - start
+
+        streamer = TimingStreamer()
+        start = time.perf_counter()
+        with core.generation_lock:
+            result = core.Model.engine.generate(
+                input_ids, streamer, core.stop_token_ids, stop_matcher=core.stop_matcher,
+                max_new_tokens=self._bench["max_new_tokens"], **overrides
+            )
+        end = time.perf_counter()
+
+        times = streamer.token_times
+        gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+        decode_time = times[-1] - times[0] if len(times) > 1 else 0.0
+
+        return {
+            "prompt": prompt,
+            "history_length": history_length,
+            "prompt_tokens": int(input_ids.shape[1]),
+            "new_tokens": len(times),
+            "window_ms": window_time * 1000,
+            "tokenize_ms": tokenize_time * 1000,
+            "ttft_ms": (times[0] - start) * 1000 if times else None,
+            "itl_ms": {
+                "p50": _ms(percentile(gaps, 50)),
+                "p90": _ms(percentile(gaps, 90)),
+                "p99": _ms(percentile(gaps, 99)),
+            },
+            "decode_tokens_per_s": (len(times) - 1) / decode_time if decode_time else None,
+            "stop_check_ms": _ms(result.stop_time),
+            "tokens_per_pass": result.tokens_per_pass,
+            "acceptance_rate": result.acceptance_rate,
+            "total_ms": (end - start) * 1000,
+            "token_ids": result.token_ids,
+        }
+
+    def run(self, output=None):
+        """
+        Runs every configured prompt at every configured conversation length.
+
+        Args:
+            output (str, optional): The JSON file to write. Defaults to a timestamped file in
+                the configured output path.
+
+        Returns:
+            dict: The benchmark report.
+        """
+        self.core.wait_until_ready()
+
+        # One untimed run so one-off allocations do not skew the first case
+        self.run_case(self._bench["prompts"][0], 0)
+
+        speculative = self._confs["speculative"]["mode"]
+
+        results = []
+        for history_length in self._bench["history_lengths"]:
+            for prompt in self._bench["prompts"]:
+                for _ in range(self._bench["repeats"]):
+                    result = self.run_case(prompt, history_length)
+                    token_ids = result.pop("token_ids")
+                    if speculative is not None:
+                        # Compare against plain greedy decoding of the same case
+                        baseline = self.run_case(prompt, history_length, speculative=False)
+                        result["matches_greedy"] = token_ids == baseline["token_ids"]
+                        result["speedup"] = baseline["total_ms"] / result["total_ms"]
+                    results.append(result)
+                    self.Helpers.log_message(
+                        self.LogFile, "Benchmark", "INFO",
+                        f"history={history_length} ttft={_fmt(results[-1]['ttft_ms'])}ms "
+                        f"decode={_fmt(results[-1]['decode_tokens_per_s'])} tokens/s"
+                    )
+
+        report = {
+            "meta": self.metadata(),
+            "summary": self.summarize(results),
+            "peak_rss_mb": peak_rss_mb(),
+            "results": results,
+        }
+        return self.write_report(report, output)
+
+    def run_streamer(self, output=None):
+        """
+        Measures the cost of turning generated tokens into streamed text.
+
+        Replays the configured assistant turns, token by token, through the previous
+        TextIteratorStreamer loop and through TokenStreamer with each flush policy. Only
+        the tokenizer is loaded, so the numbers show the per-token CPU cost of streaming
+        alone. Fewer tokens per chunk means text reaches the client sooner.
+
+        Args:
+            output (str, optional): The JSON file to write. Defaults to a timestamped file in
+                the configured output path.
+
+        Returns:
+            dict: The benchmark report.
+        """
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(
+            os.path.join(self._confs["llm"]["model_path"], self._confs["llm"]["model_out"]),
+            trust_remote_code=True
+        )
+        text = "\n".join(genisys for _, genisys in self._bench["history_turns"]) * 20
+        token_ids = tokenizer.encode(text, add_special_tokens=False)
+        expected = tokenizer.decode(token_ids, skip_special_tokens=True)
+
+        streams = {"legacy": lambda: legacy_stream(tokenizer, token_ids)}
+        for flush_policy in ("token", "punctuation", "interval"):
+            streams[flush_policy] = lambda flush_policy=flush_policy: token_stream(tokenizer, token_ids, flush_policy)
+
+        results = {}
+        for name, stream in streams.items():
+            stream()  # Untimed run to fill caches
+            cpu_times = []
+            for _ in range(self._bench["repeats"]):
+                start = time.process_time()
+                chunks = stream()
+                cpu_times.append(time.process_time() - start)
+            results[name] = {
+                "cpu_us_per_token": percentile(cpu_times, 50) / len(token_ids) * 1e6,
+                "chunks": len(chunks),
+                "tokens_per_chunk": len(token_ids) / len(chunks) if chunks else None,
+                "matches_decode": "".join(chunks) == expected,
+            }
+            self.Helpers.log_message(
+                self.LogFile, "Benchmark", "INFO",
+                f"streamer={name} cpu={_fmt(results[name]['cpu_us_per_token'])}us/token "
+                f"tokens/chunk={_fmt(results[name]['tokens_per_chunk'])}"
+            )
+
+        report = {
+            "meta": self.metadata(),
+            "tokens": len(token_ids),
+            "results": results,
+        }
+        return self.write_report(report, output, "streamer")
+
+    def run_history(self, output=None):
+        """
+        Measures conversation storage with the configured number of stored messages.
+
+        store_messages messages are added round-robin to store_conversations conversations,
+        once with the conversation store and once with the JSON lines logs, each in a
+        temporary directory. The write throughput includes waiting for every message to
+        be committed or written. The history is then reopened, as after a restart, and the
+        time to open it and list conversations is measured. For store_samples
+        conversations the newest store_recent messages and the full conversation are
+        loaded. Only the store can list conversations.
+
+        Args:
+            output (str, optional): The JSON file to write. Defaults to a timestamped file in
+                the configured output path.
+
+        Returns:
+            dict: The benchmark report.
+        """
+        from tools.store import ConversationStore
+
+        store_confs = self._confs["history"]["store"]
+        total = self._bench["store_messages"]
+        conversation_ids = [f"bench-{index:06d}" for index in range(self._bench["store_conversations"])]
+        texts = [text for turn in self._bench["history_turns"] for text in turn]
+        recent = self._bench["store_recent"]
+        samples = conversation_ids[::max(1, len(conversation_ids) // self._bench["store_samples"])]
+
+        root = tempfile.mkdtemp(prefix="history-bench-")
+        results = {}
+        try:
+            for backend in ("store", "log"):
+                logs_path = os.path.join(root, backend, "")
+                os.makedirs(logs_path)
+
+                def open_history():
+                    store = ConversationStore(
+                        os.path.join(logs_path, "history.db"), store_confs["batch_size"],
+                        store_confs["synchronous"], store_confs["busy_timeout"], self.LogFile
+                    ) if backend == "store" else None
+                    return History(logs_path=logs_path, store=store)
+
+                history = open_history()
+                start = time.perf_counter()
+                for index in range(total):
+                    role = "user" if (index // len(conversation_ids)) % 2 == 0 else "genisys"
+                    history.add_message(conversation_ids[index % len(conversation_ids)], role, texts[index % len(texts)])
+                if history.store is not None:
+                    history.store.flush()
+                    commits = history.store.commits
+                    history.store.close()
+                else:
+                    get_sink().flush()
+                    commits = None
+                write_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                history = open_history()
+                open_time = time.perf_counter() - start
+                start = time.perf_counter()
+                listed = history.list_conversations()
+                list_time = time.perf_counter() - start
+
+                recent_times, full_times = [], []
+                for conversation_id in samples:
+                    start = time.perf_counter()
+                    history.get_recent(conversation_id, recent)
+                    recent_times.append(time.perf_counter() - start)
+                for conversation_id in samples:
+                    start = time.perf_counter()
+                    history.get_history(conversation_id)
+                    full_times.append(time.perf_counter() - start)
+                if history.store is not None:
+                    history.store.close()
+
+                results[backend] = {
+                    "messages_per_s": total / write_time,
+                    "messages_per_commit": total / commits if commits else None,
+                    "open_ms": open_time * 1000,
+                    "list_ms": list_time * 1000 if listed else None,
+                    "recent_p50_ms": percentile(recent_times, 50) * 1000,
+                    "recent_p95_ms": percentile(recent_times, 95) * 1000,
+                    "reload_p50_ms": percentile(full_times, 50) * 1000,
+                    "reload_p95_ms": percentile(full_times, 95) * 1000,
+                }
+                self.Helpers.log_message(
+                    self.LogFile, "Benchmark", "INFO",
+                    f"history={backend} writes={results[backend]['messages_per_s']:.0f}/s "
+                    f"recent p50={results[backend]['recent_p50_ms']:.2f}ms "
+                    f"reload p50={results[backend]['reload_p50_ms']:.2f}ms"
+                )
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+        report = {
+            "meta": self.metadata(),
+            "messages": total,
+            "conversations": len(conversation_ids),
+            "recent": recent,
+            "results": results,
+        }
+        return self.write_report(report, output, "history")
+
+    def run_concurrency(self, output=None):
+        """
+        Measures aggregate throughput and time to first token as concurrent requests grow.
+
+        At each configured concurrency level, that many prompts are generated at once from
+        separate threads, each in a new conversation. Engines that cannot run generations
+        concurrently take the generation lock, so their requests queue behind each other.
+
+        Args:
+            output (str, optional): The JSON file to write. Defaults to a timestamped file in
+                the configured output path.
+
+        Returns:
+            dict: The benchmark report.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from contextlib import nullcontext
+
+        core = self.core
+        core.wait_until_ready()
+        engine = core.Model.engine
+        prompts = self._bench["prompts"]
+
+        def generate(prompt, start):
+            input_ids = core.Model.convert_history_to_token(core.system_prompt + [{"role": "user", "content": prompt}])
+            streamer = TimingStreamer()
+            with nullcontext() if engine.concurrent else core.generation_lock:
+                engine.generate(
+                    input_ids, streamer, core.stop_token_ids, stop_matcher=core.stop_matcher,
+                    max_new_tokens=self._bench["max_new_tokens"]
+                )
+            times = streamer.token_times
+            return (times[0] - start if times else None), len(times)
+
+        generate(prompts[0], time.perf_counter())  # Untimed run so one-off allocations do not skew the first level
+
+        results = []
+        for concurrency in self._bench["concurrency_levels"]:
+            with ThreadPoolExecutor(concurrency) as executor:
+                start = time.perf_counter()
+                cases = list(executor.map(
+                    lambda i: generate(prompts[i % len(prompts)], start), range(concurrency)
+                ))
+                elapsed = time.perf_counter() - start
+
+            ttfts = [ttft for ttft, _ in cases if ttft is not None]
+            tokens = sum(count for _, count in cases)
+            results.append({
+                "concurrency": concurrency,
+                "tokens": tokens,
+                "tokens_per_s": tokens / elapsed,
+                "ttft_ms": {"p50": _ms(percentile(ttfts, 50)), "p95": _ms(percentile(ttfts, 95))},
+            })
+            self.Helpers.log_message(
+                self.LogFile, "Benchmark", "INFO",
+                f"concurrency={concurrency} throughput={_fmt(results[-1]['tokens_per_s'])} tokens/s "
+                f"ttft_p95={_fmt(results[-1]['ttft_ms']['p95'])}ms"
+            )
+
+        report = {
+            "meta": self.metadata(),
+            "concurrent_engine": engine.concurrent,
+            "results": results,
+        }
+        return self.write_report(report, output, "concurrency")
+
+    def run_workers(self, output=None):
+        """
+        Measures aggregate generation throughput as the worker pool grows.
+
+        For each configured worker count a WorkerPool is started and worker_requests
+        prompts per worker are sent at once, each in a new conversation. Throughput is
+        the tokens the workers report generating divided by the wall time of the batch.
+        The response cache is disabled so every prompt is generated.
+
+        Args:
+            output (str, optional): The JSON file to write. Defaults to a timestamped file in
+                the configured output path.
+
+        Returns:
+            dict: The benchmark report.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from tools.workers import WorkerPool
+
+        confs = json.loads(json.dumps(self._confs))
+        confs["response_cache"]["enabled"] = False
+        interval = confs["workers"]["stats_interval"]
+        prompts = self._bench["prompts"]
+
+        def ask(pool, prompt):
+            start = time.perf_counter()
+            for _ in pool.query(prompt):
+                pass
+            return time.perf_counter() - start
+
+        results = []
+        for workers in self._bench["worker_counts"]:
+            pool = WorkerPool(confs, workers)
+            try:
+                pool.wait_until_ready()
+                time.sleep(interval * 2)  # Let every worker report its counters after warm-up
+                tokens_before = sum(worker.counters.get("tokens_out", 0) for worker in pool.workers)
+
+                requests = workers * self._bench["worker_requests"]
+                start = time.perf_counter()
+                with ThreadPoolExecutor(requests) as executor:
+                    latencies = list(executor.map(
+                        lambda i: ask(pool, prompts[i % len(prompts)]), range(requests)
+                    ))
+                elapsed = time.perf_counter() - start
+
+                time.sleep(interval * 2)
+                tokens = sum(worker.counters.get("tokens_out", 0) for worker in pool.workers) - tokens_before
+                results.append({
+                    "workers": workers,
+                    "cpus": [worker.cpus for worker in pool.workers],
+                    "requests": requests,
+                    "tokens": tokens,
+                    "tokens_per_s": tokens / elapsed,
+                    "latency_ms": {"p50": _ms(percentile(latencies, 50)), "p95": _ms(percentile(latencies, 95))},
+                })
+            finally:
+                pool.close()
+
+            # Throughput relative to perfect linear scaling from the first worker count
+            per_worker = results[0]["tokens_per_s"] / results[0]["workers"]
+            results[-1]["scaling"] = results[-1]["tokens_per_s"] / (per_worker * workers) if per_worker else None
+            self.Helpers.log_message(
+                self.LogFile, "Benchmark", "INFO",
+                f"workers={workers} throughput={_fmt(results[-1]['tokens_per_s'])} tokens/s "
+                f"scaling={_fmt(results[-1]['scaling'])}"
+            )
+
+        report = {
+            "meta": self.metadata(),
+            "results": results,
+        }
+        return self.write_report(report, output, "workers")
+
+    def write_report(self, report, output=None, suite="bench"):
+        """
+        Writes a benchmark report as JSON.
+
+        Args:
+            report (dict): The benchmark report.
+            output (str, optional): The JSON file to write. Defaults to a timestamped file in
+                the configured output path.
+            suite (str, optional): The suite name used in the default file name. Defaults to "bench".
+
+        Returns:
+            dict: The benchmark report.
+        """
+        if output is None:
+            os.makedirs(self._bench["output_path"], exist_ok=True)
+            output = os.path.join(
+                self._bench["output_path"], f"{suite}-{datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}.json"
+            )
+        with open(output, "w") as report_file:
+            json.dump(report, report_file, indent=4)
+
+        self.Helpers.log_message(
+            self.LogFile, "Benchmark", "INFO", f"Benchmark report written to {output}"
+        )
+        return report
+
+    def summarize(self, results):
+        """
+        Aggregates the results for each conversation length.
+
+        Args:
+            results (list): The per-case results.
+
+        Returns:
+            dict: Median timings keyed by conversation length.
+        """
+        summary = {}
+        for history_length in self._bench["history_lengths"]:
+            cases = [result for result in results if result["history_length"] == history_length]
+            summary[str(history_length)] = {
+                key: percentile([case[key] for case in cases if case.get(key) is not None], 50)
+                for key in (
+                    "prompt_tokens", "window_ms", "tokenize_ms", "ttft_ms", "decode_tokens_per_s", "stop_check_ms",
+                    "tokens_per_pass", "acceptance_rate", "speedup"
+                )
+            }
+        return summary
+
+    def metadata(self):
+        """
+        Describes the run so reports can be compared across commits and machines.
+
+        Returns:
+            dict: The run metadata.
+        """
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "commit": commit,
+            "model": self._confs["llm"]["model_out"],
+            "engine": self._confs["llm"]["engine"],
+            "speculative": self._confs["speculative"]["mode"],
+            "device": self._confs["llm"]["device"],
+            "max_new_tokens": self._bench["max_new_tokens"],
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+        }
+
+def _ms(seconds):
+    """Converts seconds to milliseconds, passing None through."""
+    return None if seconds is None else seconds * 1000
+
+def _fmt(value):
+    """Formats an optional number for logging."""
+    return "n/a" if value is None else f"{value:.1f}"
@@ -0,0 +1,178 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Compaction
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Compaction
+# Description:   Background conversation history compaction for GeniSysAI LLMCore.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+import time
+import queue
+
+from threading import Lock, Thread
+
+class Compactor:
+    """
+    Compactor Class:
+    Summarizes the older turns of long conversations in the background.
+
+    Conversations whose full history templates to more than threshold_tokens are queued
+    by LLMCore.query. A single worker thread waits until no query has run for
+    idle_seconds, then has the model summarize the oldest turns, keeping the newest
+    keep_messages untouched. The summary replaces those turns in History as one system
+    message, so later prompts stay within the input budget without losing the context.
+    """
+
+    def __init__(self, core, confs):
+        """
+        Initializes the Compactor and starts its worker thread.
+
+        Args:
+            core (LLMCore): The core whose conversations are compacted.
+            confs (dict): Configuration dictionary containing the "compaction" settings.
+        """
+        self.core = core
+        self._confs = confs["compaction"]
+        self._max_input_tokens = confs["llm"]["max_input_tokens"]
+
+        self.jobs = queue.Queue()
+        self.pending = set()  # Conversations queued or being compacted
+        self.compactions = 0
+        self.saved_tokens = 0
+        self._lock = Lock()
+
+        Thread(target=self._run, name="Compactor", daemon=True).start()
+
+    def needs_compaction(self, total_tokens: int) -> bool:
+        """
+        Returns whether a conversation is long enough to compact.
+
+        Args:
+            total_tokens (int): The tokens the whole conversation templates to.
+
+        Returns:
+            bool: True past the configured threshold.
+        """
+        return total_tokens > self._confs["threshold_tokens"]
+
+    def schedule(self, conversation_id: str):
+        """
+        Queues a conversation for compaction, unless it is already queued.
+
+        Args:
+            conversation_id (str): The conversation to compact.
+        """
+        with self._lock:
+            if conversation_id in self.pending:
+                return
+            self.pending.add(conversation_id)
+        self.jobs.put(conversation_id)
+
+    def stats(self) -> dict:
+        """
+        Returns the compaction counters.
+
+        Returns:
+            dict: The number of compactions, queued conversations and prompt tokens saved.
+        """
+        return {
+            "compactions": self.compactions,
+            "queued": len(self.pending),
+            "saved_tokens": self.saved_tokens,
+        }
+
+    def compact(self, conversation_id: str):
+        """
+        Summarizes the oldest turns of a conversation and stores the summary in History.
+
+        Args:
+            conversation_id (str): The conversation to compact.
+        """
+        core = self.core
+        history = core.History.get_history(conversation_id)
+        candidates = history[:-self._confs["keep_messages"]] if self._confs["keep_messages"] else history
+
+        # Summarize as many of the oldest messages as fit in one prompt
+        budget = self._max_input_tokens - self._confs["summary_max_tokens"]
+        messages, tokens = [], 0
+        for message in candidates:
+            cost = core.ContextBuilder.count_message_tokens(core.system_prompt, message)
+            if messages and tokens + cost > budget:
+                break
+            messages.append(message)
+            tokens += cost
+        if len(messages) < 2:
+            return
+
+        transcript = "\n\n".join(f"{message.role}: {message.content}" for message in messages)
+        input_ids = core.Model.convert_history_to_token([
+            {"role": "system", "content": self._confs["prompt"]},
+            {"role": "user", "content": transcript},
+        ])
+        with core.generation_lock:
+            result = core.Model.engine.generate(
+                input_ids, None, core.stop_token_ids, stop_matcher=core.stop_matcher,
+                max_new_tokens=self._confs["summary_max_tokens"], do_sample=False
+            )
+        summary = core.Model.llm_tokenizer.decode(result.token_ids, skip_special_tokens=True).strip()
+        if not summary:
+            return
+
+        summary_message = core.History.compact(
+            conversation_id, messages, f"Earlier conversation summary: {summary}"
+        )
+        if summary_message is None:
+            return  # The conversation changed while the summary was generated
+
+        saved = tokens - core.ContextBuilder.count_message_tokens(core.system_prompt, summary_message)
+        self.compactions += 1
+        self.saved_tokens += saved
+        core.Helpers.log_message(
+            core.LogFile, "Compaction", "INFO",
+            f"Compacted {len(messages)} messages ({tokens} tokens) of conversation {conversation_id}, "
+            f"saving {saved} prompt tokens per turn", True
+        )
+
+    def _run(self):
+        """
+        Compacts queued conversations whenever the model is idle.
+        """
+        while True:
+            conversation_id = self.jobs.get()
+            try:
+                self.core.wait_until_ready()
+                while (self.core.generation_lock.locked()
+                       or time.monotonic() - self.core.last_activity < self._confs["idle_seconds"]):
+                    time.sleep(self._confs["idle_seconds"])
+                self.compact(conversation_id)
+            except Exception as e:
+                self.core.Helpers.log_message(
+                    self.core.LogFile, "Compaction", "ERROR", f"Could not compact {conversation_id}: {str(e)}"
+                )
+            finally:
+                with self._lock:
+                    self.pending.discard(conversation_id)
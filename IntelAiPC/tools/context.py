@@ -0,0 +1,144 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Context
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Context
+# Description:   Class to build token-budgeted context windows for GeniSysAI LLMCore.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+from bisect import bisect_right
+from itertools import accumulate
+
+class ContextWindow:
+    """
+    The result of building a context window.
+
+    Attributes:
+        messages (list): The system prompt followed by the selected history messages,
+            as plain role/content dictionaries ready for the chat template.
+        tokens (int): The number of prompt tokens the window templates to.
+        dropped_messages (int): The number of older history messages left out of the window.
+        dropped_tokens (int): The number of tokens those messages would have added.
+    """
+    __slots__ = ("messages", "tokens", "dropped_messages", "dropped_tokens")
+
+    def __init__(self, messages, tokens, dropped_messages, dropped_tokens):
+        self.messages = messages
+        self.tokens = tokens
+        self.dropped_messages = dropped_messages
+        self.dropped_tokens = dropped_tokens
+
+class ContextBuilder:
+    """
+    ContextBuilder Class:
+    Selects the newest history messages that fit within the model's token budget.
+
+    Every message is templated once per model and its token cost is cached on the
+    message itself, in its token_counts under the model path, so models with different
+    tokenizers keep separate counts. The window is then chosen in a single pass over the
+    suffix sums of those costs, instead of re-templating the whole candidate window for
+    every older message.
+    """
+
+    def __init__(self, model):
+        """
+        Initializes the ContextBuilder.
+
+        Args:
+            model (Model): The loaded Model whose tokenizer is used for templating.
+        """
+        self.Model = model
+        self._base_tokens = {}  # System prompt text -> templated token count
+
+    def count_base_tokens(self, system_prompt: list) -> int:
+        """
+        Counts the tokens the system prompt and generation prompt template to on their own.
+
+        Args:
+            system_prompt (list): The system prompt as a list of role/content dictionaries.
+
+        Returns:
+            int: The number of tokens in the templated system prompt.
+        """
+        key = tuple(message["content"] for message in system_prompt)
+        if key not in self._base_tokens:
+            self._base_tokens[key] = self.Model.convert_history_to_token(system_prompt).shape[1]
+        return self._base_tokens[key]
+
+    def count_message_tokens(self, system_prompt: list, message) -> int:
+        """
+        Returns the number of tokens a history message adds to the templated prompt.
+
+        The count is computed once per model and cached on the message.
+
+        Args:
+            system_prompt (list): The system prompt as a list of role/content dictionaries.
+            message (Message): The history message.
+
+        Returns:
+            int: The token cost of the message.
+        """
+        count = message.token_counts.get(self.Model.model_path)
+        if count is None:
+            input_ids = self.Model.convert_history_to_token(system_prompt + [message.to_dict()])
+            count = input_ids.shape[1] - self.count_base_tokens(system_prompt)
+            message.token_counts[self.Model.model_path] = count
+        return count
+
+    def build(self, system_prompt: list, history: list, max_tokens: int) -> ContextWindow:
+        """
+        Builds the context window for the next generation.
+
+        The latest message is always included. Older messages are added newest first for
+        as long as the templated prompt stays within max_tokens.
+
+        Args:
+            system_prompt (list): The system prompt as a list of role/content dictionaries.
+            history (list): The conversation history as Message records, oldest first.
+            max_tokens (int): The maximum number of prompt tokens.
+
+        Returns:
+            ContextWindow: The selected messages and token accounting for the window.
+        """
+        base = self.count_base_tokens(system_prompt)
+        if not history:
+            return ContextWindow(list(system_prompt), base, 0, 0)
+
+        costs = [self.count_message_tokens(system_prompt, message) for message in history]
+
+        # suffix[k - 1] is the token cost of the newest k messages
+        suffix = list(accumulate(reversed(costs)))
+        keep = max(1, bisect_right(suffix, max_tokens - base))
+
+        window = history[-keep:]
+        messages = list(system_prompt) + [message.to_dict() for message in window]
+        return ContextWindow(
+            messages,
+            base + suffix[keep - 1],
+            len(history) - keep,
+            suffix[-1] - suffix[keep - 1]
+        )
@@ -0,0 +1,358 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Exporter
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Exporter
+# Description:   Exports and compares quantized OpenVINO variants of a model for GeniSysAI LLMCore.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import subprocess
+import multiprocessing
+
+from tools.benchmark import Benchmark, peak_rss_mb, percentile, time_generation
+from tools.helpers import Helpers
+
+WEIGHT_FORMATS = ("int4", "int8", "fp16")
+
+def variant_name(variant: dict) -> str:
+    """
+    Returns the folder suffix describing a variant's export settings.
+
+    Args:
+        variant (dict): The weight_format and, for int4 and int8, the sym, group_size and ratio settings.
+
+    Returns:
+        str: The suffix, such as "INT4-ASYM-G64-R1.0".
+    """
+    parts = [variant["weight_format"].upper()]
+    if variant["weight_format"] != "fp16":
+        parts.append("SYM" if variant.get("sym") else "ASYM")
+    if variant["weight_format"] == "int4":
+        parts.append(f"G{variant.get('group_size', 128)}")
+        parts.append(f"R{float(variant.get('ratio', 1.0))}")
+    return "-".join(parts)
+
+def export_command(model_id: str, task: str, variant: dict, out: str) -> list:
+    """
+    Returns the optimum-cli command that exports a variant.
+
+    optimum-cli runs under the current interpreter, so the export uses the same
+    environment as LLMCore on every platform.
+
+    Args:
+        model_id (str): The Hugging Face model ID or local model folder.
+        task (str): The export task.
+        variant (dict): The export settings.
+        out (str): The folder to export to.
+
+    Returns:
+        list: The command arguments.
+    """
+    command = [
+        sys.executable, "-m", "optimum.commands.optimum_cli", "export", "openvino",
+        "--model", model_id,
+        "--task", task,
+        "--weight-format", variant["weight_format"],
+    ]
+    if variant["weight_format"] != "fp16" and variant.get("sym"):
+        command.append("--sym")
+    if variant["weight_format"] == "int4":
+        command += ["--group-size", str(variant.get("group_size", 128)), "--ratio", str(variant.get("ratio", 1.0))]
+    command.append(out)
+    return command
+
+def perplexity(model, text: str, window: int, max_tokens: int) -> float:
+    """
+    Returns the perplexity of a model on a text.
+
+    The text is scored in consecutive windows of up to window tokens, each starting from
+    an empty context.
+
+    Args:
+        model (Model): A model loaded on the optimum engine.
+        text (str): The text.
+        window (int): The tokens scored per forward pass.
+        max_tokens (int): The maximum number of tokens of the text scored.
+
+    Returns:
+        float: The perplexity.
+    """
+    import torch
+
+    token_ids = model.llm_tokenizer(text, return_tensors="pt").input_ids[0][:max_tokens]
+    nll, count = 0.0, 0
+    with torch.no_grad():
+        for start in range(0, len(token_ids), window):
+            chunk = token_ids[start:start + window].unsqueeze(0)
+            if chunk.shape[1] < 2:
+                break
+            logits = model.llm(input_ids=chunk, attention_mask=torch.ones_like(chunk)).logits
+            log_probs = torch.log_softmax(logits[0, :-1].float(), dim=-1)
+            nll -= log_probs.gather(1, chunk[0, 1:].unsqueeze(1)).sum().item()
+            count += chunk.shape[1] - 1
+    if not count:
+        raise ValueError("The perplexity text is too short to score")
+    return math.exp(nll / count)
+
+def measure_variant(confs: dict) -> dict:
+    """
+    Loads an exported variant and measures its speed, memory and quality.
+
+    Runs in a fresh process per variant, so the load time and memory of one variant are
+    not affected by the variants measured before it.
+
+    Args:
+        confs (dict): The configuration, with "llm" set to the variant.
+
+    Returns:
+        dict: The load time, time to first token, decode tokens per second, peak RSS and
+            perplexity, or the error that prevented the variant from running.
+    """
+    # Heavy dependencies are imported here rather than at startup
+    from tools.model import Model
+
+    export = confs["export"]
+    try:
+        start = time.perf_counter()
+        model = Model(confs)
+        model.load_model_definition()
+        model.load_config()
+        model.load_tokenizer()
+        model.load_model()
+        model.compile_model()
+        load_time = time.perf_counter() - start
+        if model.llm is None or model.llm_tokenizer is None:
+            raise RuntimeError(f"Could not load {model.model_path}")
+        load_rss = peak_rss_mb()
+
+        model.warm_up(confs["warmup"]["prompt"], confs["warmup"]["max_new_tokens"])
+        ttfts, rates = time_generation(
+            model, confs["llm"]["system"], confs["bench"]["prompts"], export["repeats"], export["max_new_tokens"]
+        )
+        if not ttfts or not rates:
+            raise RuntimeError("Too few tokens were generated to time")
+
+        with open(export["perplexity_text"], "r", encoding="utf-8") as text_file:
+            text = text_file.read()
+        score = perplexity(model, text, export["perplexity_window"], export["perplexity_max_tokens"])
+        return {
+            "load_s": load_time,
+            "ttft_ms": percentile(ttfts, 50) * 1000,
+            "decode_tokens_per_s": percentile(rates, 50),
+            "load_rss_mb": load_rss,
+            "peak_rss_mb": peak_rss_mb(),
+            "perplexity": score,
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+class Exporter:
+    """
+    Exporter Class:
+    Exports a Hugging Face model to OpenVINO IR in several weight formats and picks the
+    fastest variant that keeps its quality.
+
+    Each variant in the "export" configuration is exported with optimum-cli to a folder
+    under llm.model_path named after the model and its settings, and gets a model
+    definition in the registry's definitions folder, so it can be served by name or set
+    as the default model. Variants already exported are not exported again.
+
+    Each variant is then loaded on the export device, the CPU by default, with the
+    optimum engine in a fresh process. The report records its load time, time to first
+    token, decode tokens per second, peak RSS, size on disk and perplexity on a local
+    text file. Quality is judged against
+    the lowest perplexity measured, normally the fp16 variant. The recommended variant
+    is the fastest to decode whose perplexity is within max_perplexity_increase of it.
+    """
+
+    def __init__(self, confs):
+        """
+        Initializes the Exporter.
+
+        Args:
+            confs (dict): The loaded configuration.
+        """
+        self._confs = confs
+        self._export = confs["export"]
+        self.Helpers = Helpers()
+        self.LogFile = self.Helpers.set_log_dir(f"{confs['llm']['logs_path']}llm/")
+        self.Benchmark = Benchmark(None, confs)
+
+    def run(self, output=None) -> dict:
+        """
+        Exports every variant, measures them and writes the comparison report.
+
+        Args:
+            output (str, optional): The JSON report to write. Defaults to a timestamped file in
+                the benchmark output path.
+
+        Returns:
+            dict: The comparison report.
+
+        Raises:
+            ValueError: If a variant has an unknown weight format.
+            FileNotFoundError: If the perplexity text does not exist.
+        """
+        for variant in self._export["variants"]:
+            if variant["weight_format"] not in WEIGHT_FORMATS:
+                raise ValueError(f"Unknown weight format '{variant['weight_format']}', use one of {WEIGHT_FORMATS}")
+        if not os.path.exists(self._export["perplexity_text"]):
+            raise FileNotFoundError(f"The perplexity text {self._export['perplexity_text']} does not exist")
+
+        results = []
+        for variant in self._export["variants"]:
+            result = {"settings": variant, "model_out": f"{self._export['name']}-{variant_name(variant)}"}
+            try:
+                result["definition"] = self.export(variant, result["model_out"])
+            except Exception as e:
+                result["error"] = str(e)
+            else:
+                result.update(self.measure(result["model_out"], result["definition"]))
+            self.log_result(result)
+            results.append(result)
+
+        measured = [result for result in results if "error" not in result]
+        reference = min((result["perplexity"] for result in measured), default=None)
+        for result in measured:
+            result["perplexity_increase"] = result["perplexity"] / reference - 1
+            result["meets_quality_bar"] = result["perplexity_increase"] <= self._export["max_perplexity_increase"]
+        passing = [result for result in measured if result["meets_quality_bar"]]
+        best = max(passing, key=lambda result: result["decode_tokens_per_s"], default=None)
+
+        if best is not None:
+            self.Helpers.log_message(
+                self.LogFile, "Export", "INFO",
+                f"Recommended {best['model_out']} ({best['definition']}): "
+                f"{best['decode_tokens_per_s']:.1f} tokens/s, perplexity {best['perplexity']:.2f}"
+            )
+        else:
+            self.Helpers.log_message(self.LogFile, "Export", "ERROR", "No variant met the quality bar")
+
+        report = {
+            "meta": dict(self.Benchmark.metadata(), model=self._export["model_id"], device=self._export["device"]),
+            "perplexity_text": self._export["perplexity_text"],
+            "reference_perplexity": reference,
+            "max_perplexity_increase": self._export["max_perplexity_increase"],
+            "recommended": best["model_out"] if best is not None else None,
+            "variants": results,
+        }
+        return self.Benchmark.write_report(report, output, "export")
+
+    def export(self, variant: dict, model_out: str) -> str:
+        """
+        Exports a variant, if not already exported, and writes its model definition.
+
+        Args:
+            variant (dict): The export settings.
+            model_out (str): The folder name of the variant under llm.model_path.
+
+        Returns:
+            str: The path of the variant's model definition.
+
+        Raises:
+            RuntimeError: If optimum-cli fails.
+        """
+        out = os.path.join(self._confs["llm"]["model_path"], model_out)
+        if not os.path.isdir(out):
+            self.Helpers.log_message(self.LogFile, "Export", "INFO", f"Exporting {model_out}")
+            start = time.perf_counter()
+            temp_out = f"{out}.tmp"
+            shutil.rmtree(temp_out, ignore_errors=True)  # Left by an interrupted export
+            process = subprocess.run(
+                export_command(self._export["model_id"], self._export["task"], variant, temp_out),
+                capture_output=True, text=True
+            )
+            if process.returncode != 0:
+                raise RuntimeError(f"optimum-cli failed: {process.stderr.strip()[-500:]}")
+            os.replace(temp_out, out)
+            self.Helpers.log_message(
+                self.LogFile, "Export", "INFO", f"Exported {model_out} in {time.perf_counter() - start:.1f}s"
+            )
+
+        with open(self._export["definition"], "r") as def_file:
+            definition = json.load(def_file)
+        definition["model_id"] = self._export["model_id"]
+        definition["model_out"] = model_out
+        definition["export"] = variant
+
+        path = os.path.join(self._confs["registry"]["definitions_path"], f"{model_out.lower()}.json")
+        with open(path, "w") as def_file:
+            json.dump(definition, def_file, indent=4)
+        return path
+
+    def measure(self, model_out: str, definition: str) -> dict:
+        """
+        Measures an exported variant in a fresh process.
+
+        Args:
+            model_out (str): The folder name of the variant under llm.model_path.
+            definition (str): The path of the variant's model definition.
+
+        Returns:
+            dict: The measurements, with the variant's size on disk.
+        """
+        confs = json.loads(json.dumps(self._confs))
+        confs["llm"]["model_out"] = model_out
+        confs["llm"]["model_definition_json"] = definition
+        confs["llm"]["device"] = self._export["device"]
+        confs["llm"]["engine"] = "optimum"  # Perplexity needs the logits
+        confs["openvino"]["use_profile"] = False
+        confs["speculative"]["mode"] = None
+        confs["kv_cache"]["enabled"] = False
+
+        # Spawned rather than forked, as OpenVINO's thread pools do not survive a fork
+        with multiprocessing.get_context("spawn").Pool(1) as pool:
+            result = pool.apply(measure_variant, (confs,))
+
+        out = os.path.join(self._confs["llm"]["model_path"], model_out)
+        result["size_mb"] = sum(
+            os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(out) for name in names
+        ) / (1024 * 1024)
+        return result
+
+    def log_result(self, result: dict):
+        """
+        Logs the measurements of a variant.
+
+        Args:
+            result (dict): The variant's result.
+        """
+        if "error" in result:
+            message = f"{result['model_out']}: failed ({result['error']})"
+        else:
+            message = (
+                f"{result['model_out']}: load {result['load_s']:.1f}s, ttft {result['ttft_ms']:.1f}ms, "
+                f"decode {result['decode_tokens_per_s']:.1f} tokens/s, peak RSS {result['peak_rss_mb'] or 0:.0f}MB, "
+                f"{result['size_mb']:.0f}MB, perplexity {result['perplexity']:.2f}"
+            )
+        self.Helpers.log_message(self.LogFile, "Export", "INFO", message)
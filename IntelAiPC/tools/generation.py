@@ -0,0 +1,285 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Generation
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Generation
+# Description:   Cancellable generation worker for GeniSysAI LLMCore.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+import time
+import queue
+
+from contextlib import nullcontext
+from threading import Event, Lock, Thread
+
+class CancelToken:
+    """
+    CancelToken Class:
+    Tells a generation to stop, on request or once a deadline passes.
+
+    Engines call check() on every decode step and stop generating as soon as it returns
+    True. A deadline limits the total time of a request from its creation; a first token
+    deadline limits how long it may wait before generating its first token.
+    """
+    __slots__ = ("created", "deadline", "first_token_deadline", "reason", "cancelled_at", "first_token_at")
+
+    def __init__(self, deadline=None, first_token_deadline=None):
+        """
+        Initializes the CancelToken.
+
+        Args:
+            deadline (float, optional): The seconds the whole request may take. Defaults to no limit.
+            first_token_deadline (float, optional): The seconds the request may wait for its
+                first token. Defaults to no limit.
+        """
+        self.created = time.perf_counter()
+        self.deadline = self.created + deadline if deadline else None
+        self.first_token_deadline = self.created + first_token_deadline if first_token_deadline else None
+        self.reason = None
+        self.cancelled_at = None
+        self.first_token_at = None
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        bool: Whether the generation has been told to stop.
+        """
+        return self.reason is not None
+
+    def cancel(self, reason: str = "cancelled"):
+        """
+        Tells the generation to stop. Only the first reason given is kept.
+
+        Args:
+            reason (str, optional): Why the generation was stopped. Defaults to "cancelled".
+        """
+        if self.reason is None:
+            self.cancelled_at = time.perf_counter()
+            self.reason = reason
+
+    def first_token(self):
+        """
+        Records that the first token has been generated.
+        """
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def check(self) -> bool:
+        """
+        Returns whether the generation should stop, cancelling it if a deadline has passed.
+
+        Returns:
+            bool: True once the generation has been cancelled.
+        """
+        if self.reason is None and (self.deadline is not None or self.first_token_deadline is not None):
+            now = time.perf_counter()
+            if self.deadline is not None and now > self.deadline:
+                self.cancel("deadline")
+            elif self.first_token_at is None and self.first_token_deadline is not None and now > self.first_token_deadline:
+                self.cancel("first_token_deadline")
+        return self.reason is not None
+
+class _FirstTokenWatch:
+    """
+    Wraps a Hugging Face streamer to tell a CancelToken when the first token arrives.
+    """
+    __slots__ = ("streamer", "cancel", "_prompt_seen")
+
+    def __init__(self, streamer, cancel):
+        self.streamer = streamer
+        self.cancel = cancel
+        self._prompt_seen = False
+
+    def put(self, value):
+        if self._prompt_seen:
+            self.cancel.first_token()
+        self._prompt_seen = True
+        if self.streamer is not None:
+            self.streamer.put(value)
+
+    def end(self):
+        if self.streamer is not None:
+            self.streamer.end()
+
+class GenerationJob:
+    """
+    A generation queued on the GenerationWorker.
+
+    Attributes:
+        result (GenerationResult): The generated tokens, once finished.
+        error (Exception): The error that ended the generation, or None.
+        done (Event): Set once the generation has finished, failed or been skipped.
+    """
+    __slots__ = ("slot", "input_ids", "streamer", "conversation_id", "cancel", "callback", "overrides", "result",
+                 "error", "done")
+
+    def __init__(self, slot, input_ids, streamer, conversation_id, cancel, callback, overrides):
+        self.slot = slot
+        self.input_ids = input_ids
+        self.streamer = streamer
+        self.conversation_id = conversation_id
+        self.cancel = cancel
+        self.callback = callback
+        self.overrides = overrides
+        self.result = None
+        self.error = None
+        self.done = Event()
+
+class _Lane:
+    """
+    The queue and threads that run the jobs of one model.
+    """
+    __slots__ = ("jobs", "threads")
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.threads = 0
+
+class GenerationWorker:
+    """
+    GenerationWorker Class:
+    Runs generations on long-lived threads, taking them from a queue per model.
+
+    Each model gets its own queue and threads, keyed by its generation lock, so a
+    backlog on one model never holds up another. Models that generate one request at
+    a time get one thread; models on concurrent engines get as many threads as they
+    can run sequences at once. A job whose CancelToken is cancelled, or whose deadline
+    passes, while it waits is skipped without touching the model; once running, the
+    engine checks the token on every decode step. The time from cancel() to the engine
+    returning is recorded in the "cancel_latency" histogram.
+    """
+
+    def __init__(self, metrics, threads=1):
+        """
+        Initializes the GenerationWorker.
+
+        Args:
+            metrics (Metrics): Receives the cancellation counters and latencies.
+            threads (int, optional): The number of generation threads for each model on a
+                concurrent engine. Defaults to 1.
+        """
+        self.Metrics = metrics
+        self.threads = threads
+        self.lanes = {}  # Generation lock -> _Lane
+        self._started = 0
+        self._lock = Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        int: The number of jobs waiting across every model.
+        """
+        with self._lock:
+            return sum(lane.jobs.qsize() for lane in self.lanes.values())
+
+    def ensure_threads(self, threads: int):
+        """
+        Raises the number of generation threads for each model on a concurrent engine.
+
+        Models gain the extra threads when their next job is queued.
+
+        Args:
+            threads (int): The number of threads needed.
+        """
+        with self._lock:
+            self.threads = max(self.threads, threads)
+
+    def _lane(self, slot) -> _Lane:
+        """
+        Returns the queue of a model, starting the threads it needs.
+        """
+        threads = self.threads if slot.Model.engine.concurrent else 1
+        with self._lock:
+            lane = self.lanes.get(slot.generation_lock)
+            if lane is None:
+                lane = self.lanes[slot.generation_lock] = _Lane()
+            while lane.threads < threads:
+                lane.threads += 1
+                self._started += 1
+                Thread(
+                    target=self._run, args=(lane,), name=f"GenerationWorker-{self._started}", daemon=True
+                ).start()
+        return lane
+
+    def submit(self, slot, input_ids, streamer=None, conversation_id=None, cancel=None, callback=None,
+               overrides=None) -> GenerationJob:
+        """
+        Queues a generation.
+
+        Args:
+            slot (ModelSlot): The model to generate on. The core itself serves the default model.
+            input_ids (torch.Tensor): The prompt token IDs, shaped (1, length).
+            streamer (optional): Receives the generated tokens as they are produced.
+            conversation_id (str, optional): The conversation being generated for.
+            cancel (CancelToken, optional): Stops the generation when cancelled.
+            callback (callable, optional): Called with the job on the worker thread once it finishes.
+            overrides (dict, optional): Generation settings replacing the engine's configured ones.
+
+        Returns:
+            GenerationJob: The job, whose done event is set when it finishes.
+        """
+        job = GenerationJob(slot, input_ids, streamer, conversation_id, cancel or CancelToken(), callback, overrides or {})
+        self._lane(slot).jobs.put(job)
+        return job
+
+    def run(self, job: GenerationJob):
+        """
+        Runs a job on the calling thread.
+
+        Args:
+            job (GenerationJob): The job.
+        """
+        try:
+            engine = job.slot.Model.engine
+            with nullcontext() if engine.concurrent else job.slot.generation_lock:
+                # A job cancelled, or past a deadline, while it waited never starts
+                if not job.cancel.check():
+                    job.result = engine.generate(
+                        job.input_ids, _FirstTokenWatch(job.streamer, job.cancel), job.slot.stop_token_ids,
+                        job.conversation_id, cancel=job.cancel, stop_matcher=job.slot.stop_matcher, **job.overrides
+                    )
+        except Exception as e:
+            job.error = e
+        finally:
+            if job.result is None and job.streamer is not None:
+                job.streamer.end()
+            if job.cancel.cancelled:
+                self.Metrics.inc(f"cancelled_{job.cancel.reason}")
+                self.Metrics.observe("cancel_latency", time.perf_counter() - job.cancel.cancelled_at)
+            if job.callback is not None:
+                try:
+                    job.callback(job)
+                except Exception:
+                    pass  # A failing callback must not stop the worker thread
+            job.done.set()
+
+    def _run(self, lane: _Lane):
+        """
+        Runs a model's queued jobs forever.
+        """
+        while True:
+            self.run(lane.jobs.get())
@@ -35,6 +35,8 @@ import time
 import json
 from datetime import datetime
 
+from tools.logsink import get_sink
+
 class Helpers:
 
     def __init__(self):
@@ -89,12 +91,29 @@ class Helpers:
         timestamp = datetime.now().strftime('%Y-%m-%d-%H')
         return os.path.join(path, f"{timestamp}.txt")
 
+    def set_log_dir(self, path):
+        """
+        Generates a rotating log target for a directory.
+
+        Messages logged to the target are written to the directory's file for the hour in
+        which they are written.
+
+        Args:
+            path (str): Directory path for the log files.
+
+        Returns:
+            str: The directory path, ending in a separator.
+        """
+        return os.path.join(path, "")
+
     def log_message(self, logfile, process, message_type, message, hide=False):
         """
         Logs a message to a log file and optionally prints it to the console.
 
+        The message is handed to the background log sink, which writes it in a batch.
+
         Args:
-            logfile (str): Path to the log file.
+            logfile (str): Path to the log file, or a rotating target from set_log_dir.
             process (str): Process name or identifier.
             message_type (str): Type of message (e.g., INFO, ERROR).
             message (str): Message content to log.
@@ -102,7 +121,6 @@ class Helpers:
         """
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         log_entry = f"{timestamp}|{process}|{message_type}: {message}"
-        with open(logfile, "a") as log_file:
-            log_file.write(log_entry + '\n')
+        get_sink().write(logfile, log_entry)
         if not hide:
             print(log_entry)
\ No newline at end of file
@@ -1,19 +1,103 @@
+import os
+import re
 import uuid
 import json
 
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Event, Lock
+
+from tools.logsink import get_sink
+
+# Conversation IDs name log files and are echoed in headers, so only safe characters are accepted
+CONVERSATION_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+def valid_conversation_id(conversation_id) -> bool:
+    """
+    Returns whether a conversation ID is safe to use.
+
+    Args:
+        conversation_id: The ID given by a client.
+
+    Returns:
+        bool: True for 1 to 64 letters, digits, hyphens and underscores, such as a UUID.
+    """
+    return isinstance(conversation_id, str) and CONVERSATION_ID.fullmatch(conversation_id) is not None
+
+class Message:
+    """
+    A single chat message.
+
+    The token counts are filled in by the ContextBuilder of each model the first time
+    the message is considered for that model's context window, and kept for later turns.
+    """
+    __slots__ = ("role", "content", "token_counts")
+
+    # Approximate fixed cost of a message object, used for the memory cap
+    OVERHEAD_BYTES = 120
+
+    def __init__(self, role: str, content: str):
+        self.role = role
+        self.content = content
+        self.token_counts = {}  # Model path -> token count
+
+    @property
+    def nbytes(self) -> int:
+        """
+        int: The approximate memory held by the message.
+        """
+        return self.OVERHEAD_BYTES + len(self.content)
+
+    def to_dict(self) -> dict:
+        """
+        Returns the message as a role/content dictionary.
+        """
+        return {"role": self.role, "content": self.content}
+
 class History:
     """
     Manages LLM chat history with user tracking using UUID.
-    
-    Chat history follows the structure:
-    [{"role": "system", "content": "message"}, {"role": "user", "content": "message"}]
+
+    Chat history is a list of Message records, oldest first. Every message is also
+    written to a ConversationStore when one is given, or otherwise appended to
+    logs/chat/<conversation_id>.json, one JSON object per line. When older messages are
+    compacted into a summary, the compaction is recorded so the conversation is rebuilt
+    in its compacted form.
+
+    Conversations are kept in memory up to a cap on the total number of messages and
+    their approximate size. Past the cap, the least recently used conversations are
+    evicted and rebuilt from the store or their log the next time they are addressed,
+    including after a restart. A conversation that only has a log is copied into the
+    store the first time it is rebuilt. Rebuilding reads the store or the log without
+    holding the lock, so other conversations are not held up; threads that need the
+    same conversation meanwhile wait for the one rebuilding it.
     """
 
-    def __init__(self):
+    def __init__(self, max_messages: int = None, max_bytes: int = None, logs_path: str = "logs/chat/", store=None):
         """
-        Initializes the History with an empty dictionary for user chat history.
+        Initializes the History with an empty store for user chat history.
+
+        Args:
+            max_messages (int, optional): The maximum number of messages kept in memory. Defaults to no limit.
+            max_bytes (int, optional): The maximum approximate size of the messages kept in memory. Defaults to no limit.
+            logs_path (str, optional): The directory conversation logs are written to. Defaults to "logs/chat/".
+            store (ConversationStore, optional): The durable store. Defaults to the JSON logs.
         """
-        self.user_histories = {}
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.logs_path = logs_path
+        self.store = store
+
+        self.user_histories = OrderedDict()  # Least recently used first
+        self.messages = 0
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._evicted = set()  # Evicted conversations whose logs may still be queued
+        self._loading = {}  # Conversation ID -> Event set once it has been rebuilt
+        self._clears = 0  # Cleared conversations, so a rebuild that raced a clear is redone
+        self._lock = Lock()
 
     def generate_conversation_id(self) -> str:
         """
@@ -40,38 +124,146 @@ class History:
         if role not in allowed_roles:
             raise ValueError(f"Invalid role '{role}'. Allowed roles are: {allowed_roles}")
 
-        if conversation_id not in self.user_histories:
-            self.user_histories[conversation_id] = []
+        message = Message(role, content)
+        with self._loaded(conversation_id) as history:
+            history.append(message)
+            self.messages += 1
+            self.nbytes += message.nbytes
+            self._evict()
 
-        self.user_histories[conversation_id].append({"role": role, "content": content})
+        self.log_message(conversation_id, message.to_dict())
 
-        self.log_message(conversation_id, {"role": role, "content": content})
+    def compact(self, conversation_id: str, messages: list, summary: str) -> Message:
+        """
+        Replaces the oldest messages of a conversation with a summary system message.
+
+        Args:
+            conversation_id (str): The unique user ID.
+            messages (list): The summarized Message records, which must still be the
+                oldest messages of the conversation.
+            summary (str): The summary text.
+
+        Returns:
+            Message: The summary message, or None if the conversation has changed.
+        """
+        summary_message = Message("system", summary)
+        with self._loaded(conversation_id) as history:
+            count = len(messages)
+            if len(history) < count or any(a is not b for a, b in zip(history, messages)):
+                return None
+            history[:count] = [summary_message]
+            self.messages += 1 - count
+            self.nbytes += summary_message.nbytes - sum(message.nbytes for message in messages)
+
+        self.log_message(conversation_id, {"role": "compaction", "content": summary, "replaces": count})
+        return summary_message
 
     def log_message(self, user_id, chat_data):
         """
         Appends the chat log data to the specified log file, using user ID and path.
-        
+
         Args:
             user_id (str): The user ID (used as the file name).
             chat_data (dict): Dictionary containing 'role' and 'content' of the chat log.
         """
-        if user_id and chat_data:
+        if user_id and chat_data and self.store is not None:
+            if chat_data.get("role") == "compaction":
+                self.store.compact(user_id, chat_data["content"], chat_data["replaces"])
+            elif chat_data.get("role") == "clear":
+                self.store.clear(user_id)
+            else:
+                self.store.append(user_id, chat_data.get("role", ""), chat_data.get("content", ""))
+        elif user_id and chat_data:
             # Ensure we have the necessary data in the chat_data
             chat_entry = {
                 "role": chat_data.get("role", ""),
                 "content": chat_data.get("content", "")
             }
-            
+            if "replaces" in chat_data:
+                chat_entry["replaces"] = chat_data["replaces"]
+
             # Define the file path using user_id as the file name
-            file_path = f"logs/chat/{user_id}.json"
-            
-            # Append the chat log as a new entry in the JSON file
-            try:
-                with open(file_path, "a") as log_file:
-                    log_file.write(json.dumps(chat_entry) + '\n')
-            except Exception as e:
-                print(f"Error appending to the log file: {e}")
-                
+            file_path = self.log_path(user_id)
+
+            # Append the chat log as a new entry in the JSON file, waiting for
+            # space in the log queue rather than dropping conversation history
+            get_sink().write(file_path, json.dumps(chat_entry), block=True)
+
+    def log_path(self, conversation_id: str) -> str:
+        """
+        Returns the log file of a conversation.
+
+        Args:
+            conversation_id (str): The unique user ID.
+
+        Returns:
+            str: The path of the conversation's JSON lines log.
+
+        Raises:
+            ValueError: If the ID could name a file outside the logs folder.
+        """
+        if not valid_conversation_id(conversation_id):
+            raise ValueError(f"Invalid conversation ID {conversation_id!r}")
+        return os.path.join(self.logs_path, f"{conversation_id}.json")
+
+    def has_conversation(self, conversation_id: str) -> bool:
+        """
+        Returns whether a conversation has any history, in memory, in the store or in a log.
+
+        Args:
+            conversation_id (str): The unique user ID.
+
+        Returns:
+            bool: True if the conversation can be resumed.
+        """
+        if not valid_conversation_id(conversation_id):
+            return False
+        with self._lock:
+            if self.user_histories.get(conversation_id):
+                return True
+        if self.store is not None and self.store.exists(conversation_id):
+            return True
+        return os.path.exists(self.log_path(conversation_id))
+
+    def list_conversations(self, limit: int = None) -> list:
+        """
+        Lists the stored conversations, most recently updated first.
+
+        Args:
+            limit (int, optional): The maximum number of conversations. Defaults to all.
+
+        Returns:
+            list: Dicts with the ID, the created and updated times and the number of messages.
+                Empty without a store.
+        """
+        if self.store is None:
+            return []
+        return self.store.conversations(limit)
+
+    def get_recent(self, conversation_id: str, count: int) -> list:
+        """
+        Returns the newest messages of a conversation without loading the whole conversation.
+
+        Args:
+            conversation_id (str): The unique user ID.
+            count (int): The number of messages.
+
+        Returns:
+            list: Up to count Message records, oldest first.
+        """
+        if not count:
+            return []
+        with self._lock:
+            history = self.user_histories.get(conversation_id)
+            if history is not None:
+                return history[-count:]
+            evicted = conversation_id in self._evicted
+        if self.store is None:
+            return self.read_log(conversation_id)[-count:]
+        if evicted:
+            self.store.flush()
+        return [Message(role, content) for role, content in self.store.last_messages(conversation_id, count)]
+
     def get_history(self, conversation_id: str) -> list:
         """
         Retrieves the complete chat history for a user.
@@ -80,18 +272,54 @@ class History:
             conversation_id (str): The unique user ID.
 
         Returns:
-            list: The user's chat history.
+            list: A copy of the user's chat history as Message records, which later
+                changes to the conversation, such as a compaction, do not affect.
         """
-        return self.user_histories.get(conversation_id, [])
+        with self._loaded(conversation_id) as history:
+            self._evict()
+            return list(history)
 
     def clear_history(self, conversation_id: str):
         """
         Clears the chat history for a specified user.
 
+        The clear is recorded in the store or the log, so the conversation is not rebuilt
+        from its earlier messages.
+
         Args:
             conversation_id (str): The unique user ID.
         """
-        self.user_histories.pop(conversation_id, None)
+        with self._lock:
+            self._drop(conversation_id)
+            # Recorded before the lock is released, and flushed before the conversation is next loaded
+            self.log_message(conversation_id, {"role": "clear", "content": ""})
+            self._evicted.add(conversation_id)
+            self._clears += 1
+
+    def evict(self, conversation_id: str):
+        """
+        Removes a conversation from memory without clearing it.
+
+        The conversation is rebuilt from the store or its log the next time it is
+        addressed, so it picks up messages another process has added meanwhile.
+
+        Args:
+            conversation_id (str): The unique user ID.
+        """
+        with self._lock:
+            if conversation_id in self.user_histories:
+                self._drop(conversation_id)
+                self._evicted.add(conversation_id)
+                self.evictions += 1
+
+    def reset_token_counts(self):
+        """
+        Forgets the cached token counts of every message, for when a tokenizer changes.
+        """
+        with self._lock:
+            for history in self.user_histories.values():
+                for message in history:
+                    message.token_counts.clear()
 
     def format_history(self, conversation_id: str) -> str:
         """
@@ -104,4 +332,155 @@ class History:
             str: The formatted chat history.
         """
         history = self.get_history(conversation_id)
-        return "\n".join([f"{entry['role']}: {entry['content']}" for entry in history])
+        return "\n".join([f"{entry.role}: {entry.content}" for entry in history])
+
+    def stats(self) -> dict:
+        """
+        Returns the in-memory store counters.
+
+        Returns:
+            dict: The conversation, message and byte totals and the hit, miss and eviction counts.
+        """
+        return {
+            "conversations": len(self.user_histories),
+            "messages": self.messages,
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    @contextmanager
+    def _loaded(self, conversation_id: str):
+        """
+        Holds the lock with a conversation's messages in memory.
+
+        A conversation that is not in memory is rebuilt from the store or its log first,
+        without the lock held. Only one thread rebuilds a conversation at a time; others
+        wait for it and then use its result.
+
+        Yields:
+            list: The conversation's messages.
+        """
+        while True:
+            with self._lock:
+                history = self.user_histories.get(conversation_id)
+                if history is not None:
+                    self.hits += 1
+                    self.user_histories.move_to_end(conversation_id)
+                    yield history
+                    return
+                loading = self._loading.get(conversation_id)
+                rebuild = loading is None
+                if rebuild:
+                    loading = self._loading[conversation_id] = Event()
+                    flush = conversation_id in self._evicted
+                    clears = self._clears
+
+            if not rebuild:
+                loading.wait()
+                continue
+
+            try:
+                history = self.rehydrate(conversation_id, flush)
+            except Exception:
+                with self._lock:
+                    del self._loading[conversation_id]
+                loading.set()
+                raise
+
+            with self._lock:
+                del self._loading[conversation_id]
+                loading.set()
+                # A clear while the conversation was read makes what was read stale
+                if clears == self._clears and conversation_id not in self.user_histories:
+                    self._evicted.discard(conversation_id)
+                    self.misses += 1
+                    self.user_histories[conversation_id] = history
+                    self.messages += len(history)
+                    self.nbytes += sum(message.nbytes for message in history)
+
+    def rehydrate(self, conversation_id: str, flush: bool = False) -> list:
+        """
+        Rebuilds a conversation from the store or its log. Must be called without the lock held.
+
+        Args:
+            conversation_id (str): The unique user ID.
+            flush (bool, optional): Whether messages of the conversation may still be
+                queued, so the queue is flushed first. Defaults to False.
+
+        Returns:
+            list: The logged messages, or an empty list for a new conversation.
+        """
+        if flush:
+            # Make sure every message already logged has reached the store or the file
+            if self.store is not None:
+                self.store.flush()
+            else:
+                get_sink().flush()
+
+        if self.store is not None:
+            if self.store.exists(conversation_id):
+                return [Message(role, content) for role, content in self.store.messages(conversation_id)]
+            history = self.read_log(conversation_id)
+            for message in history:
+                self.store.append(conversation_id, message.role, message.content)
+            return history
+
+        return self.read_log(conversation_id)
+
+    def read_log(self, conversation_id: str) -> list:
+        """
+        Rebuilds a conversation from its JSON lines log.
+
+        Args:
+            conversation_id (str): The unique user ID.
+
+        Returns:
+            list: The logged messages, or an empty list if there is no log.
+        """
+        file_path = self.log_path(conversation_id)
+        if not os.path.exists(file_path):
+            return []
+
+        history = []
+        with open(file_path, "r") as log_file:
+            for line in log_file:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    role, content = entry["role"], entry["content"]
+                    if role == "compaction":
+                        history[:entry["replaces"]] = [Message("system", content)]
+                    elif role == "clear":
+                        history = []
+                    else:
+                        history.append(Message(role, content))
+                except (ValueError, KeyError, TypeError):
+                    continue  # A line cut short by a crash or a full disk
+        return history
+
+    def _evict(self):
+        """
+        Evicts least recently used conversations until the store is within its caps.
+
+        The most recently used conversation is never evicted. Must be called with the lock held.
+        """
+        while len(self.user_histories) > 1 and (
+            (self.max_messages is not None and self.messages > self.max_messages)
+            or (self.max_bytes is not None and self.nbytes > self.max_bytes)
+        ):
+            conversation_id = next(iter(self.user_histories))
+            self._drop(conversation_id)
+            self._evicted.add(conversation_id)
+            self.evictions += 1
+
+    def _drop(self, conversation_id: str):
+        """
+        Removes a conversation from memory. Must be called with the lock held.
+        """
+        history = self.user_histories.pop(conversation_id, None)
+        if history is not None:
+            self.messages -= len(history)
+            self.nbytes -= sum(message.nbytes for message in history)
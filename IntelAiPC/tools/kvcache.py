@@ -0,0 +1,263 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore KV Cache
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore KV Cache
+# Description:   Per-conversation attention cache reuse for GeniSysAI LLMCore.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+import openvino as ov
+
+class KVCacheEntry:
+    """
+    The attention state retained for one conversation.
+
+    Attributes:
+        token_ids (list): The token IDs the retained state was computed for.
+        past (tuple): The key/value arrays, or the stateful request states, covering token_ids.
+        nbytes (int): The memory held by past.
+    """
+    __slots__ = ("token_ids", "past", "nbytes")
+
+    def __init__(self, token_ids, past):
+        self.token_ids = token_ids
+        self.past = past
+        self.nbytes = sum(array.nbytes for array in _flatten(past))
+
+class KVCache:
+    """
+    KVCache Class:
+    Keeps each conversation's attention state between turns so a new turn only prefills
+    the tokens that were not already processed.
+
+    When the new prompt shares a prefix with the retained tokens the state is cropped to
+    that prefix and handed to generate. When nothing is shared, for example because the
+    context window slid, the entry is dropped and the turn is prefilled in full. Entries
+    are evicted least recently used first once max_bytes is exceeded.
+
+    A shared prefix, normally the system prompt, is computed once and used by any
+    conversation whose own state covers less of the prompt.
+
+    Both stateless models, which return past_key_values, and stateful models, which keep
+    their state in the OpenVINO infer request, are supported. Check supports() before
+    creating a KVCache for a stateful model.
+    """
+
+    def __init__(self, model, max_bytes):
+        """
+        Initializes the KVCache.
+
+        Args:
+            model (Model): The loaded Model whose attention state is retained.
+            max_bytes (int): The maximum memory retained across all conversations.
+        """
+        self.Model = model
+        self.max_bytes = max_bytes
+
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.prefix = None  # Shared state every conversation starts from
+        self.prefix_key = None
+        self.hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = Lock()
+
+    @staticmethod
+    def supports(llm):
+        """
+        Checks whether the state of a loaded model can be retained and restored.
+
+        Stateful models are restored through private attributes of optimum-intel's
+        OVModelForCausalLM, which are not part of its public API and may be renamed in a
+        release outside the range pinned in install.ps1.
+
+        Args:
+            llm (OVModelForCausalLM): The loaded model.
+
+        Returns:
+            bool: Whether KVCache can be used with the model.
+        """
+        return not llm.stateful or all(hasattr(llm, name) for name in ("_past_length", "next_beam_idx"))
+
+    def set_prefix(self, key, input_ids):
+        """
+        Computes the shared prefix state that every conversation can start from.
+
+        The prefix is recomputed only when key changes, so it is invalidated by passing a
+        key that identifies everything the prefix depends on, such as the model and the
+        system prompt text.
+
+        Args:
+            key (tuple): Identifies the model and text the prefix was computed for.
+            input_ids (torch.Tensor): The token IDs of the prefix.
+        """
+        if key == self.prefix_key:
+            return
+
+        output = self.Model.llm(
+            input_ids=input_ids, attention_mask=input_ids.new_ones(input_ids.shape), use_cache=True
+        )
+        self.prefix = self._snapshot(input_ids[0].tolist(), output.past_key_values)
+        self.prefix_key = key
+
+    def prepare(self, conversation_id, input_ids, generate_kwargs):
+        """
+        Restores the best retained state for the next generation.
+
+        The conversation's own state is used when it shares the longer prefix with the
+        prompt, otherwise the shared prefix state is used.
+
+        Args:
+            conversation_id (str): The conversation being generated for.
+            input_ids (torch.Tensor): The full prompt token IDs.
+            generate_kwargs (dict): The generate arguments, updated in place with the past state.
+
+        Returns:
+            int: The number of prompt tokens that will not be prefilled again.
+        """
+        with self._lock:
+            entry = self.entries.pop(conversation_id, None)
+            if entry is not None:
+                self.nbytes -= entry.nbytes
+
+        token_ids = input_ids[0].tolist()
+        reuse = 0
+        if entry is not None:
+            reuse = min(_common_prefix(entry.token_ids, token_ids), len(token_ids) - 1)
+
+        if self.prefix is not None:
+            prefix_reuse = min(_common_prefix(self.prefix.token_ids, token_ids), len(token_ids) - 1)
+            if prefix_reuse > reuse:
+                entry, reuse = self.prefix, prefix_reuse
+
+        with self._lock:
+            if reuse <= 0:
+                self.misses += 1
+            elif entry is self.prefix:
+                self.prefix_hits += 1
+            else:
+                self.hits += 1
+        if reuse <= 0:
+            return 0
+
+        past = tuple(_crop(array, reuse) for array in entry.past) if self.Model.llm.stateful \
+            else tuple(tuple(_crop(array, reuse) for array in layer) for layer in entry.past)
+
+        if self.Model.llm.stateful:
+            for state, array in zip(self.Model.llm.request.query_state(), past):
+                state.state = ov.Tensor(np.ascontiguousarray(array))
+            self.Model.llm._past_length = reuse
+            self.Model.llm.next_beam_idx = np.arange(1, dtype=int)
+            # Only the sequence length of the placeholder is read by generate
+            past = ((np.empty((1, 0, reuse, 0), dtype=np.float32),),)
+
+        generate_kwargs["past_key_values"] = past
+        return reuse
+
+    def update(self, conversation_id, output):
+        """
+        Retains the conversation's attention state after a generation.
+
+        Args:
+            conversation_id (str): The conversation that was generated for.
+            output (GenerateDecoderOnlyOutput): The output of generate with return_dict_in_generate.
+        """
+        entry = self._snapshot(output.sequences[0].tolist(), output.past_key_values)
+        if entry is None or entry.nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            self.entries[conversation_id] = entry
+            self.nbytes += entry.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def _snapshot(self, token_ids, past_key_values):
+        """
+        Copies the model's current attention state.
+
+        Args:
+            token_ids (list): The token IDs processed so far, possibly including a final
+                generated token that has not been fed back to the model yet.
+            past_key_values (tuple): The past_key_values returned by the model.
+
+        Returns:
+            KVCacheEntry: The copied state, or None if the model returned no state.
+        """
+        if self.Model.llm.stateful:
+            length = self.Model.llm._past_length
+            past = tuple(np.copy(state.state.data) for state in self.Model.llm.request.query_state())
+        else:
+            if not past_key_values:
+                return None
+            past = tuple(tuple(np.copy(array) for array in layer) for layer in past_key_values)
+            length = past[0][0].shape[-2]
+        return KVCacheEntry(token_ids[:length], past)
+
+    def clear(self, conversation_id=None):
+        """
+        Releases the retained state of one conversation, or of all conversations.
+
+        Args:
+            conversation_id (str, optional): The conversation to release. Defaults to all.
+        """
+        with self._lock:
+            if conversation_id is None:
+                self.entries.clear()
+                self.nbytes = 0
+            else:
+                entry = self.entries.pop(conversation_id, None)
+                if entry is not None:
+                    self.nbytes -= entry.nbytes
+
+def _common_prefix(a, b):
+    """Returns the length of the common prefix of two token ID lists."""
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
+
+def _crop(array, length):
+    """Crops a key/value array to the first length positions of its sequence axis."""
+    return array[..., :length, :]
+
+def _flatten(past):
+    """Yields every array in a past state, whether nested per layer or flat."""
+    for item in past:
+        if isinstance(item, tuple):
+            yield from item
+        else:
+            yield item
@@ -0,0 +1,239 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Log Sink
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Log Sink
+# Description:   Background batched log writer for GeniSysAI LLMCore.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+import os
+import sys
+import queue
+import time
+import atexit
+
+from collections import OrderedDict
+from datetime import datetime
+from threading import Event, Lock, Thread
+
+_STOP = object()  # Tells the writer thread to drain and exit
+
+class LogSink:
+    """
+    LogSink Class:
+    Writes log records from a single background thread so request threads never touch
+    the filesystem.
+
+    Records are queued with the path they belong to and written in batches through
+    persistent file handles, which are flushed at most once per flush interval while
+    records keep arriving. A path ending in a separator is a rotating log directory: each
+    record goes to that directory's file for the current hour, resolved when the record
+    is written. The queue is drained when the process exits.
+    """
+
+    def __init__(self, queue_size=10000, batch_size=256, flush_interval=0.5, max_open_files=64):
+        """
+        Initializes the LogSink and starts its writer thread.
+
+        Args:
+            queue_size (int, optional): The maximum number of queued records. Defaults to 10000.
+            batch_size (int, optional): The maximum number of records written per batch. Defaults to 256.
+            flush_interval (float, optional): The maximum seconds between flushes. Defaults to 0.5.
+            max_open_files (int, optional): The number of file handles kept open. Defaults to 64.
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_open_files = max_open_files
+
+        self.records = queue.Queue(queue_size)
+        self.handles = OrderedDict()  # Resolved path -> open file, least recently used first
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self._closed = False
+
+        self._thread = Thread(target=self._run, name="LogSink", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def queued(self) -> int:
+        """
+        int: The number of records waiting to be written.
+        """
+        return self.records.qsize()
+
+    def write(self, path, line, block=False):
+        """
+        Queues a line to be appended to a log file.
+
+        Args:
+            path (str): The log file, or a rotating log directory ending in a separator.
+            line (str): The line to append, without a trailing newline.
+            block (bool, optional): Wait for space instead of dropping the record when the
+                queue is full. Defaults to False.
+        """
+        if self._closed:
+            self.dropped += 1
+            return
+        try:
+            self.records.put((path, line), block=block)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=None):
+        """
+        Waits until every record queued before the call has been written.
+
+        Args:
+            timeout (float, optional): The maximum seconds to wait. Defaults to no limit.
+
+        Returns:
+            bool: True if the records were written within the timeout.
+        """
+        if self._closed:
+            return True
+        done = Event()
+        self.records.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """
+        Drains the queue, closes every file and stops the writer thread.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self.records.put(_STOP)
+        self._thread.join()
+
+    def stats(self) -> dict:
+        """
+        Returns the sink counters.
+
+        Returns:
+            dict: The written, dropped, queued and error record counts.
+        """
+        return {
+            "written": self.written,
+            "dropped": self.dropped,
+            "queued": self.queued,
+            "errors": self.errors,
+        }
+
+    def _run(self):
+        """
+        Writes queued records in batches until stopped.
+
+        Written handles are flushed once flush_interval has passed since the last flush,
+        when a full batch leaves the queue empty, or when a flush or close is requested,
+        so a busy queue is not flushed after every batch.
+        """
+        running = True
+        dirty = set()  # Handles written since the last flush
+        last_flush = time.monotonic()
+        while running:
+            timeout = self.flush_interval
+            if dirty:
+                timeout = max(0, last_flush + self.flush_interval - time.monotonic())
+            try:
+                batch = [self.records.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+
+            waiting = []
+            for record in batch:
+                if record is _STOP:
+                    running = False
+                elif isinstance(record, Event):
+                    waiting.append(record)
+                else:
+                    handle = self._write(*record)
+                    if handle is not None:
+                        dirty.add(handle)
+
+            if (waiting or not running or time.monotonic() - last_flush >= self.flush_interval
+                    or (len(batch) == self.batch_size and self.records.empty())):
+                for handle in dirty:
+                    if not handle.closed:
+                        handle.flush()
+                dirty.clear()
+                last_flush = time.monotonic()
+            for done in waiting:
+                done.set()
+
+        for handle in self.handles.values():
+            handle.close()
+        self.handles.clear()
+
+    def _write(self, path, line):
+        """
+        Appends one record to its file.
+
+        Returns:
+            file: The handle written to, or None on error.
+        """
+        if path.endswith(("/", os.sep)):
+            path = os.path.join(path, f"{datetime.now().strftime('%Y-%m-%d-%H')}.txt")
+        try:
+            handle = self.handles.pop(path, None)
+            if handle is None:
+                handle = open(path, "a")
+                while len(self.handles) >= self.max_open_files:
+                    self.handles.popitem(last=False)[1].close()
+            self.handles[path] = handle
+            handle.write(line + "\n")
+            self.written += 1
+            return handle
+        except Exception as e:
+            self.errors += 1
+            print(f"Error appending to the log file {path}: {e}", file=sys.stderr)
+            return None
+
+_sink = None
+_sink_lock = Lock()
+
+def get_sink(**settings) -> LogSink:
+    """
+    Returns the process-wide LogSink, creating it on first use.
+
+    Args:
+        **settings: LogSink settings, applied only when the sink is created.
+
+    Returns:
+        LogSink: The shared sink.
+    """
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = LogSink(**settings)
+    return _sink
@@ -0,0 +1,319 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Metrics
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Metrics
+# Description:   Request tracing, latency histograms and counters for GeniSysAI LLMCore.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+import json
+import time
+
+from bisect import bisect_left
+from threading import Lock
+
+from tools.logsink import get_sink
+
+class Histogram:
+    """
+    A latency histogram with fixed upper bounds, in seconds.
+    """
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # The last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list:
+        """
+        Returns (upper bound, cumulative count) pairs, ending with +Inf.
+        """
+        pairs, total = [], 0
+        for bound, count in zip(list(self.bounds) + [float("inf")], self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+class _Span:
+    """
+    Times one stage of a trace.
+    """
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.record(self.name, self.start, time.perf_counter() - self.start)
+        return False
+
+class Trace:
+    """
+    Trace Class:
+    The spans of a single request.
+
+    Each span is observed in the metrics histogram of the same name as soon as it ends.
+    When trace logging is enabled the whole trace is written as one JSON line when the
+    request finishes.
+    """
+
+    def __init__(self, metrics, name, trace_id):
+        self.metrics = metrics
+        self.name = name
+        self.trace_id = trace_id
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def span(self, name):
+        """
+        Returns a context manager timing a stage of the request.
+
+        Args:
+            name (str): The stage name.
+        """
+        return _Span(self, name)
+
+    def record(self, name, start, duration):
+        """
+        Records a stage that has already been timed.
+
+        Args:
+            name (str): The stage name.
+            start (float): The stage start, from time.perf_counter.
+            duration (float): The stage duration in seconds.
+        """
+        self.metrics.observe(name, duration)
+        if self.metrics.trace_log:
+            self.spans.append((name, start - self.start, duration))
+
+    def finish(self):
+        """
+        Records the total request time and writes the trace if trace logging is enabled.
+        """
+        duration = time.perf_counter() - self.start
+        self.metrics.observe(self.name, duration)
+        if self.metrics.trace_log:
+            get_sink().write(self.metrics.trace_log, json.dumps({
+                "trace": self.trace_id,
+                "name": self.name,
+                "duration": duration,
+                "spans": [{"name": name, "offset": offset, "duration": took} for name, offset, took in self.spans],
+            }))
+
+class _NullSpan:
+    """
+    The span returned while metrics are disabled.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class _NullTrace:
+    """
+    The trace returned while metrics are disabled. Every method does nothing.
+    """
+    __slots__ = ()
+    _span = _NullSpan()
+
+    def span(self, name):
+        return self._span
+
+    def record(self, name, start, duration):
+        pass
+
+    def finish(self):
+        pass
+
+_NULL_TRACE = _NullTrace()
+
+class Metrics:
+    """
+    Metrics Class:
+    Collects latency histograms, counters and gauges for the generation hot path.
+
+    Requests are traced with trace(), whose spans feed histograms named after each stage.
+    Gauges are read from callbacks when exported, so queue depths cost nothing between
+    exports. Everything can be exported in the Prometheus text format or as a JSON
+    snapshot. While disabled, trace() returns a shared no-op trace and the counters are
+    not touched.
+    """
+
+    PREFIX = "genisys_"
+
+    def __init__(self, enabled=True, buckets=None, trace_log=None):
+        """
+        Initializes the Metrics.
+
+        Args:
+            enabled (bool, optional): Whether to collect metrics. Defaults to True.
+            buckets (list, optional): Histogram upper bounds in seconds. Defaults to 1ms to 60s.
+            trace_log (str, optional): A log file or rotating log directory to write each
+                request trace to. Defaults to not writing traces.
+        """
+        self.enabled = enabled
+        self.buckets = tuple(sorted(buckets or (
+            0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60
+        )))
+        self.trace_log = trace_log if enabled else None
+
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}  # Name -> callable returning the current value
+        self._lock = Lock()
+        self._traces = 0
+
+    def trace(self, name: str):
+        """
+        Starts tracing a request.
+
+        Args:
+            name (str): The request type, also the histogram of the total request time.
+
+        Returns:
+            Trace: The request trace, or a no-op trace while disabled.
+        """
+        if not self.enabled:
+            return _NULL_TRACE
+        with self._lock:
+            self._traces += 1
+            trace_id = self._traces
+        return Trace(self, name, trace_id)
+
+    def observe(self, name: str, seconds: float):
+        """
+        Adds a duration to a histogram.
+
+        Args:
+            name (str): The histogram name.
+            seconds (float): The duration.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def inc(self, name: str, value: float = 1):
+        """
+        Increments a counter.
+
+        Args:
+            name (str): The counter name.
+            value (float, optional): The amount to add. Defaults to 1.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name: str, read):
+        """
+        Registers a gauge.
+
+        Args:
+            name (str): The gauge name.
+            read (callable): Returns the current value when metrics are exported.
+        """
+        self.gauges[name] = read
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current metrics.
+
+        Returns:
+            dict: Counters, gauges and histograms with their buckets, sums and counts.
+        """
+        with self._lock:
+            histograms = {
+                name: {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "buckets": {_bound(bound): count for bound, count in histogram.cumulative()},
+                }
+                for name, histogram in self.histograms.items()
+            }
+            counters = dict(self.counters)
+        return {
+            "timestamp": time.time(),
+            "enabled": self.enabled,
+            "counters": counters,
+            "gauges": {name: read() for name, read in list(self.gauges.items())},
+            "histograms": histograms,
+        }
+
+    def prometheus(self) -> str:
+        """
+        Returns the current metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics text.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            lines += [f"# TYPE {self.PREFIX}{name}_total counter", f"{self.PREFIX}{name}_total {value}"]
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines += [f"# TYPE {self.PREFIX}{name} gauge", f"{self.PREFIX}{name} {value}"]
+        for name, histogram in sorted(snapshot["histograms"].items()):
+            metric = f"{self.PREFIX}{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for bound, count in histogram["buckets"].items():
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+            lines += [f"{metric}_sum {histogram['sum']}", f"{metric}_count {histogram['count']}"]
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self, path: str):
+        """
+        Writes a JSON snapshot of the current metrics.
+
+        Args:
+            path (str): The JSON file to write.
+        """
+        with open(path, "w") as snapshot_file:
+            json.dump(self.snapshot(), snapshot_file, indent=4)
+
+def _bound(bound: float) -> str:
+    """Formats a histogram upper bound the way Prometheus expects."""
+    return "+Inf" if bound == float("inf") else repr(float(bound))
@@ -32,13 +32,21 @@
 
 import os
 import json
+import hashlib
+
+from abc import ABC, abstractmethod
 
 from typing import List, Tuple
 
+import torch
+import openvino as ov
+import openvino_genai
+
 from optimum.intel.openvino import OVModelForCausalLM
 from transformers import (
     AutoConfig,
-    AutoTokenizer
+    AutoTokenizer,
+    StoppingCriteriaList
 )
 
 import openvino.properties as props
@@ -46,6 +54,10 @@ import openvino.properties.hint as hints
 import openvino.properties.streams as streams
 
 from tools.definitions import AssistantDefinition
+from tools.kvcache import KVCache
+from tools.scheduler import GenerationScheduler
+from tools.stopping import StopMatcher
+from tools.tuner import load_profile
 
 class Model:
 
@@ -62,22 +74,65 @@ class Model:
         self.model_path = os.path.join(self._confs['llm']['model_path'], self._confs["llm"]["model_out"])
         self.llm_device = self._confs["llm"]["device"]
 
+        self.engine = None  # Generation engine placeholder
         self.llm = None  # LLM model instance placeholder
         self.llm_config = None  # Configuration placeholder for the LLM
         self.llm_tokenizer = None  # Tokenizer instance placeholder
+        self.warnings = []  # Problems found while loading that the model can run without
         self.model_definition = None  # Model definition configuration placeholder
+        self.profile = {}  # Tuned "openvino" settings applied from this host's profile
+        self.stop_matchers = {}  # Stop token IDs -> compiled StopMatcher
+        self.draft_definition = None  # Draft model definition for speculative decoding
+        self.fingerprint = None  # Identifies the loaded model files and settings
+
+        self.speculative = self._confs["speculative"]["mode"]
+        if self.speculative not in (None, "draft", "prompt_lookup"):
+            raise ValueError(f"Invalid speculative mode '{self.speculative}'")
+        self.draft_path = os.path.join(
+            self._confs["llm"]["model_path"], self._confs["speculative"]["draft_model_out"]
+        )
+        self.draft_device = self._confs["speculative"]["draft_device"] or self.llm_device
 
     def load_config(self):
         """
         Configures model settings for optimized OpenVINO performance.
 
-        Applies performance tuning by setting properties like performance mode, stream count, and cache directory.
+        Applies performance tuning by setting properties like performance mode and stream count
+        from the "openvino" configuration. With use_profile enabled, the settings found by the
+        TUNE command for this host, model and device replace the configured ones. The thread
+        count, core pinning, precisions and dynamic quantization group size are only set when
+        configured. When a cache directory is configured, compiled models are cached in a
+        subdirectory keyed by the model path, device and properties, so a restart loads the
+        compiled blob instead of recompiling the graph.
         """
+        ov_confs = dict(self._confs["openvino"])
+        self.profile = load_profile(self._confs) if ov_confs["use_profile"] else {}
+        ov_confs.update(self.profile)
+
         self.llm_config = {
-            hints.performance_mode(): hints.PerformanceMode.LATENCY,
-            streams.num(): "1",
-            props.cache_dir(): ""
+            hints.performance_mode(): getattr(hints.PerformanceMode, ov_confs["performance_mode"]),
+            streams.num(): str(ov_confs["num_streams"]),
         }
+        if ov_confs["num_threads"]:
+            self.llm_config[props.inference_num_threads()] = int(ov_confs["num_threads"])
+        if ov_confs["cpu_pinning"] is not None:
+            self.llm_config[hints.enable_cpu_pinning()] = bool(ov_confs["cpu_pinning"])
+        if ov_confs["inference_precision"]:
+            self.llm_config[hints.inference_precision()] = getattr(ov.Type, ov_confs["inference_precision"])
+        if ov_confs["kv_cache_precision"]:
+            self.llm_config[hints.kv_cache_precision()] = getattr(ov.Type, ov_confs["kv_cache_precision"])
+        if ov_confs["dynamic_quantization_group_size"] is not None:
+            self.llm_config[hints.dynamic_quantization_group_size()] = int(ov_confs["dynamic_quantization_group_size"])
+
+        cache_dir = ""
+        if ov_confs["cache_dir"]:
+            key = json.dumps(
+                [os.path.abspath(self.model_path), self.llm_device, {k: str(v) for k, v in self.llm_config.items()}],
+                sort_keys=True
+            )
+            cache_dir = os.path.join(ov_confs["cache_dir"], hashlib.sha1(key.encode("utf-8")).hexdigest()[:16])
+            os.makedirs(cache_dir, exist_ok=True)
+        self.llm_config[props.cache_dir()] = cache_dir
 
     def load_model_definition(self):
         """
@@ -88,6 +143,10 @@ class Model:
         with open(self._confs['llm']['model_definition_json'], "r") as def_file:
             self.model_definition = json.load(def_file)
 
+        if self.speculative == "draft":
+            with open(self._confs["speculative"]["draft_model_definition_json"], "r") as def_file:
+                self.draft_definition = json.load(def_file)
+
     def load_tokenizer(self):
         """
         Loads the tokenizer for the model.
@@ -99,31 +158,147 @@ class Model:
 
     def load_model(self):
         """
-        Loads the LLM using OpenVINO.
+        Reads the LLM using the generation engine named by "engine" in the configuration.
 
-        Ensures the model path is valid before initializing the model using OVModelForCausalLM.
+        Ensures the model path is valid before initializing the engine. The model is compiled
+        separately by compile_model.
         """
         if os.path.isdir(self.model_path):
-            self.llm = OVModelForCausalLM.from_pretrained(
-                self.model_path,
-                device=self.llm_device,
-                ov_config=self.llm_config,
-                config=AutoConfig.from_pretrained(self.model_path, trust_remote_code=True),
-                trust_remote_code=True
+            self.engine = ENGINES[self._confs["llm"]["engine"]](self)
+            self.engine.load()
+            self.fingerprint = self.get_fingerprint()
+
+    def get_fingerprint(self) -> str:
+        """
+        Returns a hash identifying the model files and the settings they run with.
+
+        Covers the path, size and modification time of every file under the model path,
+        the device, the engine and the effective OpenVINO properties, so outputs recorded
+        for one build of a model are not mistaken for another's.
+
+        Returns:
+            str: The hex SHA-256 fingerprint.
+        """
+        files = []
+        for root, _, names in os.walk(self.model_path):
+            for name in names:
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                files.append([os.path.relpath(path, self.model_path), stat.st_size, stat.st_mtime_ns])
+        properties = {str(k): str(v) for k, v in (self.llm_config or {}).items() if k != props.cache_dir()}
+        return hashlib.sha256(json.dumps(
+            [os.path.abspath(self.model_path), sorted(files), self.llm_device, self._confs["llm"]["engine"],
+             properties],
+            sort_keys=True
+        ).encode("utf-8")).hexdigest()
+
+    def compile_model(self):
+        """
+        Compiles the LLM for the configured device, or loads it from the compiled model cache.
+        """
+        if self.engine is not None:
+            self.engine.compile()
+
+    def warm_up(self, prompt: str, max_new_tokens: int):
+        """
+        Runs a short greedy generation so the first real request does not pay for
+        first-inference allocations.
+
+        Args:
+            prompt (str): The warm-up user prompt.
+            max_new_tokens (int): The number of tokens to generate.
+        """
+        input_ids = self.convert_history_to_token([{"role": "user", "content": prompt}])
+        self.engine.generate(input_ids, max_new_tokens=max_new_tokens, do_sample=False)
+
+    def get_stop_token_ids(self, definition=None) -> list:
+        """
+        Returns the stop token IDs from the model definition.
+
+        Args:
+            definition (dict, optional): The model definition. Defaults to the loaded one.
+
+        Returns:
+            list: The stop token IDs, converted from token strings if needed.
+        """
+        definition = self.model_definition if definition is None else definition
+        stop_tokens = definition.get("stop_tokens", None) or []
+        if stop_tokens and isinstance(stop_tokens[0], str):
+            stop_tokens = self.llm_tokenizer.convert_tokens_to_ids(stop_tokens)
+        return stop_tokens
+
+    def get_stop_sequences(self, definition=None) -> list:
+        """
+        Returns the multi-token stop sequences from the model definition.
+
+        Args:
+            definition (dict, optional): The model definition. Defaults to the loaded one.
+
+        Returns:
+            list: Lists of token IDs, converted from token strings if needed.
+        """
+        definition = self.model_definition if definition is None else definition
+        sequences = []
+        for sequence in definition.get("stop_sequences", None) or []:
+            if sequence and isinstance(sequence[0], str):
+                sequence = self.llm_tokenizer.convert_tokens_to_ids(sequence)
+            sequences.append(list(sequence))
+        return sequences
+
+    def get_stop_strings(self, definition=None) -> list:
+        """
+        Returns the stop strings from the model definition.
+
+        Args:
+            definition (dict, optional): The model definition. Defaults to the loaded one.
+
+        Returns:
+            list: Text that ends generation, however it is tokenized.
+        """
+        definition = self.model_definition if definition is None else definition
+        return list(definition.get("stop_strings", None) or [])
+
+    def get_stop_matcher(self, stop_token_ids, definition=None) -> StopMatcher:
+        """
+        Returns the compiled stop conditions for a set of stop token IDs.
+
+        The model definition's stop sequences and stop strings are always included.
+        Matchers for the loaded definition are compiled once and reused. Matchers for
+        another definition, such as one read by a reload, are compiled on every call and
+        kept by the caller.
+
+        Args:
+            stop_token_ids (list): Token IDs that end generation.
+            definition (dict, optional): The model definition. Defaults to the loaded one.
+
+        Returns:
+            StopMatcher: The compiled stop conditions.
+        """
+        key = tuple(stop_token_ids or ())
+        if definition is not None and definition is not self.model_definition:
+            return StopMatcher(
+                self.llm_tokenizer, key, self.get_stop_sequences(definition), self.get_stop_strings(definition)
+            )
+        matcher = self.stop_matchers.get(key)
+        if matcher is None:
+            matcher = self.stop_matchers[key] = StopMatcher(
+                self.llm_tokenizer, key, self.get_stop_sequences(), self.get_stop_strings()
             )
+        return matcher
 
-    def convert_history_to_token(self, history: List[Tuple[str, str]]):
+    def convert_history_to_token(self, history: List[Tuple[str, str]], add_generation_prompt: bool = True):
         """
         Converts conversation history into a token format suitable for the model.
 
         Args:
             history (List[Tuple[str, str]]): A list of user and assistant message pairs.
+            add_generation_prompt (bool, optional): Whether to append the assistant turn header. Defaults to True.
         
         Returns:
             torch.Tensor: Tokenized conversation history in a format expected by the LLM.
         """
         input_token = self.llm_tokenizer.apply_chat_template(
-            history, add_generation_prompt=True, tokenize=True, return_tensors="pt"
+            history, add_generation_prompt=add_generation_prompt, tokenize=True, return_tensors="pt"
         )
         return input_token
 
@@ -140,3 +315,610 @@ class Model:
         """
         partial_text += new_text
         return partial_text
+
+class GenerationResult:
+    """
+    The outcome of a single generation.
+
+    Attributes:
+        token_ids (list): The generated token IDs.
+        reused_tokens (int): The number of prompt tokens served from a retained attention state.
+        stop_time (float): Seconds spent checking stop conditions, where the engine measures it.
+        target_passes (int): The number of decoding passes of the target model, where the
+            engine measures it. Each pass yields one token plus any accepted speculative tokens.
+    """
+    __slots__ = ("token_ids", "reused_tokens", "stop_time", "target_passes")
+
+    def __init__(self, token_ids, reused_tokens=0, stop_time=None, target_passes=None):
+        self.token_ids = token_ids
+        self.reused_tokens = reused_tokens
+        self.stop_time = stop_time
+        self.target_passes = target_passes
+
+    @property
+    def accepted_tokens(self) -> int:
+        """
+        int: The number of tokens that came from accepted speculative proposals, or None.
+        """
+        if self.target_passes is None:
+            return None
+        return len(self.token_ids) - self.target_passes
+
+    @property
+    def acceptance_rate(self) -> float:
+        """
+        float: The share of generated tokens that came from accepted speculative proposals, or None.
+        """
+        if self.target_passes is None or not self.token_ids:
+            return None
+        return self.accepted_tokens / len(self.token_ids)
+
+    @property
+    def tokens_per_pass(self) -> float:
+        """
+        float: The average number of tokens each target model pass produced, or None.
+        """
+        if not self.target_passes:
+            return None
+        return len(self.token_ids) / self.target_passes
+
+class _PassCounter:
+    """
+    Counts decoding passes by wrapping a Hugging Face streamer.
+
+    Hugging Face generate calls put() once with the prompt and then once per target model
+    pass, with every token that pass produced, including accepted speculative tokens.
+    A pass can run past a stop condition, so generated tokens are held until release()
+    is called with the stopping criteria, which generate checks right after every put(),
+    and only the tokens up to the stop are passed on.
+    """
+
+    def __init__(self, streamer=None):
+        self.streamer = streamer
+        self.passes = 0
+        self.sent = 0  # Generated tokens passed on to the streamer
+        self._prompt_seen = False
+        self._pending = []
+
+    def put(self, value):
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            if self.streamer is not None:
+                self.streamer.put(value)
+            return
+        self.passes += 1
+        if self.streamer is not None:
+            self._pending.append(value.reshape(-1))
+
+    def release(self, criteria):
+        """
+        Passes the held tokens on, up to the first sequence's stop.
+
+        Args:
+            criteria (StopCriteria): The criteria that has just checked the held tokens.
+        """
+        limit = criteria.stop_lengths[0] if criteria.stop_lengths else None
+        for value in self._pending:
+            if limit is not None:
+                value = value[:max(limit - self.sent, 0)]
+            if len(value):
+                self.sent += len(value)
+                self.streamer.put(value)
+        self._pending = []
+
+    def end(self):
+        if self.streamer is not None:
+            for value in self._pending:
+                self.sent += len(value)
+                self.streamer.put(value)
+            self._pending = []
+            self.streamer.end()
+
+class Engine(ABC):
+    """
+    Engine Class:
+    Base class for the generation backends a Model can run on.
+
+    Subclasses must implement load, compile and generate; an engine missing one of them
+    cannot be constructed.
+
+    Engines take prompt token IDs and drive a streamer with the Hugging Face streamer
+    protocol: put() is called once with the prompt IDs, then with each new token, and
+    end() is called when generation finishes. Generation settings come from the
+    "generation" configuration and can be overridden per call.
+    """
+    name = None
+    concurrent = False  # Whether generate may be called from several threads at once
+
+    def __init__(self, model):
+        """
+        Initializes the Engine.
+
+        Args:
+            model (Model): The Model the engine generates for.
+        """
+        self.Model = model
+        self._confs = model._confs
+
+    @abstractmethod
+    def load(self):
+        """
+        Reads the model from disk and sets Model.llm.
+        """
+
+    @abstractmethod
+    def compile(self):
+        """
+        Compiles the model for the configured device.
+        """
+
+    def set_prefix(self, key, input_ids):
+        """
+        Precomputes a prompt prefix shared by all conversations, if the engine supports it.
+
+        Args:
+            key (tuple): Identifies the model and text the prefix was computed for.
+            input_ids (torch.Tensor): The token IDs of the prefix.
+        """
+        pass
+
+    def forget(self, conversation_id):
+        """
+        Releases any state the engine retains for a conversation, if it retains any.
+
+        Args:
+            conversation_id (str): The conversation to release.
+        """
+        pass
+
+    def settings(self, **overrides) -> dict:
+        """
+        Returns the generation settings for a call.
+
+        Args:
+            **overrides: Settings that replace the configured values for this call.
+
+        Returns:
+            dict: The max_new_tokens, speculative, do_sample, temperature, top_p and seed settings.
+                speculative can be set to False to decode without the configured speculation.
+        """
+        settings = {"max_new_tokens": self._confs["llm"]["max_tokens"], "speculative": True}
+        settings.update(self._confs["generation"])
+        settings.update(overrides)
+        return settings
+
+    @abstractmethod
+    def generate(self, input_ids, streamer=None, stop_token_ids=None, conversation_id=None, cancel=None,
+                 stop_matcher=None, **overrides):
+        """
+        Generates a response for the prompt.
+
+        Args:
+            input_ids (torch.Tensor): The prompt token IDs, shaped (1, length).
+            streamer (optional): Receives the generated tokens as they are produced.
+            stop_token_ids (list, optional): Token IDs that end generation.
+            conversation_id (str, optional): The conversation being generated for.
+            cancel (CancelToken, optional): Checked on every decode step; generation stops
+                once it is cancelled.
+            stop_matcher (StopMatcher, optional): The stop conditions, compiled for
+                stop_token_ids. Defaults to those of the loaded model definition.
+            **overrides: Generation settings that replace the configured values for this call.
+
+        Returns:
+            GenerationResult: The generated token IDs.
+        """
+
+    def generate_batch(self, batch, stop_token_ids=None, stop_matcher=None, **overrides) -> list:
+        """
+        Generates responses for several prompts.
+
+        Engines that cannot batch generate each prompt in turn.
+
+        Args:
+            batch (list): The token IDs of each prompt, as lists.
+            stop_token_ids (list, optional): Token IDs that end generation.
+            stop_matcher (StopMatcher, optional): The stop conditions, compiled for
+                stop_token_ids. Defaults to those of the loaded model definition.
+            **overrides: Generation settings that replace the configured values for this call.
+
+        Returns:
+            list: A GenerationResult for each prompt, in order.
+        """
+        return [
+            self.generate(torch.tensor([input_ids]), None, stop_token_ids, stop_matcher=stop_matcher, **overrides)
+            for input_ids in batch
+        ]
+
+class OptimumEngine(Engine):
+    """
+    OptimumEngine Class:
+    Generates with optimum-intel's OVModelForCausalLM and Hugging Face generate.
+
+    Each conversation's attention state is retained between turns when the kv_cache
+    configuration is enabled.
+
+    With a "speculative" mode configured, greedy generation uses Hugging Face assisted
+    generation: candidate tokens are proposed by a smaller draft model ("draft") or by
+    matching the last n-gram against the prompt ("prompt_lookup"), and the target model
+    verifies them in one forward pass. Only proposals the target would have chosen
+    greedily are accepted, so the output is the same as plain greedy decoding. Sampled
+    generation is never speculated.
+    """
+    name = "optimum"
+
+    def __init__(self, model):
+        super().__init__(model)
+        self.kv_cache = None
+        self.draft = None
+
+    def load(self):
+        self.Model.llm = OVModelForCausalLM.from_pretrained(
+            self.Model.model_path,
+            device=self.Model.llm_device,
+            ov_config=self.Model.llm_config,
+            config=AutoConfig.from_pretrained(self.Model.model_path, trust_remote_code=True),
+            trust_remote_code=True,
+            compile=False
+        )
+        if self._confs["kv_cache"]["enabled"]:
+            if KVCache.supports(self.Model.llm):
+                self.kv_cache = KVCache(self.Model, self._confs["kv_cache"]["max_bytes"])
+            else:
+                self.Model.warnings.append(
+                    "KV cache reuse is off: this optimum-intel version does not expose the "
+                    "stateful model attributes it relies on"
+                )
+
+        if self.Model.speculative == "draft":
+            self.draft = OVModelForCausalLM.from_pretrained(
+                self.Model.draft_path,
+                device=self.Model.draft_device,
+                ov_config=self.Model.llm_config,
+                config=AutoConfig.from_pretrained(self.Model.draft_path, trust_remote_code=True),
+                trust_remote_code=True,
+                compile=False
+            )
+            if self.draft.config.vocab_size != self.Model.llm.config.vocab_size:
+                raise ValueError(
+                    f"The draft model {self.Model.draft_definition['model_id']} does not share "
+                    f"the vocabulary of {self.Model.model_definition['model_id']}"
+                )
+            num_assistant_tokens = self._confs["speculative"]["num_assistant_tokens"]
+            self.draft.generation_config.num_assistant_tokens = num_assistant_tokens
+
+    def compile(self):
+        self.Model.llm.compile()
+        if self.draft is not None:
+            self.draft.compile()
+
+    def set_prefix(self, key, input_ids):
+        if self.kv_cache is not None:
+            self.kv_cache.set_prefix(key, input_ids)
+
+    def forget(self, conversation_id):
+        if self.kv_cache is not None:
+            self.kv_cache.clear(conversation_id)
+
+    def generate(self, input_ids, streamer=None, stop_token_ids=None, conversation_id=None, cancel=None,
+                 stop_matcher=None, **overrides):
+        settings = self.settings(**overrides)
+        counter = _PassCounter(streamer)
+        generate_kwargs = {
+            "input_ids": input_ids,
+            "attention_mask": torch.ones_like(input_ids),
+            "pad_token_id": 0,
+            "max_new_tokens": settings["max_new_tokens"],
+            "streamer": counter,
+            "do_sample": settings["do_sample"],
+            "return_dict_in_generate": True,
+        }
+        if settings["do_sample"]:
+            generate_kwargs["temperature"] = settings["temperature"]
+            generate_kwargs["top_p"] = settings["top_p"]
+        if stop_matcher is None:
+            stop_matcher = self.Model.get_stop_matcher(stop_token_ids)
+        stop_criteria = stop_matcher.criteria(cancel, input_ids.shape[1], counter.release)
+        generate_kwargs["stopping_criteria"] = StoppingCriteriaList([stop_criteria])
+        if settings["seed"] is not None:
+            torch.manual_seed(settings["seed"])
+
+        speculative = self.Model.speculative if settings["speculative"] and not settings["do_sample"] else None
+        if speculative == "draft":
+            generate_kwargs["assistant_model"] = self.draft
+        elif speculative == "prompt_lookup":
+            generate_kwargs["prompt_lookup_num_tokens"] = self._confs["speculative"]["num_assistant_tokens"]
+            generate_kwargs["max_matching_ngram_size"] = self._confs["speculative"]["max_ngram_size"]
+
+        # Assisted generation builds its own attention state, so retained state is not used
+        use_cache = self.kv_cache is not None and conversation_id is not None and speculative is None
+        reused = 0
+        try:
+            if use_cache:
+                reused = self.kv_cache.prepare(conversation_id, input_ids, generate_kwargs)
+            output = self.Model.llm.generate(**generate_kwargs)
+            if use_cache:
+                if cancel is not None and cancel.cancelled:
+                    # The response is discarded, so its attention state would not match the next turn
+                    self.kv_cache.clear(conversation_id)
+                else:
+                    self.kv_cache.update(conversation_id, output)
+        except Exception:
+            if use_cache:
+                self.kv_cache.clear(conversation_id)
+            raise
+
+        # Speculative passes add several tokens at once and can run past the stop
+        token_ids = output.sequences[0][input_ids.shape[1]:].tolist()
+        if stop_criteria.stop_lengths and stop_criteria.stop_lengths[0] is not None:
+            token_ids = token_ids[:stop_criteria.stop_lengths[0]]
+        return GenerationResult(token_ids, reused, stop_criteria.elapsed, counter.passes)
+
+    def generate_batch(self, batch, stop_token_ids=None, stop_matcher=None, **overrides) -> list:
+        """
+        Generates responses for several prompts in one padded batch.
+
+        Prompts are padded on the left so every sequence's newest token lines up. Each
+        sequence finishes as soon as it meets a stop condition while the rest continue,
+        and is trimmed to the tokens it generated before stopping. Retained attention
+        state and speculation are not used.
+        """
+        settings = self.settings(**overrides)
+        pad_token_id = self.Model.llm_tokenizer.pad_token_id
+        if pad_token_id is None:
+            pad_token_id = 0
+
+        width = max(len(input_ids) for input_ids in batch)
+        input_ids = torch.full((len(batch), width), pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(batch), width), dtype=torch.long)
+        for row, ids in enumerate(batch):
+            input_ids[row, width - len(ids):] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[row, width - len(ids):] = 1
+
+        # Generate also finishes sequences on the model's EOS tokens, so match those too
+        # and every sequence is trimmed where it ended
+        eos_token_id = self.Model.llm.generation_config.eos_token_id
+        eos_token_ids = eos_token_id if isinstance(eos_token_id, list) else [eos_token_id]
+        stop_token_ids = sorted(set(stop_token_ids or ()) | {token for token in eos_token_ids if token is not None})
+        if stop_matcher is None:
+            stop_matcher = self.Model.get_stop_matcher(stop_token_ids)
+        else:
+            stop_matcher = StopMatcher(
+                self.Model.llm_tokenizer, stop_token_ids, stop_matcher.stop_sequences, stop_matcher.stop_strings
+            )
+        stop_criteria = stop_matcher.criteria(prompt_length=width)
+        generate_kwargs = {
+            "input_ids": input_ids,
+            "attention_mask": attention_mask,
+            "pad_token_id": pad_token_id,
+            "max_new_tokens": settings["max_new_tokens"],
+            "do_sample": settings["do_sample"],
+            "stopping_criteria": StoppingCriteriaList([stop_criteria]),
+            "return_dict_in_generate": True,
+        }
+        if settings["do_sample"]:
+            generate_kwargs["temperature"] = settings["temperature"]
+            generate_kwargs["top_p"] = settings["top_p"]
+        if settings["seed"] is not None:
+            torch.manual_seed(settings["seed"])
+
+        output = self.Model.llm.generate(**generate_kwargs)
+        generated = output.sequences[:, width:].tolist()
+        stop_lengths = stop_criteria.stop_lengths or [None] * len(batch)
+        return [
+            GenerationResult(tokens[:length] if length is not None else tokens, stop_time=stop_criteria.elapsed)
+            for tokens, length in zip(generated, stop_lengths)
+        ]
+
+class _GenAIStreamer(openvino_genai.StreamerBase):
+    """
+    Adapts an openvino_genai streaming callback to the Hugging Face streamer protocol.
+
+    The callback runs after every decode step, so it also checks the cancel token and
+    tells the pipeline to stop once it has been cancelled.
+    """
+
+    def __init__(self, streamer, cancel=None):
+        super().__init__()
+        self.streamer = streamer
+        self.cancel = cancel
+
+    def put(self, token_id) -> bool:
+        if self.streamer is not None:
+            self.streamer.put(torch.tensor([token_id]))
+        return self.cancel is not None and self.cancel.check()
+
+    def write(self, token):
+        if self.streamer is not None:
+            for token_id in token if isinstance(token, list) else [token]:
+                self.streamer.put(torch.tensor([token_id]))
+        if self.cancel is not None and self.cancel.check():
+            return openvino_genai.StreamingStatus.STOP
+        return openvino_genai.StreamingStatus.RUNNING
+
+    def end(self):
+        if self.streamer is not None:
+            self.streamer.end()
+
+class GenAIEngine(Engine):
+    """
+    GenAIEngine Class:
+    Generates with the native openvino_genai.LLMPipeline.
+
+    Tokens are streamed through the pipeline's native callback and stop tokens are
+    handled by the pipeline. With "prefix_caching" enabled in the "genai" configuration
+    the pipeline keeps attention state for recently seen prompt prefixes, such as the
+    system prompt and earlier turns of a conversation.
+
+    With a "speculative" mode configured, the pipeline is built with the draft model or
+    with prompt lookup and speculates on every generation. Output matches plain decoding
+    when do_sample is disabled.
+
+    The model folder must contain the OpenVINO tokenizer and detokenizer models that
+    optimum-cli exports alongside the LLM.
+    """
+    name = "genai"
+
+    def load(self):
+        # LLMPipeline reads and compiles in one step, see compile
+        pass
+
+    def compile(self):
+        properties = self.properties()
+        if self._confs["genai"]["prefix_caching"]:
+            scheduler_config = openvino_genai.SchedulerConfig()
+            scheduler_config.enable_prefix_caching = True
+            scheduler_config.cache_size = self._confs["genai"]["cache_size_gb"]
+            properties["scheduler_config"] = scheduler_config
+        self.Model.llm = openvino_genai.LLMPipeline(
+            self.Model.model_path, self.Model.llm_device, **properties
+        )
+
+    def properties(self) -> dict:
+        """
+        Returns the pipeline properties: the OpenVINO settings and any speculative decoding.
+
+        Returns:
+            dict: The properties keyed by name.
+        """
+        properties = {str(key): value for key, value in self.Model.llm_config.items()}
+        if self.Model.speculative == "draft":
+            properties["draft_model"] = openvino_genai.draft_model(
+                self.Model.draft_path, self.Model.draft_device
+            )
+        elif self.Model.speculative == "prompt_lookup":
+            properties["prompt_lookup"] = True
+        return properties
+
+    def generate(self, input_ids, streamer=None, stop_token_ids=None, conversation_id=None, cancel=None,
+                 stop_matcher=None, **overrides):
+        config = self.generation_config(
+            self.Model.llm.get_generation_config(), stop_token_ids, stop_matcher, **overrides
+        )
+        inputs = openvino_genai.TokenizedInputs(
+            ov.Tensor(input_ids.numpy()), ov.Tensor(torch.ones_like(input_ids).numpy())
+        )
+
+        if streamer is not None or cancel is not None:
+            if streamer is not None:
+                streamer.put(input_ids)
+            results = self.Model.llm.generate(inputs, config, _GenAIStreamer(streamer, cancel))
+        else:
+            results = self.Model.llm.generate(inputs, config)
+
+        return GenerationResult(list(results.tokens[0]))
+
+    def generation_config(self, config, stop_token_ids=None, stop_matcher=None, **overrides):
+        """
+        Applies the generation settings and stop conditions to a pipeline generation config.
+
+        Args:
+            config (openvino_genai.GenerationConfig): The pipeline's default config.
+            stop_token_ids (list, optional): Token IDs that end generation.
+            stop_matcher (StopMatcher, optional): Supplies the stop sequences and stop
+                strings. Defaults to those of the loaded model definition.
+            **overrides: Generation settings that replace the configured values for this call.
+
+        Returns:
+            openvino_genai.GenerationConfig: The config.
+        """
+        settings = self.settings(**overrides)
+        config.max_new_tokens = settings["max_new_tokens"]
+        config.do_sample = settings["do_sample"]
+        if settings["do_sample"]:
+            config.temperature = settings["temperature"]
+            config.top_p = settings["top_p"]
+        if settings["seed"] is not None:
+            config.rng_seed = settings["seed"]
+        if self.Model.speculative is not None:
+            config.num_assistant_tokens = self._confs["speculative"]["num_assistant_tokens"]
+            if self.Model.speculative == "prompt_lookup":
+                config.max_ngram_size = self._confs["speculative"]["max_ngram_size"]
+        if stop_token_ids:
+            config.stop_token_ids = set(stop_token_ids)
+        if stop_matcher is not None:
+            strings, sequences = stop_matcher.stop_strings, stop_matcher.stop_sequences
+        else:
+            strings, sequences = self.Model.get_stop_strings(), self.Model.get_stop_sequences()
+        # The pipeline matches text, so stop sequences are passed as their decoded text
+        stop_strings = list(strings) + [self.Model.llm_tokenizer.decode(sequence) for sequence in sequences]
+        if stop_strings:
+            config.stop_strings = set(stop_strings)
+        return config
+
+class ContinuousEngine(GenAIEngine):
+    """
+    ContinuousEngine Class:
+    Generates with openvino_genai's ContinuousBatchingPipeline under a GenerationScheduler.
+
+    Concurrent generations share the model: the scheduler admits new prompts between
+    steps, runs chunked prefill and decoding for every active sequence in each step and
+    retires sequences as soon as they finish. Callers do not need to hold the generation
+    lock, and a batch of prompts is submitted at once. The "continuous" configuration
+    sets the KV cache size, the maximum number of sequences and the tokens per step.
+    """
+    name = "continuous"
+    concurrent = True
+
+    def __init__(self, model):
+        super().__init__(model)
+        self.scheduler = None
+
+    def compile(self):
+        continuous = self._confs["continuous"]
+        scheduler_config = openvino_genai.SchedulerConfig()
+        scheduler_config.cache_size = continuous["cache_size_gb"]
+        scheduler_config.max_num_seqs = continuous["max_num_seqs"]
+        scheduler_config.max_num_batched_tokens = continuous["max_num_batched_tokens"]
+        scheduler_config.dynamic_split_fuse = continuous["dynamic_split_fuse"]
+        scheduler_config.enable_prefix_caching = self._confs["genai"]["prefix_caching"]
+        self.Model.llm = openvino_genai.ContinuousBatchingPipeline(
+            self.Model.model_path, scheduler_config, self.Model.llm_device, self.properties()
+        )
+        self.scheduler = GenerationScheduler(self.Model.llm)
+
+    def generate(self, input_ids, streamer=None, stop_token_ids=None, conversation_id=None, cancel=None,
+                 stop_matcher=None, **overrides):
+        return self.generate_batch_ids(
+            [input_ids], [streamer], stop_token_ids, [cancel], stop_matcher, **overrides
+        )[0]
+
+    def generate_batch(self, batch, stop_token_ids=None, stop_matcher=None, **overrides) -> list:
+        return self.generate_batch_ids(
+            [torch.tensor([input_ids]) for input_ids in batch], [None] * len(batch), stop_token_ids,
+            stop_matcher=stop_matcher, **overrides
+        )
+
+    def generate_batch_ids(self, batch, streamers, stop_token_ids=None, cancels=None, stop_matcher=None,
+                           **overrides) -> list:
+        """
+        Submits prompts to the scheduler and waits for all of them.
+
+        Args:
+            batch (list): The prompt token IDs of each generation, shaped (1, length).
+            streamers (list): The streamer of each generation, or None.
+            stop_token_ids (list, optional): Token IDs that end generation.
+            cancels (list, optional): The CancelToken of each generation, or None.
+            stop_matcher (StopMatcher, optional): Supplies the stop sequences and stop
+                strings. Defaults to those of the loaded model definition.
+            **overrides: Generation settings that replace the configured values for these calls.
+
+        Returns:
+            list: A GenerationResult for each prompt, in order.
+        """
+        requests = [
+            self.scheduler.submit(
+                input_ids,
+                self.generation_config(self.Model.llm.get_config(), stop_token_ids, stop_matcher, **overrides),
+                streamer, cancel
+            )
+            for input_ids, streamer, cancel in zip(batch, streamers, cancels or [None] * len(batch))
+        ]
+        results = []
+        for request in requests:
+            request.done.wait()
+            if request.error is not None:
+                raise request.error
+            results.append(GenerationResult(request.token_ids))
+        return results
+
+ENGINES = {engine.name: engine for engine in (OptimumEngine, GenAIEngine, ContinuousEngine)}
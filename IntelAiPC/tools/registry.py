@@ -0,0 +1,397 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Registry
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Registry
+# Description:   Registry of the models GeniSysAI LLMCore can serve.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+import gc
+import os
+import glob
+import json
+
+from contextlib import contextmanager
+from threading import Event, Lock
+
+from tools.context import ContextBuilder
+
+def current_rss_mb():
+    """
+    Returns the current resident set size of this process in megabytes.
+
+    Returns:
+        float: The current RSS, or None where it cannot be read.
+    """
+    try:
+        with open("/proc/self/statm", "r") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+class ModelSlot:
+    """
+    ModelSlot Class:
+    A model the registry can serve, and everything a query needs to run on it.
+
+    Exposes the same attributes LLMCore.query uses for the default model: confs,
+    generation, Model, ContextBuilder, stop_token_ids, stop_matcher, system_prompt and
+    generation_lock. Its system prompt follows reconfigure() through
+    prepare_system_prompt(), which queries call before running on the slot.
+    """
+
+    def __init__(self, name, confs, definition):
+        """
+        Initializes the ModelSlot.
+
+        Args:
+            name (str): The model name requests are routed by.
+            confs (dict): The configuration, with the "llm" settings of this model.
+            definition (dict): The model definition.
+        """
+        self.name = name
+        self._confs = confs
+        self.definition = definition
+
+        self.Model = None
+        self.ContextBuilder = None
+        self.stop_token_ids = None
+        self.stop_matcher = None
+        self.system_prompt = None
+        self.system_ids = None
+        self.system_key = None
+        self.generation_lock = Lock()
+
+        self.ready = None  # Set once a load finishes, while a load is in flight
+        self.load_error = None
+        self.users = 0  # Queries currently running on the model
+        self.last_used = 0  # Registry use counter value at last use
+        self.rss_mb = None  # Memory the load added, where it can be measured
+
+    @property
+    def confs(self) -> dict:
+        """
+        dict: The configuration, with the "llm" settings of this model.
+        """
+        return self._confs
+
+    @property
+    def generation(self) -> dict:
+        """
+        dict: The configured generation settings, as engine overrides.
+        """
+        return dict(self._confs["generation"], max_new_tokens=self._confs["llm"]["max_tokens"])
+
+    @property
+    def loaded(self) -> bool:
+        """
+        bool: Whether the model is loaded.
+        """
+        return self.Model is not None
+
+    def load(self):
+        """
+        Reads, compiles and prepares the model and its tokenizer.
+        """
+        # Heavy dependencies are imported here rather than at startup
+        from tools.model import Model
+
+        model = Model(self._confs)
+        model.load_model_definition()
+        model.load_config()
+        model.load_tokenizer()
+        model.load_model()
+        model.compile_model()
+        if model.llm is None or model.llm_tokenizer is None:
+            raise RuntimeError(f"Could not load {self.name} from {model.model_path}")
+
+        self.ContextBuilder = ContextBuilder(model)
+        self.stop_token_ids = model.get_stop_token_ids()
+        self.stop_matcher = model.get_stop_matcher(self.stop_token_ids)
+        self.Model = model
+        self.system_key = None
+        self.prepare_system_prompt()
+
+    def unload(self):
+        """
+        Drops the model so its memory can be reclaimed.
+        """
+        self.Model = None
+        self.ContextBuilder = None
+        self.stop_matcher = None
+        self.system_key = None
+        gc.collect()
+
+    def prepare_system_prompt(self):
+        """
+        Renders and tokenizes the system prompt and computes its shared attention prefix.
+
+        The work is only redone when the system prompt text changes.
+        """
+        system = self._confs["llm"]["system"]
+        key = (self.Model.model_path, self.Model.llm_device, system)
+        if key == self.system_key:
+            return
+
+        self.system_prompt = [{"role": "system", "content": system}]
+        self.system_ids = self.Model.convert_history_to_token(
+            self.system_prompt, add_generation_prompt=False
+        )
+        self.ContextBuilder.count_base_tokens(self.system_prompt)
+        with self.generation_lock:
+            self.Model.engine.set_prefix(key, self.system_ids)
+        self.system_key = key
+
+class ModelRegistry:
+    """
+    ModelRegistry Class:
+    Discovers the model definitions and serves each model on demand.
+
+    Every models/definitions/*.json file is a model, named after the file. The
+    definition's "model_out" names the exported model folder under llm.model_path.
+    Models are loaded the first time a request is routed to them; concurrent first
+    requests wait for the same load. After each load, least recently used models that
+    no query is running on are unloaded until the process RSS is back within
+    rss_budget_mb. The default model is loaded by LLMCore at startup and never unloaded.
+    """
+
+    def __init__(self, confs, default=None, log=None):
+        """
+        Initializes the ModelRegistry and discovers the model definitions.
+
+        Args:
+            confs (dict): The loaded configuration.
+            default (str, optional): The name of the model LLMCore loads itself.
+            log (callable, optional): Called with (level, message) for registry events.
+        """
+        self._confs = confs
+        self.default = default
+        self.rss_budget_mb = confs["registry"]["rss_budget_mb"]
+        self.log = log or (lambda level, message: None)
+
+        self.slots = {}
+        self.loads = 0
+        self.unloads = 0
+        self._uses = 0
+        self._lock = Lock()
+
+        self.discover()
+
+    def __contains__(self, name) -> bool:
+        return name in self.slots
+
+    def names(self) -> list:
+        """
+        Returns the names of the models that can be served.
+
+        Returns:
+            list: The model names.
+        """
+        return sorted(self.slots)
+
+    def discover(self):
+        """
+        Registers every model definition in the configured definitions folder.
+        """
+        pattern = os.path.join(self._confs["registry"]["definitions_path"], "*.json")
+        for path in sorted(glob.glob(pattern)):
+            name = os.path.splitext(os.path.basename(path))[0]
+            if name == self.default or name in self.slots:
+                continue
+            with open(path, "r") as def_file:
+                definition = json.load(def_file)
+            if "model_out" not in definition:
+                continue
+
+            self.slots[name] = ModelSlot(name, self.slot_confs(self._confs, name, path, definition), definition)
+
+    def slot_confs(self, confs, name, path, definition) -> dict:
+        """
+        Returns a copy of the configuration with the "llm" settings of a model.
+
+        Args:
+            confs (dict): The loaded configuration.
+            name (str): The model name.
+            path (str): The model definition file.
+            definition (dict): The model definition.
+
+        Returns:
+            dict: The model's configuration.
+        """
+        confs = json.loads(json.dumps(confs))
+        confs["llm"]["model_definition_json"] = path
+        confs["llm"]["model_out"] = definition["model_out"]
+        confs["llm"]["model"] = definition.get("model_id", name)
+        confs["speculative"]["mode"] = None
+        return confs
+
+    def reconfigure(self, confs):
+        """
+        Applies a reloaded configuration to every model.
+
+        The system prompt and generation settings apply from each model's next query.
+        Settings a loaded model was built from, and changes to its definition, apply
+        the next time it is loaded.
+
+        Args:
+            confs (dict): The reloaded configuration.
+        """
+        self._confs = confs
+        for slot in self.slots.values():
+            slot._confs = self.slot_confs(
+                confs, slot.name, slot._confs["llm"]["model_definition_json"], slot.definition
+            )
+
+    @contextmanager
+    def use(self, name):
+        """
+        Provides a loaded model for the duration of a query.
+
+        Args:
+            name (str): The model name.
+
+        Yields:
+            ModelSlot: The loaded model.
+
+        Raises:
+            KeyError: If there is no such model.
+            RuntimeError: If the model failed to load.
+        """
+        slot = self.acquire(name)
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    def acquire(self, name) -> ModelSlot:
+        """
+        Loads a model if needed and marks it in use until release() is called.
+
+        Args:
+            name (str): The model name.
+
+        Returns:
+            ModelSlot: The loaded model.
+        """
+        slot = self.slots[name]
+        with self._lock:
+            self._uses += 1
+            slot.last_used = self._uses
+            slot.users += 1
+            if slot.loaded:
+                return slot
+            # Kept locally, as the loading thread clears slot.ready once it is set
+            ready = slot.ready
+            loading = ready is not None
+            if not loading:
+                slot.ready = Event()
+                slot.load_error = None
+
+        if loading:
+            ready.wait()
+        else:
+            self._load(slot)
+
+        if slot.load_error is not None:
+            with self._lock:
+                slot.users -= 1
+            raise RuntimeError(f"The model {name} failed to load: {slot.load_error}") from slot.load_error
+        return slot
+
+    def release(self, slot: ModelSlot):
+        """
+        Marks a query on a model as finished.
+
+        Args:
+            slot (ModelSlot): The model returned by acquire().
+        """
+        with self._lock:
+            slot.users -= 1
+
+    def stats(self) -> dict:
+        """
+        Returns the registry state.
+
+        Returns:
+            dict: The loaded models, the load and unload counts and the current RSS.
+        """
+        return {
+            "loaded": [name for name, slot in self.slots.items() if slot.loaded],
+            "loads": self.loads,
+            "unloads": self.unloads,
+            "rss_mb": current_rss_mb(),
+        }
+
+    def _load(self, slot: ModelSlot):
+        """
+        Loads a model, then unloads others past the memory budget.
+        """
+        before = current_rss_mb()
+        try:
+            slot.load()
+            self.loads += 1
+            after = current_rss_mb()
+            if before is not None and after is not None:
+                slot.rss_mb = after - before
+            self.log("INFO", f"Loaded {slot.name} from {slot.Model.model_path}")
+            for warning in slot.Model.warnings:
+                self.log("WARNING", f"{slot.name}: {warning}")
+        except Exception as e:
+            slot.load_error = e
+            slot.unload()
+            self.log("ERROR", f"Could not load {slot.name}: {str(e)}")
+        finally:
+            ready = slot.ready
+            with self._lock:
+                slot.ready = None
+            ready.set()
+
+        if slot.load_error is None:
+            self._enforce_budget()
+
+    def _enforce_budget(self):
+        """
+        Unloads least recently used idle models until RSS is within the budget.
+        """
+        while True:
+            rss = current_rss_mb()
+            if rss is None or self.rss_budget_mb is None or rss <= self.rss_budget_mb:
+                return
+            with self._lock:
+                idle = [slot for slot in self.slots.values() if slot.loaded and not slot.users]
+                if not idle:
+                    return
+                victim = min(idle, key=lambda slot: slot.last_used)
+                victim.unload()
+                self.unloads += 1
+            self.log("INFO", f"Unloaded {victim.name}, RSS was {rss:.0f}MB of {self.rss_budget_mb}MB")
@@ -0,0 +1,261 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Reload
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Reload
+# Description:   Hot reload of the configuration and definitions for GeniSysAI LLMCore.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+import os
+import time
+
+from threading import Thread
+
+from tools.definitions import AssistantDefinition
+
+# Settings the compiled model depends on; changing any of them reloads the model
+MODEL_KEYS = (
+    "llm.model",
+    "llm.model_out",
+    "llm.model_path",
+    "llm.device",
+    "llm.engine",
+    "openvino",
+    "speculative",
+    "genai",
+    "continuous",
+    "kv_cache",
+)
+
+# Settings read by components built at startup, which only take effect after a restart
+RESTART_KEYS = (
+    "history",
+    "logging",
+    "metrics",
+    "registry",
+    "response_cache",
+    "compaction",
+    "server",
+    "workers",
+    "reload",
+)
+
+def changed_keys(old: dict, new: dict) -> list:
+    """
+    Returns the settings that differ between two configurations.
+
+    Args:
+        old (dict): The current configuration.
+        new (dict): The configuration read from disk.
+
+    Returns:
+        list: Dotted "section.key" names, sorted.
+    """
+    changed = []
+    for section in set(old) | set(new):
+        old_section, new_section = old.get(section), new.get(section)
+        if isinstance(old_section, dict) and isinstance(new_section, dict):
+            changed.extend(
+                f"{section}.{key}" for key in set(old_section) | set(new_section)
+                if old_section.get(key) != new_section.get(key)
+            )
+        elif old_section != new_section:
+            changed.append(section)
+    return sorted(changed)
+
+def matches(changed: list, keys: tuple) -> list:
+    """
+    Returns the changed settings that fall under any of the given keys or sections.
+
+    Args:
+        changed (list): Dotted setting names from changed_keys.
+        keys (tuple): Setting names or whole sections.
+
+    Returns:
+        list: The matching setting names.
+    """
+    return [name for name in changed if any(name == key or name.startswith(f"{key}.") for key in keys)]
+
+def validate_confs(current: dict, confs: dict):
+    """
+    Checks that a configuration read from disk can replace the current one.
+
+    Every section and setting of the current configuration must still be present, and
+    the system prompt must be text.
+
+    Args:
+        current (dict): The running configuration.
+        confs (dict): The configuration read from disk.
+
+    Raises:
+        ValueError: If the configuration is incomplete or invalid.
+    """
+    if not isinstance(confs, dict):
+        raise ValueError("The configuration must be a JSON object")
+    for section, settings in current.items():
+        if section not in confs:
+            raise ValueError(f"The configuration has no \"{section}\" section")
+        if isinstance(settings, dict):
+            if not isinstance(confs[section], dict):
+                raise ValueError(f"\"{section}\" must be an object")
+            missing = sorted(set(settings) - set(confs[section]))
+            if missing:
+                raise ValueError(f"\"{section}\" is missing {', '.join(missing)}")
+    if not isinstance(confs["llm"]["system"], str) or not confs["llm"]["system"].strip():
+        raise ValueError("llm.system must be a non-empty string")
+
+def validate_definition(definition: dict):
+    """
+    Checks the stop conditions of a model definition.
+
+    Args:
+        definition (dict): The model definition read from disk.
+
+    Raises:
+        ValueError: If the definition is not an object or a stop condition is malformed.
+    """
+    if not isinstance(definition, dict):
+        raise ValueError("The model definition must be a JSON object")
+    for key in ("stop_tokens", "stop_sequences", "stop_strings"):
+        if not isinstance(definition.get(key) or [], list):
+            raise ValueError(f"The model definition's {key} must be a list")
+    if any(not isinstance(sequence, list) for sequence in definition.get("stop_sequences") or []):
+        raise ValueError("The model definition's stop_sequences must be lists of tokens")
+
+def render_definition(confs: dict):
+    """
+    Renders the assistant definition XML with the name and role from its JSON.
+
+    Args:
+        confs (dict): The configuration naming the definition files.
+
+    Returns:
+        str: The rendered XML, or None when the definition files are not present.
+    """
+    xml_path, json_path = confs["llm"]["definition_xml"], confs["llm"]["definition_json"]
+    if not (os.path.exists(xml_path) and os.path.exists(json_path)):
+        return None
+    return AssistantDefinition(xml_path, json_path).run_update()
+
+class RuntimeState:
+    """
+    RuntimeState Class:
+    Everything derived from the configuration and definitions that a query runs with.
+
+    A state is never changed once built. A reload builds a new state and replaces the
+    core's reference to it in one assignment, so each query uses the state it started
+    with from start to finish. The model definition and the stop conditions compiled
+    from it belong to the state rather than the model, so a reload that only changes
+    the definition never alters a generation in progress. It exposes the attributes
+    LLMCore.query uses for a model, like a ModelSlot.
+    """
+
+    def __init__(self, version, confs, model, context_builder, model_definition, stop_token_ids, stop_matcher,
+                 system_prompt, system_ids, definition_xml, generation_lock):
+        self.version = version
+        self.confs = confs
+        self.Model = model
+        self.ContextBuilder = context_builder
+        self.model_definition = model_definition
+        self.stop_token_ids = stop_token_ids
+        self.stop_matcher = stop_matcher
+        self.system_prompt = system_prompt
+        self.system_ids = system_ids
+        self.system_key = (model.model_path, model.llm_device, system_prompt[0]["content"])
+        self.definition_xml = definition_xml
+        self.generation_lock = generation_lock
+
+    @property
+    def generation(self) -> dict:
+        """
+        dict: The generation settings of the state's configuration, as engine overrides.
+        """
+        return dict(self.confs["generation"], max_new_tokens=self.confs["llm"]["max_tokens"])
+
+class ConfigWatcher:
+    """
+    ConfigWatcher Class:
+    Polls files for changes and calls back once they have settled.
+
+    A file counts as changed when its modification time or size changes, or when it
+    appears or disappears. The callback runs once the files have stayed unchanged for a
+    full interval, so an editor's partial writes are read as one change.
+    """
+
+    def __init__(self, paths, on_change, interval=2.0):
+        """
+        Initializes the ConfigWatcher and starts its thread.
+
+        Args:
+            paths (callable): Returns the files to watch. Called on every poll, so the
+                files can follow the configuration.
+            on_change (callable): Called with the list of changed files.
+            interval (float, optional): The seconds between polls. Defaults to 2.0.
+        """
+        self.paths = paths
+        self.on_change = on_change
+        self.interval = interval
+        self._stamps = self._stat()
+
+        Thread(target=self._run, name="ConfigWatcher", daemon=True).start()
+
+    def _stat(self) -> dict:
+        """
+        Returns the modification time and size of every watched file.
+        """
+        stamps = {}
+        for path in self.paths():
+            try:
+                stat = os.stat(path)
+                stamps[path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                stamps[path] = None
+        return stamps
+
+    def _run(self):
+        """
+        Polls the files forever.
+        """
+        while True:
+            time.sleep(self.interval)
+            stamps = self._stat()
+            if stamps == self._stamps:
+                continue
+            # Wait for the writes to settle
+            while True:
+                time.sleep(self.interval)
+                settled = self._stat()
+                if settled == stamps:
+                    break
+                stamps = settled
+            changed = sorted(path for path in set(stamps) | set(self._stamps)
+                             if stamps.get(path) != self._stamps.get(path))
+            self._stamps = stamps
+            try:
+                self.on_change(changed)
+            except Exception:
+                pass  # The callback reports its own errors; keep watching
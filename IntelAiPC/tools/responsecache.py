@@ -0,0 +1,228 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Response Cache
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Response Cache
+# Description:   Persistent cache of generated responses for GeniSysAI LLMCore.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+from array import array
+from collections import OrderedDict
+from threading import Lock
+
+from tools.logsink import get_sink
+
+class CachedResponse:
+    """
+    A cached response, kept as the chunks it was originally streamed in.
+    """
+    __slots__ = ("chunks", "created", "nbytes")
+
+    # Approximate fixed cost of an entry, used for the memory cap
+    OVERHEAD_BYTES = 200
+
+    def __init__(self, chunks, created):
+        self.chunks = chunks
+        self.created = created
+        self.nbytes = self.OVERHEAD_BYTES + sum(len(chunk) for chunk in chunks)
+
+class ResponseCache:
+    """
+    ResponseCache Class:
+    Replays responses to contexts that have already been answered.
+
+    Entries are keyed by a SHA-256 hash of the model build, the generation settings and the
+    exact token sequence of the rendered context, so a hit is only possible when the
+    model would have been given the same input. Entries expire after a TTL and the least
+    recently used are evicted past the entry and size caps.
+
+    Every new entry is appended to a JSON lines file through the log sink. The file is
+    read back and compacted when the cache is created, so answers survive restarts.
+    Sampled generation is only cached when allow_sampled is set, so with the default
+    sampled generation settings the cache only takes effect once do_sample is disabled.
+    """
+
+    def __init__(self, path, ttl=86400, max_entries=1024, max_bytes=16777216, allow_sampled=False):
+        """
+        Initializes the ResponseCache and loads any persisted entries.
+
+        Args:
+            path (str): The JSON lines file entries are persisted to.
+            ttl (float, optional): The seconds an entry stays valid. Defaults to one day.
+            max_entries (int, optional): The maximum number of entries. Defaults to 1024.
+            max_bytes (int, optional): The maximum approximate size of the entries. Defaults to 16 MiB.
+            allow_sampled (bool, optional): Cache responses generated with sampling. Defaults to False.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.allow_sampled = allow_sampled
+
+        self.entries = OrderedDict()  # Key -> CachedResponse, least recently used first
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = Lock()
+
+        self.load()
+
+    def cacheable(self, settings: dict) -> bool:
+        """
+        Returns whether responses generated with the settings may be cached.
+
+        Args:
+            settings (dict): The engine's generation settings.
+
+        Returns:
+            bool: True for greedy settings, or for sampled ones when allowed.
+        """
+        return not settings["do_sample"] or self.allow_sampled
+
+    @staticmethod
+    def key(model_id: str, settings: dict, stop_token_ids, token_ids) -> str:
+        """
+        Builds the cache key for a rendered context.
+
+        Args:
+            model_id (str): Identifies the model files, their settings and the engine.
+            settings (dict): The engine's generation settings.
+            stop_token_ids (list): The token IDs that end generation.
+            token_ids (list): The token IDs of the rendered context.
+
+        Returns:
+            str: The hex SHA-256 key.
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps(
+            [model_id, settings, list(stop_token_ids or ())], sort_keys=True, default=str
+        ).encode("utf-8"))
+        digest.update(array("q", token_ids).tobytes())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> list:
+        """
+        Returns a cached response.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            list: The response chunks, or None if there is no valid entry.
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry.created > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry.chunks
+
+    def put(self, key: str, chunks: list):
+        """
+        Caches a response and persists it.
+
+        Args:
+            key (str): The cache key.
+            chunks (list): The response chunks as they were streamed.
+        """
+        entry = CachedResponse(list(chunks), time.time())
+        with self._lock:
+            self._add(key, entry)
+        get_sink().write(self.path, json.dumps({"key": key, "created": entry.created, "chunks": entry.chunks}))
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict: The entry and byte totals and the hit, miss and eviction counts.
+        """
+        return {
+            "entries": len(self.entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def load(self):
+        """
+        Loads the persisted entries and rewrites the file without expired or evicted ones.
+        """
+        if not os.path.exists(self.path):
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            return
+
+        now = time.time()
+        with open(self.path, "r") as cache_file:
+            for line in cache_file:
+                try:
+                    record = json.loads(line)
+                    if now - record["created"] <= self.ttl:
+                        self._add(record["key"], CachedResponse(record["chunks"], record["created"]))
+                except (ValueError, KeyError, TypeError):
+                    continue  # A line cut short by a crash, or not an entry
+
+        # Each process compacts through its own temporary file, so concurrent loads never share one
+        with tempfile.NamedTemporaryFile(
+            "w", dir=os.path.dirname(self.path) or ".", prefix=f"{os.path.basename(self.path)}.", suffix=".tmp",
+            delete=False
+        ) as cache_file:
+            for key, entry in self.entries.items():
+                cache_file.write(json.dumps({"key": key, "created": entry.created, "chunks": entry.chunks}) + "\n")
+        os.replace(cache_file.name, self.path)
+
+    def _add(self, key: str, entry: CachedResponse):
+        """
+        Stores an entry and evicts past the caps. Must be called with the lock held.
+        """
+        self._drop(key)
+        self.entries[key] = entry
+        self.nbytes += entry.nbytes
+        while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.nbytes > self.max_bytes):
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _drop(self, key: str):
+        """
+        Removes an entry. Must be called with the lock held.
+        """
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry.nbytes
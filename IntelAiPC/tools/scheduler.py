@@ -0,0 +1,216 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Scheduler
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Scheduler
+# Description:   Continuous batching generation scheduler for GeniSysAI LLMCore.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+import queue
+
+from itertools import count
+from threading import Event, Thread
+
+import torch
+import openvino as ov
+import openvino_genai
+
+from tools.generation import CancelToken
+
+class ScheduledRequest:
+    """
+    A generation submitted to the GenerationScheduler.
+
+    Attributes:
+        token_ids (list): The tokens generated so far.
+        done (Event): Set once the request has finished, failed or been cancelled.
+        error (Exception): The error that ended the request, or None.
+        steps (int): The scheduler steps the request took part in.
+        cancel (CancelToken): Checked after every step; the request is dropped once it is cancelled.
+    """
+    __slots__ = ("input_ids", "config", "streamer", "handle", "token_ids", "done", "error", "steps", "cancel")
+
+    def __init__(self, input_ids, config, streamer, cancel=None):
+        self.input_ids = input_ids
+        self.config = config
+        self.streamer = streamer
+        self.handle = None
+        self.token_ids = []
+        self.done = Event()
+        self.error = None
+        self.steps = 0
+        self.cancel = cancel or CancelToken()
+
+class GenerationScheduler:
+    """
+    GenerationScheduler Class:
+    Owns a continuous batching pipeline and runs every active generation together.
+
+    A single thread drives the pipeline. Between steps it admits every newly submitted
+    request, so a new prompt never waits for other responses to finish. Each step of the
+    pipeline runs a chunk of prefill for admitted prompts and one decode step for every
+    sequence already generating, within the pipeline's token budget. After each step the
+    new tokens of every request are handed to that request's streamer, and requests that
+    have finished are retired at once so their cache blocks are freed. A request whose
+    cancel token is cancelled is dropped from the pipeline after the current step, or is
+    never admitted if it is still waiting. A request the pipeline ends itself, such as
+    one ignored or dropped for lack of cache blocks, fails with a RuntimeError rather
+    than returning its truncated tokens.
+
+    Streamers follow the Hugging Face streamer protocol used by the other engines.
+    """
+
+    def __init__(self, pipeline):
+        """
+        Initializes the GenerationScheduler and starts its thread.
+
+        Args:
+            pipeline (openvino_genai.ContinuousBatchingPipeline): The compiled pipeline.
+        """
+        self.pipeline = pipeline
+        self.pending = queue.Queue()
+        self.active = {}  # Request ID -> ScheduledRequest
+        self.steps = 0
+        self.admitted = 0
+        self._request_ids = count()
+
+        Thread(target=self._run, name="GenerationScheduler", daemon=True).start()
+
+    def submit(self, input_ids, config, streamer=None, cancel=None) -> ScheduledRequest:
+        """
+        Queues a generation to be admitted at the next step.
+
+        Args:
+            input_ids (torch.Tensor): The prompt token IDs, shaped (1, length).
+            config (openvino_genai.GenerationConfig): The generation settings.
+            streamer (optional): Receives the generated tokens as they are produced.
+            cancel (CancelToken, optional): Stops the request when cancelled.
+
+        Returns:
+            ScheduledRequest: The request, whose done event is set when it finishes.
+        """
+        request = ScheduledRequest(input_ids, config, streamer, cancel)
+        self.pending.put(request)
+        return request
+
+    def stats(self) -> dict:
+        """
+        Returns the scheduler counters.
+
+        Returns:
+            dict: The active and pending requests, steps run and requests admitted.
+        """
+        return {
+            "active": len(self.active),
+            "pending": self.pending.qsize(),
+            "steps": self.steps,
+            "admitted": self.admitted,
+        }
+
+    def _admit(self, request: ScheduledRequest):
+        """
+        Adds a request to the pipeline.
+        """
+        if request.cancel.check():
+            self._retire(None, request)
+            return
+        request_id = next(self._request_ids)
+        try:
+            request.handle = self.pipeline.add_request(
+                request_id, ov.Tensor(request.input_ids.numpy()), request.config
+            )
+        except Exception as e:
+            self._retire(None, request, e)
+            return
+        if request.streamer is not None:
+            request.streamer.put(request.input_ids)
+        self.active[request_id] = request
+        self.admitted += 1
+
+    def _collect(self, request_id, request: ScheduledRequest):
+        """
+        Streams a request's new tokens and retires it if it has finished.
+        """
+        request.steps += 1
+        status = request.handle.get_status()
+        while request.handle.can_read():
+            for output in request.handle.read().values():
+                token_ids = list(output.generated_ids)
+                request.token_ids.extend(token_ids)
+                if request.streamer is not None and token_ids:
+                    request.streamer.put(torch.tensor(token_ids))
+        if status != openvino_genai.GenerationStatus.RUNNING:
+            self._retire(request_id, request, status=status)
+        elif request.cancel.check():
+            # Older releases name this drop()
+            (getattr(request.handle, "cancel", None) or request.handle.drop)()
+            self._retire(request_id, request)
+
+    def _retire(self, request_id, request: ScheduledRequest, error=None, status=None):
+        """
+        Removes a finished request and wakes the thread waiting for it.
+
+        Only a FINISHED status, or an end we asked for by cancelling, is a clean end; any
+        other status the pipeline reports is turned into an error.
+        """
+        self.active.pop(request_id, None)
+        if (error is None and status is not None and status != openvino_genai.GenerationStatus.FINISHED
+                and not request.cancel.cancelled):
+            error = RuntimeError(
+                f"The pipeline ended the request with status {getattr(status, 'name', status)} "
+                f"after {len(request.token_ids)} tokens"
+            )
+        request.error = error
+        if request.streamer is not None:
+            request.streamer.end()
+        request.done.set()
+
+    def _run(self):
+        """
+        Admits requests and steps the pipeline while any generation is active.
+        """
+        while True:
+            if not self.active:
+                self._admit(self.pending.get())  # Sleep until there is work
+            while True:
+                try:
+                    self._admit(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            if not self.active:
+                continue
+
+            try:
+                self.pipeline.step()
+            except Exception as e:
+                for request_id, request in list(self.active.items()):
+                    self._retire(request_id, request, e)
+                continue
+            self.steps += 1
+
+            for request_id, request in list(self.active.items()):
+                self._collect(request_id, request)
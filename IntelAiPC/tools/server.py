@@ -0,0 +1,352 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Server
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Server
+# Description:   Asyncio HTTP server streaming GeniSysAI LLMCore responses over SSE.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+import json
+import asyncio
+
+from threading import Event, Thread
+
+from tools.history import valid_conversation_id
+
+_END = object()  # Marks the end of a response stream
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    503: "Service Unavailable",
+}
+
+class Server:
+    """
+    Server Class:
+    Serves LLMCore over HTTP, streaming each response as Server-Sent Events.
+
+    Endpoints:
+        POST /chat    Body {"prompt": "...", "conversation_id": "...", "model": "..."}. The
+                      prompt must be a string. The conversation ID is optional; a new one
+                      is generated and returned when it is missing. IDs are 1 to 64
+                      letters, digits, hyphens or underscores. The model is optional and
+                      defaults to the default model. "deadline" and "first_token_deadline"
+                      optionally limit the seconds the response may take and may wait for
+                      its first token.
+        GET  /health  Reports the number of active and queued requests.
+        GET  /conversations
+                      Lists the stored conversations, most recently updated first.
+        GET  /metrics Reports the core's metrics in the Prometheus text format.
+        GET  /metrics.json
+                      Reports the core's metrics as a JSON snapshot.
+
+    The server only relies on the core exposing query(prompt, conversation_id, model,
+    deadline, first_token_deadline), has_model(name), History, Metrics, Helpers and
+    LogFile, so it can be run against a local stub of LLMCore.
+    """
+
+    def __init__(self, core, confs):
+        """
+        Initializes the Server.
+
+        Args:
+            core (LLMCore): The core used to generate responses.
+            confs (dict): Configuration dictionary containing the "server" settings.
+        """
+        self.core = core
+        self._confs = confs["server"]
+
+        self.active = 0  # Requests currently generating
+        self.queued = 0  # Requests waiting for a generation slot
+        self._slots = None  # Created inside the running event loop
+
+        self.core.Metrics.gauge("requests_active", lambda: self.active)
+        self.core.Metrics.gauge("requests_queued", lambda: self.queued)
+
+    def run(self):
+        """
+        Runs the server until interrupted.
+        """
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self):
+        """
+        Starts listening on the configured host and port and serves connections forever.
+        """
+        self._slots = asyncio.Semaphore(self._confs["max_active"])
+        server = await asyncio.start_server(
+            self.handle, self._confs["host"], self._confs["port"]
+        )
+        self.core.Helpers.log_message(
+            self.core.LogFile, "Server Mode", "INFO",
+            f"Listening on http://{self._confs['host']}:{self._confs['port']}"
+        )
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader, writer):
+        """
+        Handles a single HTTP connection.
+
+        Args:
+            reader (asyncio.StreamReader): The connection reader.
+            writer (asyncio.StreamWriter): The connection writer.
+        """
+        try:
+            try:
+                request = await asyncio.wait_for(
+                    self.read_request(reader), self._confs["read_timeout"]
+                )
+            except ValueError as e:
+                await self.respond(writer, 400, {"error": str(e)})
+                return
+            if request is None:
+                return
+            method, path, body = request
+
+            if path == "/health":
+                await self.respond(writer, 200, {"active": self.active, "queued": self.queued})
+            elif path == "/metrics":
+                await self.respond_body(
+                    writer, 200, self.core.Metrics.prometheus().encode("utf-8"),
+                    "text/plain; version=0.0.4; charset=utf-8"
+                )
+            elif path == "/metrics.json":
+                await self.respond(writer, 200, self.core.Metrics.snapshot())
+            elif path == "/conversations":
+                await self.respond(writer, 200, {
+                    "conversations": self.core.History.list_conversations(self._confs["max_conversations"])
+                })
+            elif path != "/chat":
+                await self.respond(writer, 404, {"error": "Not found"})
+            elif method != "POST":
+                await self.respond(writer, 405, {"error": "Use POST"})
+            else:
+                await self.chat(writer, body)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            self.core.Metrics.inc("errors")
+            self.core.Helpers.log_message(
+                self.core.LogFile, "Server Mode", "ERROR", f"Request error: {str(e)}"
+            )
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        """
+        Reads the request line, headers and body of an HTTP request.
+
+        Args:
+            reader (asyncio.StreamReader): The connection reader.
+
+        Returns:
+            tuple: The method, path and raw body, or None if the connection closed early.
+        """
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0))
+        if length > self._confs["max_body_bytes"]:
+            raise ValueError(f"Request body of {length} bytes is too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path.split("?", 1)[0], body
+
+    async def respond(self, writer, status, payload):
+        """
+        Writes a complete JSON response.
+
+        Args:
+            writer (asyncio.StreamWriter): The connection writer.
+            status (int): The HTTP status code.
+            payload (dict): The JSON payload.
+        """
+        await self.respond_body(writer, status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    async def respond_body(self, writer, status, body, content_type):
+        """
+        Writes a complete response.
+
+        Args:
+            writer (asyncio.StreamWriter): The connection writer.
+            status (int): The HTTP status code.
+            body (bytes): The response body.
+            content_type (str): The Content-Type of the body.
+        """
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+    async def send_event(self, writer, event, payload):
+        """
+        Writes a single Server-Sent Event, waiting for the client to keep up.
+
+        Args:
+            writer (asyncio.StreamWriter): The connection writer.
+            event (str): The event name.
+            payload (dict): The JSON event data.
+        """
+        writer.write(f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode("utf-8"))
+        await asyncio.wait_for(writer.drain(), self._confs["write_timeout"])
+
+    async def chat(self, writer, body):
+        """
+        Admits a chat request and streams the generated response.
+
+        Requests beyond max_active wait for a slot; once max_queue requests are
+        already waiting, new requests are rejected with 503.
+
+        Args:
+            writer (asyncio.StreamWriter): The connection writer.
+            body (bytes): The raw JSON request body.
+        """
+        try:
+            data = json.loads(body or b"{}")
+            prompt = data["prompt"]
+        except (ValueError, KeyError, TypeError):
+            await self.respond(writer, 400, {"error": "Expected a JSON body with a prompt"})
+            return
+        if not isinstance(prompt, str):
+            await self.respond(writer, 400, {"error": "The prompt must be a string"})
+            return
+
+        conversation_id = data.get("conversation_id")
+        if conversation_id is not None and not valid_conversation_id(conversation_id):
+            await self.respond(
+                writer, 400, {"error": "conversation_id must be 1 to 64 letters, digits, hyphens or underscores"}
+            )
+            return
+
+        model = data.get("model")
+        if model is not None and not self.core.has_model(model):
+            await self.respond(writer, 400, {"error": f"Unknown model '{model}'"})
+            return
+
+        deadlines = (data.get("deadline"), data.get("first_token_deadline"))
+        if any(value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0)
+               for value in deadlines):
+            await self.respond(writer, 400, {"error": "Deadlines must be positive numbers of seconds"})
+            return
+
+        if self.queued >= self._confs["max_queue"]:
+            await self.respond(writer, 503, {"error": "Server busy, try again later"})
+            return
+
+        conversation_id = conversation_id or self.core.History.generate_conversation_id()
+
+        writer.write(
+            "HTTP/1.1 200 OK\r\n"
+            "Content-Type: text/event-stream\r\n"
+            "Cache-Control: no-cache\r\n"
+            f"X-Conversation-Id: {conversation_id}\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1")
+        )
+        await self.send_event(writer, "start", {"conversation_id": conversation_id})
+
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+
+        self.active += 1
+        try:
+            await self.stream(writer, prompt, conversation_id, model, deadlines)
+        finally:
+            self.active -= 1
+            self._slots.release()
+
+    async def stream(self, writer, prompt, conversation_id, model=None, deadlines=(None, None)):
+        """
+        Runs a query on a worker thread and forwards its chunks to the client.
+
+        The worker hands each chunk to a bounded asyncio queue and blocks while it is
+        full, so a slow reader holds back its own worker rather than buffering without
+        limit. If the client goes away the worker is told to stop and the remaining
+        chunks are discarded.
+
+        Args:
+            writer (asyncio.StreamWriter): The connection writer.
+            prompt (str): The user prompt.
+            conversation_id (str): The conversation the prompt belongs to.
+            model (str, optional): The model to answer with. Defaults to the default model.
+            deadlines (tuple, optional): The total and first token deadlines in seconds, or None
+                for the configured deadlines.
+        """
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue(self._confs["stream_buffer"])
+        cancelled = Event()
+
+        def produce():
+            generator = self.core.query(prompt, conversation_id, model, *deadlines)
+            try:
+                for chunk in generator:
+                    asyncio.run_coroutine_threadsafe(chunks.put(chunk), loop).result()
+                    if cancelled.is_set():
+                        break
+            except Exception as e:
+                self.core.Metrics.inc("errors")
+                self.core.Helpers.log_message(
+                    self.core.LogFile, "Server Mode", "ERROR", f"Generation error: {str(e)}"
+                )
+            finally:
+                generator.close()
+                asyncio.run_coroutine_threadsafe(chunks.put(_END), loop).result()
+
+        Thread(target=produce, daemon=True).start()
+
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is _END:
+                    break
+                await self.send_event(writer, "message", {"text": chunk})
+            await self.send_event(writer, "done", {"conversation_id": conversation_id})
+        except (asyncio.TimeoutError, ConnectionError):
+            cancelled.set()
+            while chunk is not _END:
+                chunk = await chunks.get()
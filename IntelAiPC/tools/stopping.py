@@ -0,0 +1,262 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Stopping
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Stopping
+# Description:   Stop token, stop sequence and stop string matching for GeniSysAI LLMCore.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+import time
+
+import torch
+
+from transformers import StoppingCriteria
+
+from tools.streamer import TokenDecoder
+
+class StopMatcher:
+    """
+    StopMatcher Class:
+    The compiled stop conditions of a model.
+
+    Stop tokens and multi-token stop sequences are packed into right-aligned tensors so
+    every sequence in a batch is checked with a few tensor comparisons per step. Stop
+    strings are compiled into an Aho-Corasick automaton over bytes, so they are matched
+    however the model happens to tokenize them. The automaton's transition for a state
+    and a whole token is computed once and cached.
+
+    A matcher is compiled once per model and shared; each generation gets its own
+    StopCriteria from criteria().
+    """
+
+    def __init__(self, tokenizer, stop_token_ids=(), stop_sequences=(), stop_strings=()):
+        """
+        Initializes the StopMatcher.
+
+        Args:
+            tokenizer (PreTrainedTokenizer): The model's Hugging Face tokenizer.
+            stop_token_ids (iterable, optional): Token IDs that end generation.
+            stop_sequences (iterable, optional): Lists of token IDs that end generation together.
+            stop_strings (iterable, optional): Text that ends generation.
+        """
+        self.stop_token_ids = torch.tensor(sorted(set(stop_token_ids)), dtype=torch.long)
+
+        # Right-aligned sequences, padded on the left with -1
+        stop_sequences = [list(sequence) for sequence in stop_sequences if sequence]
+        self.stop_sequences = stop_sequences
+        width = max((len(sequence) for sequence in stop_sequences), default=0)
+        self.sequences = torch.full((len(stop_sequences), width), -1, dtype=torch.long)
+        for row, sequence in enumerate(stop_sequences):
+            self.sequences[row, width - len(sequence):] = torch.tensor(sequence)
+        # Distance of each column from the newest token, to ignore prompt tokens
+        self.distances = torch.arange(width, 0, -1)
+
+        self.stop_strings = [text for text in stop_strings if text]
+        self.decoder = TokenDecoder(tokenizer) if self.stop_strings else None
+        self._compile([text.encode("utf-8") for text in self.stop_strings])
+        self._transitions = {}  # (state, token ID) -> (state, matched)
+
+    @property
+    def has_strings(self) -> bool:
+        """
+        bool: Whether any stop strings were compiled.
+        """
+        return bool(self.stop_strings)
+
+    def criteria(self, cancel=None, prompt_length=None, on_step=None):
+        """
+        Returns a stopping criteria for one generation.
+
+        Args:
+            cancel (CancelToken, optional): Stops every sequence once cancelled.
+            prompt_length (int, optional): The number of prompt tokens, padding included.
+                Defaults to all but the last token seen on the first check.
+            on_step (callable, optional): Called with the criteria after every check.
+
+        Returns:
+            StopCriteria: The per-generation matcher state.
+        """
+        return StopCriteria(self, cancel, prompt_length, on_step)
+
+    def advance(self, state: int, token_id: int) -> tuple:
+        """
+        Runs a token's bytes through the stop string automaton.
+
+        Args:
+            state (int): The automaton state before the token.
+            token_id (int): The generated token ID.
+
+        Returns:
+            tuple: The state after the token and whether a stop string ended within it.
+        """
+        key = (state, token_id)
+        result = self._transitions.get(key)
+        if result is None:
+            matched = False
+            for byte in self.decoder.token_bytes(token_id):
+                state = self._step(state, byte)
+                matched = matched or self.accept[state]
+            result = self._transitions[key] = (state, matched)
+        return result
+
+    def _compile(self, patterns):
+        """
+        Builds the Aho-Corasick trie, failure links and accepting states.
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        self.accept = [False]
+        for pattern in patterns:
+            state = 0
+            for byte in pattern:
+                if byte not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.accept.append(False)
+                    self.goto[state][byte] = len(self.goto) - 1
+                state = self.goto[state][byte]
+            self.accept[state] = True
+
+        # Breadth-first, so each state's failure target is final before its children
+        frontier = list(self.goto[0].values())
+        while frontier:
+            following = []
+            for state in frontier:
+                for byte, child in self.goto[state].items():
+                    self.fail[child] = self._step(self.fail[state], byte) if state else 0
+                    self.accept[child] = self.accept[child] or self.accept[self.fail[child]]
+                    following.append(child)
+            frontier = following
+
+    def _step(self, state: int, byte: int) -> int:
+        """
+        Follows one byte from a state, falling back along failure links.
+        """
+        while state and byte not in self.goto[state]:
+            state = self.fail[state]
+        return self.goto[state].get(byte, 0)
+
+class StopCriteria(StoppingCriteria):
+    """
+    StopCriteria Class:
+    Checks the stop conditions of a StopMatcher for every sequence of a batch.
+
+    Returns a boolean per sequence, so Hugging Face generate finishes sequences
+    individually and keeps decoding the rest of the batch. Only generated tokens are
+    considered. Every token added since the last check is scanned, as assisted
+    generation can add several tokens in one step. The number of tokens each sequence
+    had generated up to and including the token that stopped it is kept in
+    stop_lengths, and the time spent in the checks is accumulated in elapsed. A cancel
+    token is checked first on every step, and stops every sequence once it has been
+    cancelled.
+    """
+
+    def __init__(self, matcher: StopMatcher, cancel=None, prompt_length=None, on_step=None):
+        """
+        Initializes the StopCriteria.
+
+        Args:
+            matcher (StopMatcher): The compiled stop conditions.
+            cancel (CancelToken, optional): Stops every sequence once cancelled.
+            prompt_length (int, optional): The number of prompt tokens, padding included.
+                Defaults to all but the last token seen on the first check.
+            on_step (callable, optional): Called with the criteria after every check.
+        """
+        self.matcher = matcher
+        self.cancel = cancel
+        self.prompt_length = prompt_length
+        self.on_step = on_step
+        self.seen = 0  # Tokens already checked
+        self.states = None
+        self.done = None
+        self.stop_lengths = None
+        self.calls = 0
+        self.elapsed = 0.0
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        start = time.perf_counter()
+        matcher = self.matcher
+        batch, length = input_ids.shape
+
+        if self.done is None:
+            if self.prompt_length is None:
+                self.prompt_length = length - 1
+            self.seen = self.prompt_length
+            self.states = [0] * batch
+            self.done = torch.zeros(batch, dtype=torch.bool, device=input_ids.device)
+            self.stop_lengths = [None] * batch
+
+        done = self.done.clone()
+        if self.cancel is not None and self.cancel.check():
+            done[:] = True
+        else:
+            # Where each new token completes a stop condition
+            new_tokens = input_ids[:, self.seen:]
+            hits = torch.zeros(new_tokens.shape, dtype=torch.bool, device=input_ids.device)
+            if matcher.stop_token_ids.numel():
+                hits |= torch.isin(new_tokens, matcher.stop_token_ids.to(input_ids.device))
+
+            width = matcher.sequences.shape[1]
+            if width:
+                sequences = matcher.sequences.to(input_ids.device)
+                distances = matcher.distances.to(input_ids.device)
+                for offset in range(new_tokens.shape[1]):
+                    end = self.seen + offset + 1
+                    if end < width:
+                        continue
+                    tail = input_ids[:, None, end - width:end]
+                    matched = (tail == sequences) & (distances <= end - self.prompt_length)
+                    hits[:, offset] |= (matched | (sequences < 0)).all(dim=-1).any(dim=-1)
+
+            if matcher.has_strings:
+                for row, tokens in enumerate(new_tokens.tolist()):
+                    if self.done[row]:
+                        continue
+                    state = self.states[row]
+                    for offset, token_id in enumerate(tokens):
+                        state, matched = matcher.advance(state, token_id)
+                        if matched:
+                            hits[row, offset] = True
+                            break
+                    self.states[row] = state
+
+            stopped = hits.any(dim=-1) & ~self.done
+            for row in stopped.nonzero().flatten().tolist():
+                first = hits[row].nonzero()[0].item()
+                self.stop_lengths[row] = self.seen + first + 1 - self.prompt_length
+            done |= stopped
+
+        for row in (done & ~self.done).nonzero().flatten().tolist():
+            if self.stop_lengths[row] is None:
+                self.stop_lengths[row] = length - self.prompt_length
+        self.seen = length
+        self.done = done
+        self.calls += 1
+        self.elapsed += time.perf_counter() - start
+        if self.on_step is not None:
+            self.on_step(self)
+        return done.clone()
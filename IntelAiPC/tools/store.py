@@ -0,0 +1,441 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Conversation Store
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Conversation Store
+# Description:   Durable conversation storage for GeniSysAI LLMCore.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+import os
+import time
+import queue
+import atexit
+import sqlite3
+
+from threading import Event, Lock, Thread
+
+from tools.helpers import Helpers
+
+_STOP = object()  # Tells the writer thread to commit and exit
+
+# Seconds to wait before each retry of a batch whose transaction could not be committed
+_RETRY_DELAYS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0)
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS conversations (
+        id TEXT PRIMARY KEY,
+        created REAL NOT NULL,
+        updated REAL NOT NULL,
+        messages INTEGER NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated)",
+    # Messages are never deleted; compaction and clearing mark the messages they remove inactive
+    """CREATE TABLE IF NOT EXISTS messages (
+        conversation_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        active INTEGER NOT NULL,
+        created REAL NOT NULL,
+        PRIMARY KEY (conversation_id, seq)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS messages_active ON messages (conversation_id, position) WHERE active = 1",
+)
+
+def open_store(confs):
+    """
+    Opens the configured conversation store.
+
+    Args:
+        confs (dict): The loaded configuration.
+
+    Returns:
+        ConversationStore: The store, or None if it is disabled.
+    """
+    store_confs = confs["history"]["store"]
+    if not store_confs["enabled"]:
+        return None
+    return ConversationStore(
+        store_confs["path"], store_confs["batch_size"], store_confs["synchronous"], store_confs["busy_timeout"],
+        f"{confs['llm']['logs_path']}llm/"
+    )
+
+class ConversationStore:
+    """
+    ConversationStore Class:
+    Keeps every conversation in an SQLite database in WAL mode.
+
+    Writes are queued and applied by a single writer thread. The thread takes every
+    write waiting in the queue, up to batch_size, and commits them in one transaction,
+    so under load many messages share one commit. Each write runs in its own savepoint,
+    so a write that fails is rolled back and logged without losing the rest of its
+    batch. A batch whose transaction cannot start or commit, such as while another
+    process holds the write lock past busy_timeout, is rolled back and retried with
+    backoff. Readers use their own connection and
+    are not blocked by the writer. Call flush() to wait until earlier writes have
+    been committed. The queue is drained when the process exits.
+
+    Each message is stored with its sequence number in the conversation and the position
+    it takes in the conversation's history. Sequence numbers are assigned in SQL inside
+    the write transaction, so several processes can share the database. Compaction replaces the oldest messages with
+    a summary that takes the position of the last message it replaces. The replaced
+    messages are kept but marked inactive. An index over the active messages by
+    position reads the newest messages of a conversation without scanning it.
+    """
+
+    def __init__(self, path, batch_size=256, synchronous="NORMAL", busy_timeout=5.0, logs_path="logs/llm/"):
+        """
+        Initializes the ConversationStore, creating the database if needed, and starts its writer thread.
+
+        Args:
+            path (str): The database file.
+            batch_size (int, optional): The maximum number of writes committed together. Defaults to 256.
+            synchronous (str, optional): The SQLite synchronous setting. NORMAL commits survive a
+                process crash and FULL commits also survive a power loss. Defaults to "NORMAL".
+            busy_timeout (float, optional): The seconds to wait for another process's write lock.
+                Defaults to 5.0.
+            logs_path (str, optional): The directory write errors are logged to. Defaults to "logs/llm/".
+        """
+        self.Helpers = Helpers()
+        self.LogFile = self.Helpers.set_log_dir(logs_path)
+        self.path = path
+        self.batch_size = batch_size
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        connection = self._connect()
+        connection.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            connection.execute(statement)
+        connection.close()
+
+        self._reader = self._connect(check_same_thread=False)
+        self._read_lock = Lock()
+
+        self.writes = queue.Queue()
+        self.committed = 0
+        self.commits = 0
+        self.errors = 0
+        self._closed = False
+
+        self._thread = Thread(target=self._run, name="ConversationStore", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _connect(self, check_same_thread=True):
+        """
+        Opens a connection to the database with the store's settings.
+        """
+        connection = sqlite3.connect(
+            self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=check_same_thread
+        )
+        connection.execute(f"PRAGMA synchronous={self.synchronous}")
+        connection.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+        return connection
+
+    def append(self, conversation_id: str, role: str, content: str):
+        """
+        Queues a message to be added to the end of a conversation.
+
+        Args:
+            conversation_id (str): The conversation.
+            role (str): The message sender's role.
+            content (str): The message content.
+        """
+        self._queue(("append", conversation_id, role, content, time.time()))
+
+    def compact(self, conversation_id: str, summary: str, replaces: int):
+        """
+        Queues the replacement of a conversation's oldest messages with a summary.
+
+        Args:
+            conversation_id (str): The conversation.
+            summary (str): The summary, stored as a system message.
+            replaces (int): The number of oldest active messages the summary replaces.
+        """
+        self._queue(("compact", conversation_id, summary, replaces, time.time()))
+
+    def clear(self, conversation_id: str):
+        """
+        Queues the removal of every message of a conversation from its history.
+
+        Args:
+            conversation_id (str): The conversation.
+        """
+        self._queue(("clear", conversation_id, time.time()))
+
+    def _queue(self, write):
+        """
+        Queues a write, or counts it as an error once the store is closed.
+        """
+        if self._closed:
+            self.errors += 1
+            return
+        self.writes.put(write)
+
+    def flush(self, timeout=None) -> bool:
+        """
+        Waits until every write queued before the call has been committed.
+
+        Args:
+            timeout (float, optional): The maximum seconds to wait. Defaults to no limit.
+
+        Returns:
+            bool: True if the writes were committed within the timeout.
+        """
+        if self._closed:
+            return True
+        done = Event()
+        self.writes.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """
+        Commits the queued writes and stops the writer thread.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self.writes.put(_STOP)
+        self._thread.join()
+        with self._read_lock:
+            self._reader.close()
+
+    def messages(self, conversation_id: str) -> list:
+        """
+        Returns a conversation's active messages, oldest first.
+
+        Args:
+            conversation_id (str): The conversation.
+
+        Returns:
+            list: (role, content) pairs, empty for an unknown conversation.
+        """
+        with self._read_lock:
+            return self._reader.execute(
+                "SELECT role, content FROM messages WHERE conversation_id = ? AND active = 1 ORDER BY position",
+                (conversation_id,)
+            ).fetchall()
+
+    def last_messages(self, conversation_id: str, count: int) -> list:
+        """
+        Returns a conversation's newest active messages, oldest first.
+
+        Args:
+            conversation_id (str): The conversation.
+            count (int): The number of messages.
+
+        Returns:
+            list: Up to count (role, content) pairs.
+        """
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT role, content FROM messages WHERE conversation_id = ? AND active = 1 "
+                "ORDER BY position DESC LIMIT ?",
+                (conversation_id, count)
+            ).fetchall()
+        rows.reverse()
+        return rows
+
+    def exists(self, conversation_id: str) -> bool:
+        """
+        Returns whether a conversation has been stored.
+
+        Args:
+            conversation_id (str): The conversation.
+
+        Returns:
+            bool: True once any message of the conversation has been committed.
+        """
+        with self._read_lock:
+            return self._reader.execute(
+                "SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone() is not None
+
+    def conversations(self, limit=None) -> list:
+        """
+        Lists the stored conversations, most recently updated first.
+
+        Args:
+            limit (int, optional): The maximum number of conversations. Defaults to all.
+
+        Returns:
+            list: Dicts with the ID, the created and updated times and the number of active messages.
+        """
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT id, created, updated, messages FROM conversations ORDER BY updated DESC LIMIT ?",
+                (-1 if limit is None else limit,)
+            ).fetchall()
+        return [
+            {"id": conversation_id, "created": created, "updated": updated, "messages": messages}
+            for conversation_id, created, updated, messages in rows
+        ]
+
+    def stats(self) -> dict:
+        """
+        Returns the store counters.
+
+        Returns:
+            dict: The committed writes, commits, queued writes and errors.
+        """
+        return {
+            "committed": self.committed,
+            "commits": self.commits,
+            "queued": self.writes.qsize(),
+            "errors": self.errors,
+        }
+
+    def _run(self):
+        """
+        Commits queued writes in batches until stopped.
+        """
+        connection = self._connect()
+        running = True
+        while running:
+            batch = [self.writes.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.writes.get_nowait())
+                except queue.Empty:
+                    break
+
+            writes = [write for write in batch if isinstance(write, tuple)]
+            if writes:
+                self._commit(connection, writes)
+
+            for write in batch:
+                if write is _STOP:
+                    running = False
+                elif isinstance(write, Event):
+                    write.set()
+
+        connection.close()
+
+    def _commit(self, connection, writes):
+        """
+        Applies a batch of writes in one transaction, retrying it while the database is
+        busy. Runs on the writer thread.
+        """
+        for attempt in range(len(_RETRY_DELAYS) + 1):
+            skipped = []
+            try:
+                connection.execute("BEGIN IMMEDIATE")
+                for write in writes:
+                    connection.execute("SAVEPOINT write")
+                    try:
+                        getattr(self, f"_{write[0]}")(connection, *write[1:])
+                    except sqlite3.OperationalError:
+                        raise  # The database is busy or failing, not the write
+                    except sqlite3.Error as e:
+                        connection.execute("ROLLBACK TO write")
+                        skipped.append((write, e))
+                    connection.execute("RELEASE write")
+                connection.execute("COMMIT")
+            except sqlite3.OperationalError as e:
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                if attempt == len(_RETRY_DELAYS):
+                    self.errors += len(writes)
+                    self._log_error(f"Dropped a batch of {len(writes)} writes after {attempt} retries: {e}")
+                    return
+                time.sleep(_RETRY_DELAYS[attempt])
+                continue
+            except Exception as e:
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                self.errors += len(writes)
+                self._log_error(f"Dropped a batch of {len(writes)} writes: {e}")
+                return
+
+            for write, e in skipped:
+                self._log_error(f"Skipped the {write[0]} write of conversation {write[1]}: {e}")
+            self.errors += len(skipped)
+            self.committed += len(writes) - len(skipped)
+            self.commits += 1
+            return
+
+    def _log_error(self, message: str):
+        """
+        Logs a write error. Runs on the writer thread.
+        """
+        self.Helpers.log_message(
+            self.LogFile, "Conversation Store", "ERROR", f"Error writing to {self.path}: {message}"
+        )
+
+    def _append(self, connection, conversation_id, role, content, created):
+        """
+        Adds a message to the end of a conversation. Runs on the writer thread.
+        """
+        # The position of an appended message is its sequence number
+        connection.execute(
+            "INSERT INTO messages SELECT ?, COALESCE(MAX(seq) + 1, 0), COALESCE(MAX(seq) + 1, 0), ?, ?, 1, ? "
+            "FROM messages WHERE conversation_id = ?",
+            (conversation_id, role, content, created, conversation_id)
+        )
+        connection.execute(
+            "INSERT INTO conversations VALUES (?, ?, ?, 1) "
+            "ON CONFLICT (id) DO UPDATE SET updated = excluded.updated, messages = messages + 1",
+            (conversation_id, created, created)
+        )
+
+    def _compact(self, connection, conversation_id, summary, replaces, created):
+        """
+        Replaces a conversation's oldest active messages with a summary. Runs on the writer thread.
+        """
+        replaced = connection.execute(
+            "SELECT seq, position FROM messages WHERE conversation_id = ? AND active = 1 ORDER BY position LIMIT ?",
+            (conversation_id, replaces)
+        ).fetchall()
+        if not replaced:
+            return
+        connection.executemany(
+            "UPDATE messages SET active = 0 WHERE conversation_id = ? AND seq = ?",
+            [(conversation_id, seq) for seq, _ in replaced]
+        )
+        connection.execute(
+            "INSERT INTO messages SELECT ?, COALESCE(MAX(seq) + 1, 0), ?, 'system', ?, 1, ? "
+            "FROM messages WHERE conversation_id = ?",
+            (conversation_id, replaced[-1][1], summary, created, conversation_id)
+        )
+        connection.execute(
+            "UPDATE conversations SET updated = ?, messages = messages + 1 - ? WHERE id = ?",
+            (created, len(replaced), conversation_id)
+        )
+
+    def _clear(self, connection, conversation_id, created):
+        """
+        Marks every message of a conversation inactive. Runs on the writer thread.
+        """
+        connection.execute(
+            "UPDATE messages SET active = 0 WHERE conversation_id = ? AND active = 1", (conversation_id,)
+        )
+        connection.execute(
+            "UPDATE conversations SET updated = ?, messages = 0 WHERE id = ?", (created, conversation_id)
+        )
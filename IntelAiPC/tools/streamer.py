@@ -0,0 +1,255 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Streamer
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Streamer
+# Description:   Incremental detokenizer and text streamer for GeniSysAI LLMCore.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+import time
+import queue
+import codecs
+
+_STOP = object()  # Marks the end of the stream
+_PUNCTUATION = frozenset(".!?,\n")
+
+class TokenDecoder:
+    """
+    TokenDecoder Class:
+    Decodes generated tokens one at a time at the byte level.
+
+    Each token ID is converted to its raw bytes once and cached. The bytes are fed to an
+    incremental UTF-8 decoder, so characters split across tokens are held back until
+    they are complete rather than being emitted as replacement characters. Special tokens
+    decode to nothing.
+    """
+
+    def __init__(self, tokenizer):
+        """
+        Initializes the TokenDecoder.
+
+        Args:
+            tokenizer (PreTrainedTokenizer): The model's Hugging Face tokenizer.
+        """
+        self.tokenizer = tokenizer
+        self.special_ids = set(tokenizer.all_special_ids)
+        self.added = {}
+        for token_id, token in getattr(tokenizer, "added_tokens_decoder", {}).items():
+            # Added tokens marked special, such as Llama 3's header and reserved tokens, are skipped like
+            # decode(skip_special_tokens=True) does
+            if getattr(token, "special", False):
+                self.special_ids.add(token_id)
+            else:
+                self.added[token_id] = token.content
+
+        self.byte_decoder = None
+        decoder = getattr(getattr(tokenizer, "backend_tokenizer", None), "decoder", None)
+        if hasattr(tokenizer, "byte_decoder"):
+            self.byte_decoder = tokenizer.byte_decoder
+        elif type(decoder).__name__ == "ByteLevel":
+            from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
+            self.byte_decoder = {char: byte for byte, char in bytes_to_unicode().items()}
+
+        # SentencePiece vocabularies mark word boundaries with "▁"
+        self.sentencepiece = self.byte_decoder is None and "▁" in "".join(
+            tokenizer.convert_ids_to_tokens(tokenizer.encode("a b", add_special_tokens=False))
+        )
+
+        self._bytes = {}  # Token ID -> raw bytes
+        self._utf8 = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._strip_space = self.sentencepiece  # SentencePiece drops the first word's leading space
+
+    def token_bytes(self, token_id: int) -> bytes:
+        """
+        Returns the raw bytes of a token.
+
+        Args:
+            token_id (int): The token ID.
+
+        Returns:
+            bytes: The token's bytes, empty for special tokens.
+        """
+        cached = self._bytes.get(token_id)
+        if cached is None:
+            cached = self._bytes[token_id] = self._convert(token_id)
+        return cached
+
+    def decode(self, token_id: int) -> str:
+        """
+        Decodes the next token of the stream.
+
+        Args:
+            token_id (int): The token ID.
+
+        Returns:
+            str: The text completed by this token, possibly empty.
+        """
+        text = self._utf8.decode(self.token_bytes(token_id))
+        if self._strip_space and text:
+            self._strip_space = False
+            if text.startswith(" "):
+                text = text[1:]
+        return text
+
+    def finish(self) -> str:
+        """
+        Ends the stream, returning any bytes still held back as replacement characters.
+
+        Returns:
+            str: The remaining text.
+        """
+        return self._utf8.decode(b"", final=True)
+
+    def _convert(self, token_id: int) -> bytes:
+        """
+        Converts a token ID to its raw bytes.
+        """
+        if token_id in self.special_ids:
+            return b""
+        if token_id in self.added:
+            return self.added[token_id].encode("utf-8")
+
+        token = self.tokenizer.convert_ids_to_tokens(token_id)
+        if self.byte_decoder is not None:
+            try:
+                return bytes(self.byte_decoder[char] for char in token)
+            except KeyError:
+                pass
+        elif self.sentencepiece:
+            if len(token) == 6 and token.startswith("<0x") and token.endswith(">"):
+                return bytes([int(token[3:5], 16)])  # Byte fallback token
+            return token.replace("▁", " ").encode("utf-8")
+
+        return self.tokenizer.decode([token_id]).encode("utf-8")
+
+class TokenStreamer:
+    """
+    TokenStreamer Class:
+    Streams generated text to a consumer, decoding every token exactly once.
+
+    Follows the Hugging Face streamer protocol used by the engines: the first put() carries
+    the prompt and is skipped, later calls carry generated tokens and end() closes the
+    stream. Text is handed to the consumer according to the flush policy:
+
+        "token"        Every token that completes some text.
+        "punctuation"  When a token contains punctuation or a newline.
+        "interval"     Only when flush_interval_ms has passed.
+
+    Pending text is always flushed once flush_interval_ms has passed since the last flush.
+    The full response is collected in a list and joined once when read.
+    """
+
+    def __init__(self, tokenizer, flush_policy="punctuation", flush_interval_ms=50, timeout=60.0):
+        """
+        Initializes the TokenStreamer.
+
+        Args:
+            tokenizer (PreTrainedTokenizer): The model's Hugging Face tokenizer.
+            flush_policy (str, optional): "token", "punctuation" or "interval". Defaults to "punctuation".
+            flush_interval_ms (float, optional): The maximum time text is held back. Defaults to 50.
+            timeout (float, optional): The maximum seconds the consumer waits for text. Defaults to 60.
+        """
+        if flush_policy not in ("token", "punctuation", "interval"):
+            raise ValueError(f"Invalid flush policy '{flush_policy}'")
+
+        self.decoder = TokenDecoder(tokenizer)
+        self.flush_policy = flush_policy
+        self.flush_interval = flush_interval_ms / 1000
+        self.timeout = timeout
+
+        self.chunks = queue.Queue()
+        self.parts = []  # Every flushed chunk, joined by the text property
+        self._pending = []
+        self._last_flush = time.perf_counter()
+        self._prompt_seen = False
+        self.first_token_time = None  # When the first generated token arrived
+
+    @property
+    def text(self) -> str:
+        """
+        str: The text streamed so far.
+        """
+        return "".join(self.parts)
+
+    def put(self, value):
+        """
+        Receives the prompt, then each batch of generated tokens.
+
+        Args:
+            value (torch.Tensor): Token IDs, shaped (length,) or (1, length).
+        """
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+
+        if len(value.shape) > 1:
+            value = value[0]
+
+        flush = False
+        for token_id in value.tolist():
+            text = self.decoder.decode(token_id)
+            if text:
+                self._pending.append(text)
+                if self.flush_policy == "token":
+                    flush = True
+                elif self.flush_policy == "punctuation" and not _PUNCTUATION.isdisjoint(text):
+                    flush = True
+
+        if self._pending and (flush or time.perf_counter() - self._last_flush >= self.flush_interval):
+            self._flush()
+
+    def end(self):
+        """
+        Flushes the remaining text and closes the stream.
+        """
+        text = self.decoder.finish()
+        if text:
+            self._pending.append(text)
+        if self._pending:
+            self._flush()
+        self.chunks.put(_STOP)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        chunk = self.chunks.get(timeout=self.timeout)
+        if chunk is _STOP:
+            raise StopIteration
+        return chunk
+
+    def _flush(self):
+        """
+        Hands the pending text to the consumer.
+        """
+        chunk = "".join(self._pending)
+        self._pending.clear()
+        self.parts.append(chunk)
+        self.chunks.put(chunk)
+        self._last_flush = time.perf_counter()
@@ -0,0 +1,296 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Tuner
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Tuner
+# Description:   OpenVINO property tuning and per-host profiles for GeniSysAI LLMCore.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+import gc
+import os
+import json
+import time
+import socket
+
+from datetime import datetime
+
+from tools.benchmark import Benchmark, percentile, time_generation
+from tools.helpers import Helpers
+
+# The "openvino" settings a profile can set, in the order they are tuned
+TUNED_KEYS = (
+    "performance_mode",
+    "num_streams",
+    "num_threads",
+    "inference_precision",
+    "kv_cache_precision",
+    "dynamic_quantization_group_size",
+)
+
+def profile_path(confs) -> str:
+    """
+    Returns the profile file of this host.
+
+    Args:
+        confs (dict): The loaded configuration.
+
+    Returns:
+        str: The path of the host's profile.
+    """
+    return os.path.join(confs["openvino"]["profiles_path"], f"{socket.gethostname()}.json")
+
+def profile_key(confs) -> str:
+    """
+    Returns the key of the configured model, device and engine in a profile.
+
+    Args:
+        confs (dict): The loaded configuration.
+
+    Returns:
+        str: The profile key.
+    """
+    return f"{confs['llm']['model_out']}:{confs['llm']['device']}:{confs['llm']['engine']}"
+
+def load_profile(confs) -> dict:
+    """
+    Returns the tuned "openvino" settings of this host for the configured model and device.
+
+    Args:
+        confs (dict): The loaded configuration.
+
+    Returns:
+        dict: The tuned settings, or an empty dict if the model has not been tuned here.
+    """
+    path = profile_path(confs)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as profile_file:
+        entry = json.load(profile_file).get("profiles", {}).get(profile_key(confs))
+    return {key: value for key, value in (entry or {}).get("openvino", {}).items() if key in TUNED_KEYS}
+
+def save_profile(confs, settings: dict, result: dict):
+    """
+    Stores tuned settings in this host's profile, keeping those of other models and devices.
+
+    Args:
+        confs (dict): The loaded configuration.
+        settings (dict): The tuned "openvino" settings.
+        result (dict): The measurements of the settings.
+    """
+    path = profile_path(confs)
+    profile = {"host": socket.gethostname(), "profiles": {}}
+    if os.path.exists(path):
+        with open(path, "r") as profile_file:
+            profile = json.load(profile_file)
+    profile["profiles"][profile_key(confs)] = {
+        "openvino": settings,
+        "ttft_ms": result["ttft_ms"],
+        "decode_tokens_per_s": result["decode_tokens_per_s"],
+        "tuned": datetime.now().isoformat(),
+    }
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as profile_file:
+        json.dump(profile, profile_file, indent=4)
+    os.replace(temp_path, path)
+
+class Tuner:
+    """
+    Tuner Class:
+    Finds the OpenVINO properties that generate fastest on this host.
+
+    The search space in the "tuning" configuration lists the values to try for each of
+    TUNED_KEYS. A full grid needs a model compile per combination, so the space is
+    searched one setting at a time: starting from the configured settings, each value of
+    a setting is measured with the best values found so far for the others, and the best
+    is kept before moving to the next setting. Candidates that fail to compile, such as
+    a precision the device does not support, are skipped.
+
+    Candidates are ranked by decode tokens per second. A candidate whose time to first
+    token is more than max_ttft_regression times that of the configured settings is
+    rejected, so a faster decode cannot hide a much slower prefill. The winner is written
+    to configuration/profiles/<hostname>.json, which Model applies at startup.
+    """
+
+    def __init__(self, confs):
+        """
+        Initializes the Tuner.
+
+        Args:
+            confs (dict): The loaded configuration.
+        """
+        self._confs = confs
+        self._tuning = confs["tuning"]
+        self.Helpers = Helpers()
+        self.LogFile = self.Helpers.set_log_dir(f"{confs['llm']['logs_path']}llm/")
+        self.Benchmark = Benchmark(None, confs)
+        self.tokenizer = None
+
+    def space(self) -> dict:
+        """
+        Returns the values to try for each setting on the configured device.
+
+        "auto" in num_threads expands to every allowed CPU and to half of them. Thread
+        counts only apply to CPU inference and are not tuned on other devices.
+
+        Returns:
+            dict: Lists of candidate values keyed by setting.
+        """
+        space = {key: list(self._tuning["space"].get(key) or [self._confs["openvino"][key]]) for key in TUNED_KEYS}
+        if "auto" in space["num_threads"]:
+            cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+            space["num_threads"] = sorted(
+                {value for value in space["num_threads"] if value != "auto"} | {cpus, max(1, cpus // 2)},
+                key=lambda value: value or 0
+            )
+        if self._confs["llm"]["device"] != "CPU":
+            space["num_threads"] = [None]
+        return space
+
+    def run(self, output=None) -> dict:
+        """
+        Searches the space, saves the winning settings to this host's profile and writes a report.
+
+        Args:
+            output (str, optional): The JSON report to write. Defaults to a timestamped file in
+                the benchmark output path.
+
+        Returns:
+            dict: The tuning report.
+        """
+        space = self.space()
+        best = {key: self._confs["openvino"][key] for key in TUNED_KEYS}
+        measured = {}  # Settings as JSON -> result
+
+        def evaluate(settings):
+            key = json.dumps(settings, sort_keys=True)
+            if key not in measured:
+                measured[key] = self.measure(settings)
+            return measured[key]
+
+        baseline = evaluate(best)
+        if baseline.get("error"):
+            raise RuntimeError(f"The configured settings failed: {baseline['error']}")
+        ttft_limit = baseline["ttft_ms"] * self._tuning["max_ttft_regression"]
+        best_result = baseline
+
+        for key in TUNED_KEYS:
+            for value in space[key]:
+                candidate = dict(best, **{key: value})
+                result = evaluate(candidate)
+                if result.get("error") or result["ttft_ms"] > ttft_limit:
+                    continue
+                if result["decode_tokens_per_s"] > best_result["decode_tokens_per_s"]:
+                    best, best_result = candidate, result
+
+        save_profile(self._confs, best, best_result)
+        self.Helpers.log_message(
+            self.LogFile, "Tuner", "INFO",
+            f"Saved {best} to {profile_path(self._confs)}: ttft {best_result['ttft_ms']:.1f}ms, "
+            f"decode {best_result['decode_tokens_per_s']:.1f} tokens/s "
+            f"(configured {baseline['ttft_ms']:.1f}ms, {baseline['decode_tokens_per_s']:.1f} tokens/s)"
+        )
+
+        grid = 1
+        for values in space.values():
+            grid *= len(values)
+        report = {
+            "meta": self.Benchmark.metadata(),
+            "profile": profile_path(self._confs),
+            "space": space,
+            "grid_size": grid,
+            "best": best,
+            "best_result": best_result,
+            "baseline_result": baseline,
+            "candidates": [dict(result, settings=json.loads(key)) for key, result in measured.items()],
+        }
+        return self.Benchmark.write_report(report, output, "tune")
+
+    def measure(self, settings: dict) -> dict:
+        """
+        Compiles the model with a candidate's settings and times generation.
+
+        Args:
+            settings (dict): The "openvino" settings to try.
+
+        Returns:
+            dict: The median time to first token and decode tokens per second, or the
+                error that prevented the candidate from running.
+        """
+        # Heavy dependencies are imported here rather than at startup
+        from tools.model import Model
+
+        confs = json.loads(json.dumps(self._confs))
+        confs["openvino"].update(settings)
+        confs["openvino"]["use_profile"] = False
+        confs["speculative"]["mode"] = None
+        confs["kv_cache"]["enabled"] = False
+
+        model = None
+        try:
+            start = time.perf_counter()
+            model = Model(confs)
+            model.load_model_definition()
+            model.load_config()
+            if self.tokenizer is None:
+                model.load_tokenizer()
+                self.tokenizer = model.llm_tokenizer
+            model.llm_tokenizer = self.tokenizer
+            model.load_model()
+            model.compile_model()
+            compile_time = time.perf_counter() - start
+            if model.llm is None:
+                raise RuntimeError(f"Could not load {model.model_path}")
+
+            model.warm_up(confs["warmup"]["prompt"], confs["warmup"]["max_new_tokens"])
+            ttfts, rates = time_generation(
+                model, confs["llm"]["system"], confs["bench"]["prompts"],
+                self._tuning["repeats"], self._tuning["max_new_tokens"]
+            )
+
+            if not ttfts or not rates:
+                raise RuntimeError("Too few tokens were generated to time")
+            result = {
+                "compile_s": compile_time,
+                "ttft_ms": percentile(ttfts, 50) * 1000,
+                "decode_tokens_per_s": percentile(rates, 50),
+            }
+        except Exception as e:
+            result = {"error": str(e)}
+        finally:
+            del model
+            gc.collect()
+
+        self.Helpers.log_message(
+            self.LogFile, "Tuner", "INFO",
+            f"{settings}: " + (
+                f"failed ({result['error']})" if "error" in result else
+                f"ttft {result['ttft_ms']:.1f}ms, decode {result['decode_tokens_per_s']:.1f} tokens/s"
+            )
+        )
+        return result
@@ -0,0 +1,539 @@
+############################################################################################
+#
+# The MIT License (MIT)
+#
+# GeniSysAI LLMCore Workers
+# Copyright (C) CogniTech Systems LTD (CogniTech.systems)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# Title:         GeniSysAI LLMCore Workers
+# Description:   Pool of pinned LLMCore worker processes for GeniSysAI LLMCore.
+# Configuration: configuration/confs.json
+# Last Modified: 2025-01-12
+#
+############################################################################################
+
+import os
+import glob
+import json
+import time
+import queue
+import multiprocessing
+
+from collections import OrderedDict
+from itertools import count
+from threading import Event, Lock, Thread
+
+from tools.helpers import Helpers
+from tools.history import History
+from tools.logsink import get_sink
+from tools.metrics import Metrics
+from tools.registry import ModelRegistry
+from tools.store import open_store
+from tools.tuner import load_profile
+
+def parse_cpulist(text: str) -> list:
+    """
+    Parses a Linux CPU list such as "0-3,8-11".
+
+    Args:
+        text (str): The CPU list.
+
+    Returns:
+        list: The CPU numbers.
+    """
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+def numa_nodes() -> list:
+    """
+    Returns the CPUs of each NUMA node this process may run on.
+
+    Returns:
+        list: A sorted list of CPUs per node. A single node holding every allowed CPU
+            where the topology cannot be read.
+    """
+    allowed = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else set(range(os.cpu_count() or 1))
+    nodes = []
+    for path in sorted(glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")):
+        with open(path, "r") as cpulist:
+            cpus = sorted(set(parse_cpulist(cpulist.read())) & allowed)
+        if cpus:
+            nodes.append(cpus)
+    return nodes or [sorted(allowed)]
+
+def _split(cpus: list, parts: int) -> list:
+    """
+    Splits CPUs into contiguous groups whose sizes differ by at most one.
+    """
+    size, extra = divmod(len(cpus), parts)
+    groups, start = [], 0
+    for index in range(parts):
+        end = start + size + (index < extra)
+        groups.append(cpus[start:end])
+        start = end
+    return groups
+
+def plan_placement(workers: int = None, placement: str = "numa") -> list:
+    """
+    Assigns each worker a disjoint set of CPUs.
+
+    With "numa" placement workers are spread across NUMA nodes and never span one; the
+    workers on a node share its CPUs out between them. With "cores" placement the allowed
+    CPUs are split into contiguous groups regardless of nodes.
+
+    Args:
+        workers (int, optional): The number of workers. Defaults to one per NUMA node.
+        placement (str, optional): "numa" or "cores". Defaults to "numa".
+
+    Returns:
+        list: The CPUs of each worker.
+
+    Raises:
+        ValueError: If the placement is unknown or there are fewer CPUs than workers.
+    """
+    nodes = numa_nodes()
+    workers = workers or len(nodes)
+    if placement == "cores":
+        cpus = sorted(cpu for node in nodes for cpu in node)
+        if workers > len(cpus):
+            raise ValueError(f"Cannot pin {workers} workers to {len(cpus)} CPUs")
+        return _split(cpus, workers)
+    if placement != "numa":
+        raise ValueError(f"Invalid worker placement '{placement}'")
+
+    per_node = [len(range(index, workers, len(nodes))) for index in range(len(nodes))]
+    groups = []
+    for node, node_workers in zip(nodes, per_node):
+        if node_workers > len(node):
+            raise ValueError(f"Cannot pin {node_workers} workers to the {len(node)} CPUs of a NUMA node")
+        groups.append(_split(node, node_workers) if node_workers else [])
+    # Interleave the nodes so worker i sits on node i % len(nodes)
+    return [groups[index % len(nodes)][index // len(nodes)] for index in range(workers)]
+
+def worker_confs(confs: dict, index: int, cpus: list) -> dict:
+    """
+    Returns the configuration of a worker.
+
+    A CPU worker runs one latency stream with a thread per CPU it is pinned to, with any
+    other settings tuned for this host. Each worker keeps its own response cache file, as
+    every cache rewrites its file on start.
+
+    Args:
+        confs (dict): The loaded configuration.
+        index (int): The worker index.
+        cpus (list): The CPUs the worker is pinned to.
+
+    Returns:
+        dict: A copy of the configuration for the worker.
+    """
+    confs = json.loads(json.dumps(confs))
+    if confs["llm"]["device"] == "CPU":
+        # Keep the host's tuned precisions, but not its stream and thread layout
+        if confs["openvino"]["use_profile"]:
+            confs["openvino"].update(load_profile(confs))
+            confs["openvino"]["use_profile"] = False
+        confs["openvino"]["performance_mode"] = "LATENCY"
+        confs["openvino"]["num_streams"] = 1
+        confs["openvino"]["num_threads"] = len(cpus)
+        confs["openvino"]["cpu_pinning"] = True
+    root, ext = os.path.splitext(confs["response_cache"]["path"])
+    confs["response_cache"]["path"] = f"{root}-worker{index}{ext}"
+    return confs
+
+def _serve(index, cpus, confs, requests, events):
+    """
+    Runs a worker process: pins it, loads an LLMCore and answers the queries it is sent.
+
+    Messages from the pool:
+        ("query", request_id, prompt, conversation_id, model)
+        ("cancel", request_id)
+        ("forget", conversation_id)         When the pool stops routing the conversation here.
+        None to exit.
+
+    Messages to the pool:
+        ("ready", index, error)             Once the model has loaded, error is None on success.
+        ("chunk", request_id, text)         For every streamed chunk.
+        ("end", request_id, error)          When a query finishes, error is None on success.
+        ("stats", index, counters)          Every stats_interval seconds.
+    """
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
+    # LLMCore is imported here so the pool itself never imports the model stack
+    from run import LLMCore
+
+    # A reload re-reads configuration/confs.json, which gets the same worker settings
+    core = LLMCore(confs, lambda loaded: worker_confs(loaded, index, cpus))
+    cancelled = {}
+    lock = Lock()
+
+    def run_query(request_id, prompt, conversation_id, model, deadlines):
+        error = None
+        generator = core.query(prompt, conversation_id, model, *deadlines)
+        try:
+            for chunk in generator:
+                events.put(("chunk", request_id, chunk))
+                if cancelled[request_id].is_set():
+                    break
+        except Exception as e:
+            error = str(e)
+        finally:
+            generator.close()
+            with lock:
+                cancelled.pop(request_id, None)
+            events.put(("end", request_id, error))
+
+    def report():
+        try:
+            core.wait_until_ready()
+            events.put(("ready", index, None))
+        except Exception as e:
+            events.put(("ready", index, str(e)))
+        while True:
+            events.put(("stats", index, core.Metrics.snapshot()["counters"]))
+            time.sleep(confs["workers"]["stats_interval"])
+
+    Thread(target=report, daemon=True).start()
+
+    try:
+        while True:
+            message = requests.get()
+            if message is None:
+                break
+            if message[0] == "query":
+                with lock:
+                    cancelled[message[1]] = Event()
+                Thread(target=run_query, args=message[1:], daemon=True).start()
+            elif message[0] == "cancel":
+                with lock:
+                    flag = cancelled.get(message[1])
+                if flag is not None:
+                    flag.set()
+            elif message[0] == "forget":
+                core.forget(message[1])
+    except KeyboardInterrupt:
+        pass
+
+class _Worker:
+    """
+    The pool's view of a worker process.
+    """
+
+    def __init__(self, index, cpus):
+        self.index = index
+        self.cpus = cpus
+        self.process = None
+        self.requests = None
+        self.ready = Event()
+        self.load_error = None
+        self.active = 0  # Queries dispatched and not yet finished
+        self.counters = {}
+        self.tokens_per_second = 0.0
+        self._last_stats = None  # (monotonic time, tokens_out) of the previous stats
+
+class WorkerPool:
+    """
+    WorkerPool Class:
+    Serves queries from several LLMCore worker processes, each pinned to its own CPUs.
+
+    A single LLMCore runs one generation at a time on one inference stream, which leaves
+    most cores of a large CPU idle under concurrent load. The pool starts one process per
+    CPU set from plan_placement, each with its own compiled model using exactly the
+    threads of the CPUs it is pinned to. OpenVINO memory maps the model weights when it
+    reads them, so the workers share the weight file's pages rather than each reading a
+    copy. Processes are spawned rather than forked, as OpenVINO's thread pools do not
+    survive a fork.
+
+    Queries are sent to the workers over multiprocessing queues. A conversation stays on
+    the worker that answered its first prompt, so its history and attention state are
+    reused; new conversations go to the least busy worker. When a conversation's
+    assignment is evicted, its worker is told to forget it, so a later assignment to any
+    worker rebuilds it from the store. Workers report their counters
+    every stats_interval seconds, from which the aggregate tokens per second is computed.
+
+    The pool exposes the interface Server relies on (query, has_model, History, Metrics,
+    Helpers and LogFile) so it can be served in place of an LLMCore.
+    """
+
+    def __init__(self, confs, workers=None):
+        """
+        Initializes the WorkerPool and starts the worker processes.
+
+        Args:
+            confs (dict): The loaded configuration.
+            workers (int, optional): The number of workers, overriding workers.count.
+        """
+        self.Helpers = Helpers()
+        self._confs = confs
+        self._workers_confs = confs["workers"]
+
+        get_sink(**confs["logging"])
+        self.LogFile = self.Helpers.set_log_dir(f"{confs['llm']['logs_path']}llm/")
+        self.History = History(logs_path=f"{confs['llm']['logs_path']}chat/", store=open_store(confs))
+        self.Metrics = Metrics(confs["metrics"]["enabled"], confs["metrics"]["buckets"])
+
+        self.default_model = os.path.splitext(os.path.basename(confs["llm"]["model_definition_json"]))[0]
+        self.models = {self.default_model} | set(ModelRegistry(confs, self.default_model).names())
+
+        self.affinity = OrderedDict()  # Conversation ID -> worker, least recently used first
+        self._streams = {}  # Request ID -> local queue of chunks
+        self._request_ids = count()
+        self._lock = Lock()
+
+        context = multiprocessing.get_context("spawn")
+        self.events = context.Queue()
+        self.workers = [
+            _Worker(index, cpus)
+            for index, cpus in enumerate(plan_placement(workers or self._workers_confs["count"],
+                                                        self._workers_confs["placement"]))
+        ]
+        Thread(target=self._dispatch, name="WorkerPool", daemon=True).start()
+        for worker in self.workers:
+            worker.requests = context.Queue()
+            worker.process = context.Process(
+                target=_serve, name=f"LLMCore-{worker.index}", daemon=True,
+                args=(worker.index, worker.cpus, worker_confs(confs, worker.index, worker.cpus),
+                      worker.requests, self.events)
+            )
+            worker.process.start()
+            self.Helpers.log_message(
+                self.LogFile, "Workers", "INFO",
+                f"Started worker {worker.index} (pid {worker.process.pid}) on CPUs {worker.cpus}"
+            )
+
+        self.Metrics.gauge("workers_ready", lambda: sum(
+            worker.ready.is_set() and worker.load_error is None for worker in self.workers
+        ))
+        self.Metrics.gauge("tokens_out", lambda: sum(
+            worker.counters.get("tokens_out", 0) for worker in self.workers
+        ))
+        self.Metrics.gauge("tokens_per_second", self.tokens_per_second)
+
+    def wait_until_ready(self, timeout=None):
+        """
+        Blocks until every worker has loaded its model.
+
+        Args:
+            timeout (float, optional): The maximum number of seconds to wait. Defaults to
+                workers.start_timeout.
+
+        Raises:
+            RuntimeError: If a worker failed to load or did not load within the timeout.
+        """
+        deadline = time.monotonic() + (timeout or self._workers_confs["start_timeout"])
+        for worker in self.workers:
+            self._wait_for(worker, deadline - time.monotonic())
+
+    def has_model(self, name):
+        """
+        Returns whether requests can be routed to a model.
+
+        Args:
+            name (str): The model name, the file name of its definition without ".json".
+
+        Returns:
+            bool: True for every model the workers serve.
+        """
+        return name in self.models
+
+    def query(self, prompt, conversation_id=None, model=None, deadline=None, first_token_deadline=None):
+        """
+        Streams the response to a prompt from the worker holding the conversation.
+
+        Args:
+            prompt (str): The user prompt.
+            conversation_id (str, optional): The conversation to continue. Defaults to a
+                new conversation.
+            model (str, optional): The model to answer with. Defaults to the default model.
+            deadline (float, optional): The seconds the response may take. Defaults to the
+                "deadlines" configuration.
+            first_token_deadline (float, optional): The seconds the response may wait for its
+                first token. Defaults to the "deadlines" configuration.
+
+        Raises:
+            ValueError: If there is no such model.
+            RuntimeError: If the worker failed to load or failed to answer.
+        """
+        if model is not None and not self.has_model(model):
+            raise ValueError(f"Unknown model '{model}'")
+        conversation_id = conversation_id or self.History.generate_conversation_id()
+
+        trace = self.Metrics.trace("query")
+        self.Metrics.inc("queries")
+        worker = self.assign(conversation_id)
+        request_id = next(self._request_ids)
+        chunks = queue.Queue()
+        with self._lock:
+            self._streams[request_id] = chunks
+            worker.active += 1
+        finished = False
+        try:
+            with trace.span("worker_ready"):
+                self._wait_for(worker, self._workers_confs["start_timeout"])
+            worker.requests.put((
+                "query", request_id, prompt, conversation_id, model, (deadline, first_token_deadline)
+            ))
+            while True:
+                try:
+                    kind, value = chunks.get(timeout=1)
+                except queue.Empty:
+                    if not worker.process.is_alive():
+                        self.Metrics.inc("errors")
+                        raise RuntimeError(f"Worker {worker.index} exited with code {worker.process.exitcode}")
+                    continue
+                if kind == "end":
+                    finished = True
+                    if value is not None:
+                        self.Metrics.inc("errors")
+                        raise RuntimeError(f"Worker {worker.index} failed: {value}")
+                    break
+                yield value
+        finally:
+            if not finished and worker.process.is_alive():
+                worker.requests.put(("cancel", request_id))
+            with self._lock:
+                self._streams.pop(request_id, None)
+                worker.active -= 1
+            trace.finish()
+
+    def assign(self, conversation_id) -> _Worker:
+        """
+        Returns the worker a conversation runs on, assigning new conversations to the
+        least busy worker.
+
+        Args:
+            conversation_id (str): The conversation.
+
+        Returns:
+            _Worker: The worker.
+        """
+        with self._lock:
+            worker = self.affinity.get(conversation_id)
+            if worker is not None:
+                self.affinity.move_to_end(conversation_id)
+                return worker
+            worker = min(self.workers, key=lambda worker: (worker.active, worker.index))
+            self.affinity[conversation_id] = worker
+            if len(self.affinity) > self._workers_confs["affinity_entries"]:
+                # The conversation may be assigned elsewhere next time, so the copy kept
+                # by this worker must not outlive the assignment
+                evicted, owner = self.affinity.popitem(last=False)
+                owner.requests.put(("forget", evicted))
+            return worker
+
+    def tokens_per_second(self) -> float:
+        """
+        Returns the generation rate of all workers together, as of their last reports.
+
+        Returns:
+            float: Generated tokens per second.
+        """
+        return sum(worker.tokens_per_second for worker in self.workers)
+
+    def stats(self) -> dict:
+        """
+        Returns the state of each worker and the aggregate generation rate.
+
+        Returns:
+            dict: The workers' CPUs, process IDs, readiness, active queries and counters.
+        """
+        return {
+            "tokens_per_second": self.tokens_per_second(),
+            "workers": [
+                {
+                    "index": worker.index,
+                    "pid": worker.process.pid,
+                    "cpus": worker.cpus,
+                    "ready": worker.ready.is_set() and worker.load_error is None,
+                    "active": worker.active,
+                    "tokens_per_second": worker.tokens_per_second,
+                    "counters": dict(worker.counters),
+                }
+                for worker in self.workers
+            ],
+        }
+
+    def close(self, timeout=30):
+        """
+        Asks every worker to exit, terminating those that do not within the timeout.
+
+        Args:
+            timeout (float, optional): Seconds to wait for each worker. Defaults to 30.
+        """
+        for worker in self.workers:
+            if worker.process.is_alive():
+                worker.requests.put(None)
+        for worker in self.workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+    def _wait_for(self, worker, timeout):
+        """
+        Blocks until a worker has loaded its model, or fails as soon as its process exits.
+        """
+        deadline = time.monotonic() + max(timeout, 0)
+        while not worker.ready.wait(min(max(deadline - time.monotonic(), 0), 1)):
+            if not worker.process.is_alive():
+                # The ready message may have been dispatched just before the exit
+                if worker.ready.is_set():
+                    break
+                raise RuntimeError(
+                    f"Worker {worker.index} exited with code {worker.process.exitcode} before it loaded"
+                )
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"Timed out waiting for worker {worker.index} to load")
+        if worker.load_error is not None:
+            raise RuntimeError(f"Worker {worker.index} failed to load: {worker.load_error}")
+
+    def _dispatch(self):
+        """
+        Routes the messages of every worker to the queries and state they belong to.
+        """
+        while True:
+            kind, key, value = self.events.get()
+            if kind == "chunk" or kind == "end":
+                with self._lock:
+                    chunks = self._streams.get(key)
+                if chunks is not None:
+                    chunks.put((kind, value))
+            elif kind == "stats":
+                worker = self.workers[key]
+                now, tokens = time.monotonic(), value.get("tokens_out", 0)
+                if worker._last_stats is not None:
+                    elapsed = now - worker._last_stats[0]
+                    if elapsed > 0:
+                        worker.tokens_per_second = (tokens - worker._last_stats[1]) / elapsed
+                worker._last_stats = (now, tokens)
+                worker.counters = value
+            elif kind == "ready":
+                worker = self.workers[key]
+                worker.load_error = value
+                worker.ready.set()
+                self.Helpers.log_message(
+                    self.LogFile, "Workers", "ERROR" if value else "INFO",
+                    f"Worker {key} failed to load: {value}" if value else f"Worker {key} ready"
+                )